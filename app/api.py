@@ -1,4 +1,5 @@
-import tempfile, os, shutil
+import os, shutil, json
+from contextlib import aclosing
 
 from fastapi import APIRouter, UploadFile, File, HTTPException, Form
 from typing import List
@@ -15,28 +16,29 @@ from app.report.assembler import assemble_pdf
 from app.report.extractor import (
     load_docling_document,
     extract_exact_section,
-    extract_docx_sections,
-    summarize_text
+    asummarize_text
 )
 from app.report.table_extractor import extract_pdf_tables, extract_docx_tables
 from app.report.figure_extractor import extract_pdf_figures
 from app.report.planner import plan_report_sections, REPORT_PLAN_SCHEMA, validate_and_normalize_plan
 from app.report.heading_extractor import extract_markdown_headings
 
-from app.rag.retriever import retrieve
+from app.rag.retriever import embed_query, retrieve
+from app.rag import answer_cache
 from app.rag.prompt import build_prompt, build_report_planner_prompt
-from app.rag.llm import call_llm, call_llm_function
-from app.rag.utils import chunk_text, hash_text
-from app.rag.ingest import ingest_chunks
-from app.rag.loaders.pdf_loader import extract_pdf_sections
-from app.rag.loaders.docx_loader import extract_docx_text
-from app.rag.loaders.excel_loader import extract_excel_text
+from app.rag.context import pack_context
+from app.rag.llm import acall_llm, acall_llm_function, astream_llm
+from app.rag.stream_parser import AnswerStreamParser
+from app.rag.scheduler import get_scheduler
+from app.rag.jobs import create_job, get_job, run_job, submit_job
+from app.rag.store import delete_source
 
 from app.memory.session_store import set_session_value, get_session_value
 from app.memory.store import add_turn, get_memory
 from app.storage.file_resolver import get_uploaded_pdf
 from app.memory.utils import build_memory_aware_query, UPLOAD_DIR
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 
 from app.report.executor import execute_plan
 from app.report.assembler import assemble_pdf
@@ -86,8 +88,32 @@ def build_reference_link(location: str | None):
     return None
 
 
-@router.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest):
+def build_retrieval_filters(req: ChatRequest, session_id: str) -> dict | None:
+    sources = list(req.sources or [])
+    if req.active_document_only:
+        active = get_session_value(session_id, "active_pdf")
+        if active:
+            sources.append(active)
+
+    page_range = None
+    if req.page_from is not None or req.page_to is not None:
+        page_range = (req.page_from, req.page_to)
+
+    filters = {
+        "sources": sources,
+        "section_prefix": req.section_prefix,
+        "page_range": page_range,
+        "location_prefix": req.location_prefix,
+    }
+    filters = {k: v for k, v in filters.items() if v}
+    return filters or None
+
+
+def prepare_chat(req: ChatRequest) -> dict:
+    """
+    Memory-aware retrieval, context packing and prompt for a chat
+    request. "prompt" is None when there is nothing to answer from.
+    """
     # -----------------------------
     # 1. Resolve session + memory
     # -----------------------------
@@ -97,36 +123,134 @@ def chat(req: ChatRequest):
     memory_query = build_memory_aware_query(req.query, memory)
     query_for_retrieval = memory_query.strip() or req.query
 
+    prepared = {
+        "session_id": session_id,
+        "query_for_retrieval": query_for_retrieval,
+        "prompt": None,
+        "chunk_map": {},
+        "context_tokens": 0,
+        "generation": None,
+    }
+
     # -----------------------------
     # 2. Retrieve chunks (no gating)
     # -----------------------------
-    chunks = retrieve(query_for_retrieval)
+    # The answer cache is keyed on the snapshot actually searched,
+    # not whatever snapshot is current once the LLM is called
+    chunks, prepared["generation"] = retrieve(
+        query_for_retrieval,
+        filters=build_retrieval_filters(req, session_id),
+        return_generation=True,
+    )
 
     if not chunks:
-        add_turn(session_id, "user", req.query)
-        return refusal_response()
+        return prepared
 
     # -----------------------------
-    # 3. Build chunk lookup
+    # 3. Pack context within the token budget + chunk lookup
     # -----------------------------
-    chunk_map = {}
     for i, c in enumerate(chunks):
-        cid = c.get("chunk_id") or f'{c["source"]}_p{c.get("page")}_c{i}'
-        c["chunk_id"] = cid
-        chunk_map[cid] = c
+        c["chunk_id"] = c.get("chunk_id") or f'{c["source"]}_p{c.get("page")}_c{i}'
+
+    context, packed, context_tokens = pack_context(chunks)
+    print("CONTEXT:", len(packed), "of", len(chunks), "chunks,", context_tokens, "tokens")
+
+    if not packed:
+        return prepared
 
     # -----------------------------
     # 4. Build prompt
     # -----------------------------
-    context = "\n\n".join(
-        f"[{c['chunk_id']}]\n{c['text']}" for c in chunks
+    prepared.update(
+        prompt=build_prompt(context, req.query),
+        chunk_map={c["chunk_id"]: c for c in packed},
+        context_tokens=context_tokens,
     )
-    prompt = build_prompt(context, req.query)
+    return prepared
+
+
+def normalize_answers(answers) -> list | None:
+    if isinstance(answers, str):
+        return [{"sentence": answers, "chunk_ids": []}]
+    if isinstance(answers, dict):
+        return [answers]
+    if isinstance(answers, list) and answers and isinstance(answers[0], str):
+        return [{"sentence": a, "chunk_ids": []} for a in answers]
+    if not isinstance(answers, list):
+        return None
+    return answers
+
+
+def is_dont_know(answer: dict) -> bool:
+    return answer["text"].lower().startswith("i don't know")
+
+
+def resolve_answer(item, chunk_map: dict) -> dict | None:
+    """
+    One LLM answer item -> response answer with its cited document,
+    page and link. None when the item is empty or cites no known chunk.
+    """
+    if not isinstance(item, dict):
+        return None
+
+    sentence = str(item.get("sentence") or "").strip()
+    chunk_ids = item.get("chunk_ids") or []
+
+    # "I don't know" is returned as-is, without a reference
+    if sentence.lower().startswith("i don't know"):
+        return {"text": sentence, "document": None, "page": None, "link": None}
+
+    if not sentence or not chunk_ids or not isinstance(chunk_ids, list):
+        return None
+
+    c = chunk_map.get(chunk_ids[0])
+    if not c:
+        return None
+
+    return {
+        "text": sentence,
+        "document": c["source"],
+        "page": c.get("page"),
+        "link": build_reference_link(c.get("location"))
+    }
+
+
+async def _answer_cache_embedding(prepared: dict):
+    """
+    Query embedding for near-duplicate answer cache lookups, or
+    None when the cache only matches exact questions.
+    """
+    if not answer_cache.uses_embeddings():
+        return None
+    return await run_in_threadpool(embed_query, prepared["query_for_retrieval"])
+
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat(req: ChatRequest):
+    # -----------------------------
+    # 1-4. Retrieve, pack context, build prompt
+    # -----------------------------
+    prepared = await run_in_threadpool(prepare_chat, req)
+    session_id = prepared["session_id"]
+    chunk_map = prepared["chunk_map"]
+
+    if prepared["prompt"] is None:
+        add_turn(session_id, "user", req.query)
+        return refusal_response()
 
     # -----------------------------
-    # 5. Call LLM
+    # 5. Call LLM (or reuse the answer for this exact context)
     # -----------------------------
-    llm_output = call_llm(prompt)
+    generation = prepared["generation"]
+    q_emb = await _answer_cache_embedding(prepared)
+    llm_output = answer_cache.get_answer(req.query, chunk_map, generation, q_emb)
+
+    if llm_output is None:
+        llm_output = await acall_llm(prepared["prompt"], session_id=session_id)
+        answer_cache.put_answer(req.query, chunk_map, generation, llm_output, q_emb)
+    else:
+        print("ANSWER CACHE HIT:", req.query)
+
     answers = llm_output.get("answer")
 
     if not answers:
@@ -135,13 +259,8 @@ def chat(req: ChatRequest):
     # -----------------------------
     # 6. Normalize LLM output ONCE
     # -----------------------------
-    if isinstance(answers, str):
-        answers = [{"sentence": answers, "chunk_ids": []}]
-    elif isinstance(answers, dict):
-        answers = [answers]
-    elif isinstance(answers, list) and answers and isinstance(answers[0], str):
-        answers = [{"sentence": a, "chunk_ids": []} for a in answers]
-    elif not isinstance(answers, list):
+    answers = normalize_answers(answers)
+    if answers is None:
         return refusal_response()
 
     # -----------------------------
@@ -150,33 +269,15 @@ def chat(req: ChatRequest):
     answer_chunks = []
 
     for item in answers:
-        sentence = item.get("sentence", "").strip()
-        chunk_ids = item.get("chunk_ids", [])
-
-        # If LLM says "I don't know", return it directly
-        if sentence.lower().startswith("i don't know"):
-            return {
-                "answer": [{
-                    "text": sentence,
-                    "document": None,
-                    "page": None,
-                    "link": None
-                }]
-            }
-
-        if not sentence or not chunk_ids:
+        answer = resolve_answer(item, chunk_map)
+        if answer is None:
             continue
 
-        c = chunk_map.get(chunk_ids[0])
-        if not c:
-            continue
+        # If LLM says "I don't know", return it directly
+        if is_dont_know(answer):
+            return {"answer": [answer]}
 
-        answer_chunks.append({
-            "text": sentence,
-            "document": c["source"],
-            "page": c.get("page"),
-            "link": build_reference_link(c.get("location"))
-        })
+        answer_chunks.append(answer)
 
     if not answer_chunks:
         return refusal_response()
@@ -190,7 +291,117 @@ def chat(req: ChatRequest):
     # -----------------------------
     # 9. Return
     # -----------------------------
-    return {"answer": answer_chunks}
+    return {"answer": answer_chunks, "context_tokens": prepared["context_tokens"]}
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """
+    /chat as server-sent events: every answer sentence is sent as an
+    "answer" event (same fields as in /chat) as soon as the LLM has
+    finished writing it, followed by one "done" event.
+    """
+    prepared = await run_in_threadpool(prepare_chat, req)
+
+    async def events():
+        session_id = prepared["session_id"]
+        chunk_map = prepared["chunk_map"]
+        answer_chunks = []
+
+        def refusal_events():
+            answer = refusal_response()["answer"][0]
+            return [
+                sse_event("answer", answer),
+                sse_event("done", {"context_tokens": prepared["context_tokens"]}),
+            ]
+
+        if prepared["prompt"] is None:
+            add_turn(session_id, "user", req.query)
+            for event in refusal_events():
+                yield event
+            return
+
+        generation = prepared["generation"]
+        q_emb = await _answer_cache_embedding(prepared)
+        llm_output = answer_cache.get_answer(req.query, chunk_map, generation, q_emb)
+
+        if llm_output is not None:
+            print("ANSWER CACHE HIT:", req.query)
+            items = normalize_answers(llm_output.get("answer")) or []
+        else:
+            items = None
+
+        # -----------------------------
+        # Stream the LLM, emitting each validated answer item
+        # -----------------------------
+        parser = AnswerStreamParser()
+        stopped = False
+
+        async def stream_items():
+            if items is not None:
+                for item in items:
+                    yield item
+                return
+            try:
+                # aclosing: leaving early returns the scheduler slot right away
+                async with aclosing(astream_llm(prepared["prompt"], session_id=session_id)) as pieces:
+                    async for piece in pieces:
+                        for item in parser.feed(piece):
+                            yield item
+            except Exception as e:
+                print("STREAM ERROR:", e)
+
+        async with aclosing(stream_items()) as items_stream:
+            async for item in items_stream:
+                answer = resolve_answer(item, chunk_map)
+                if answer is None:
+                    continue
+
+                if is_dont_know(answer):
+                    # Mirrors /chat: an "I don't know" ends the answer
+                    if not answer_chunks:
+                        answer_chunks.append(answer)
+                        yield sse_event("answer", answer)
+                    stopped = True
+                    break
+
+                answer_chunks.append(answer)
+                yield sse_event("answer", answer)
+
+        if items is None and not stopped:
+            # The answer was not an item list (e.g. a plain string)
+            llm_output = parser.result()
+            if llm_output is not None and not answer_chunks:
+                for item in normalize_answers(llm_output.get("answer")) or []:
+                    answer = resolve_answer(item, chunk_map)
+                    if answer is not None:
+                        answer_chunks.append(answer)
+                        yield sse_event("answer", answer)
+                        if is_dont_know(answer):
+                            break
+            if llm_output is not None:
+                answer_cache.put_answer(req.query, chunk_map, generation, llm_output, q_emb)
+
+        if not answer_chunks:
+            for event in refusal_events():
+                yield event
+            return
+
+        if not is_dont_know(answer_chunks[0]):
+            add_turn(session_id, "user", req.query)
+            add_turn(session_id, "assistant", " ".join(a["text"] for a in answer_chunks))
+
+        yield sse_event("done", {"context_tokens": prepared["context_tokens"]})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/health")
@@ -198,152 +409,87 @@ def health():
     return {"status": "ok"}
 
 
+@router.get("/llm/stats")
+def llm_stats():
+    """
+    LLM scheduler slots, queue depth per priority class and wait times.
+    """
+    return get_scheduler().stats()
+
+
 @router.post("/ingest")
 async def ingest(
     session_id: str = Form(...),
-    files: List[UploadFile] = File(...)
+    files: List[UploadFile] = File(...),
+    batch: bool = Form(True),
+    wait: bool = Form(False),
+    replace: bool = Form(True),
 ):
-    results = []
-
-
-    # Ensure upload directory exists
+    """
+    Saves the uploads and queues an ingestion job.
+    Returns the job id right away; poll GET /ingest/jobs/{job_id}.
+    With wait=true the job runs inside the request instead.
+    With replace=true (default) a re-uploaded file replaces its
+    previously ingested version.
+    """
+    saved = []
 
     for file in files:
         filename = file.filename
-        name = filename.lower()
 
         # Final, absolute path to saved file
         saved_path = UPLOAD_DIR / filename
 
-        try:
-            # --------------------------------------------------
-            # 1️⃣ Save RAW file permanently (single source of truth)
-            # --------------------------------------------------
-            with saved_path.open("wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            print("Saved file to:", saved_path.resolve())
-            print("Exists after write:", saved_path.exists())
-
-
-            # Reset file pointer (important if reused)
-            await file.seek(0)
-
-            # --------------------------------------------------
-            # 2️⃣ Create temp file ONLY for parsing
-            # --------------------------------------------------
-            with tempfile.NamedTemporaryFile(delete=False) as tmp:
-                shutil.copyfileobj(file.file, tmp)
-                tmp_path = tmp.name
-
-            # --------------------------------------------------
-            # 3️⃣ INGEST FROM TEMP FILE (unchanged logic)
-            # --------------------------------------------------
-            if name.endswith(".pdf"):
-                chunks_with_meta = extract_pdf_sections(
-                    file_path=tmp_path,
-                    source_name=filename
-                )
-                print("PDF EXTRACT RESULT TYPE:", type(chunks_with_meta))
-                print("PDF EXTRACT COUNT:", len(chunks_with_meta))
-                if chunks_with_meta:
-                    print("FIRST EXTRACT SAMPLE:", chunks_with_meta[0].get("text", "")[:300])              
-
-                if not chunks_with_meta:
-                    raise HTTPException(400, "No extractable text found in PDF")
-
-                for c in chunks_with_meta:
-                    c["location"] = f"http://api:8000/files/{filename}"
-
-                count = ingest_chunks(chunks_with_meta)
-                print("CHUNKS BEFORE INGEST:", len(chunks_with_meta))
-                print("INGESTED CHUNKS:", count)
-                print("SOURCE:", filename)
-
-                # ✅ Set active PDF for this session
-                set_session_value(session_id, "active_pdf", filename)
-                set_session_value(session_id, "active_doc_type", "pdf")
-
-                # ✅ Invalidate cached section list
-                set_session_value(session_id, "available_sections", None) 
-
-                set_session_value(
-                    session_id=session_id,
-                    key="active_pdf",
-                    value=filename
-                )
-                results.append({
-                    "filename": filename,
-                    "status": "ingested",
-                    "chunks_created": count
-                })
-                continue
-
-            pages = []
-
-            if name.endswith(".txt"):
-                with open(tmp_path, "r", encoding="utf-8") as f:
-                    pages = [{"text": f.read(), "page": None}]
-
-            elif name.endswith(".docx"):
-                pages = extract_docx_text(tmp_path)
-                sections = extract_docx_sections(tmp_path)
+        # --------------------------------------------------
+        # 1️⃣ Save RAW file permanently (single source of truth)
+        # --------------------------------------------------
+        with saved_path.open("wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+        print("Saved file to:", saved_path.resolve())
+
+        saved.append({"filename": filename, "path": saved_path})
+
+    # --------------------------------------------------
+    # 2️⃣ Queue extraction + embedding + commit
+    # --------------------------------------------------
+    job_id = create_job(session_id, saved, batch=batch, replace=replace)
+
+    if wait:
+        job = await run_in_threadpool(run_job, job_id)
+        return {
+            "message": "Batch ingestion finished",
+            "job_id": job_id,
+            "status": job["status"],
+            "error": job["error"],
+            "files": job["files"],
+        }
+
+    submit_job(job_id)
+    return {
+        "message": "Ingestion queued",
+        "job_id": job_id,
+        "status": "queued",
+    }
 
-                set_session_value(session_id, "active_pdf", filename)
-                set_session_value(session_id, "docx_sections", sections)
-                set_session_value(session_id, "active_doc_type", "docx")
 
-            elif name.endswith(".xlsx"):
-                pages = extract_excel_text(tmp_path)
+@router.get("/ingest/jobs/{job_id}")
+def get_ingest_job(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
-            else:
-                results.append({
-                    "filename": filename,
-                    "status": "skipped",
-                    "reason": "Unsupported file type"
-                })
-                continue
 
-            chunks_with_meta = []
-            for p in pages:
-                for c_idx, ch in enumerate(chunk_text(p["text"])):
-                    chunks_with_meta.append({
-                        "chunk_id": f"{filename}_p{p.get('page')}_c{c_idx}",
-                        "chunk_hash": hash_text(
-                            f"{filename}|{p.get('page')}|{ch}"
-                        ),
-                        "text": ch,
-                        "source": filename,
-                        "page": p.get("page"),
-                        "location": f"http://api:8000/files/{filename}"
-                    })
-
-            count = ingest_chunks(chunks_with_meta)
-
-            results.append({
-                "filename": filename,
-                "status": "ingested",
-                "chunks_created": count
-            })
-
-        except Exception as e:
-            results.append({
-                "filename": filename,
-                "status": "failed",
-                "error": str(e)
-            })
-
-        finally:
-            if "tmp_path" in locals() and os.path.exists(tmp_path):
-                os.remove(tmp_path)
-
-    return {
-        "message": "Batch ingestion completed",
-        "files": results
-    }
+@router.delete("/documents/{source}")
+def delete_document(source: str):
+    deleted = delete_source(source)
+    if deleted == 0:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"source": source, "chunks_deleted": deleted}
 
 
 @router.post("/report", response_model=ReportResponse)
-def generate_report(req: ReportRequest):
+async def generate_report(req: ReportRequest):
 
     # -----------------------------
     # 1. Resolve report plan
@@ -370,7 +516,7 @@ def generate_report(req: ReportRequest):
             raise HTTPException(400, "No PDF uploaded in this session")
 
         pdf_path = get_uploaded_pdf(filename)
-        doc = load_docling_document(pdf_path)
+        doc = await run_in_threadpool(load_docling_document, pdf_path)
 
     elif doc_type == "docx":
         docx_sections = get_session_value(req.session_id, "docx_sections")
@@ -395,7 +541,7 @@ def generate_report(req: ReportRequest):
         if section.action == "extract_exact":
 
             if doc_type == "pdf":
-                content = extract_exact_section(doc, section.name)
+                content = await run_in_threadpool(extract_exact_section, doc, section.name)
 
             elif doc_type == "docx":
                 docx_sections = get_session_value(req.session_id, "docx_sections") or {}
@@ -409,11 +555,11 @@ def generate_report(req: ReportRequest):
         # -------- TABLES (PDF ONLY) --------
         elif section.action == "extract_tables":
             if doc_type == "pdf":
-                tables = extract_pdf_tables(doc)
+                tables = await run_in_threadpool(extract_pdf_tables, doc)
 
             elif doc_type == "docx":
                 docx_path = get_session_value(req.session_id, "active_docx")
-                tables = extract_docx_tables(docx_path)
+                tables = await run_in_threadpool(extract_docx_tables, docx_path)
 
             else:
                 tables = []
@@ -430,7 +576,7 @@ def generate_report(req: ReportRequest):
 
             report_state[section.name] = {
                 "type": "images",
-                "content": extract_pdf_figures(doc, figures_dir),
+                "content": await run_in_threadpool(extract_pdf_figures, doc, figures_dir),
             }
 
         # -------- SUMMARY --------
@@ -445,7 +591,7 @@ def generate_report(req: ReportRequest):
             base_text = report_state[source]["content"]
             report_state[section.name] = {
                 "type": "text",
-                "content": summarize_text(base_text),
+                "content": await asummarize_text(base_text, session_id=req.session_id),
             }
 
     # -----------------------------
@@ -456,7 +602,7 @@ def generate_report(req: ReportRequest):
 
     output_path = REPORT_DIR / f"{req.session_id}.pdf"
 
-    assemble_pdf(report_state, output_path)
+    await run_in_threadpool(assemble_pdf, report_state, output_path)
 
     set_session_value(
         session_id=req.session_id,
@@ -565,7 +711,7 @@ def serve_uploaded_file(filename: str):
     return FileResponse(file_path)
 
 @router.post("/report/plan")
-def plan_report(req: ReportPlanRequest):
+async def plan_report(req: ReportPlanRequest):
     session_id = req.session_id
     user_prompt = req.user_prompt
 
@@ -575,13 +721,14 @@ def plan_report(req: ReportPlanRequest):
         raise HTTPException(400, "No PDF uploaded in this session")
 
     pdf_path = get_uploaded_pdf(filename)
-    doc = load_docling_document(pdf_path)
+    doc = await run_in_threadpool(load_docling_document, pdf_path)
 
     # 1️⃣ LLM planner (planning ONLY)
-    plan_json = call_llm_function(
+    plan_json = await acall_llm_function(
         system_prompt=build_report_planner_prompt(user_prompt),
         user_prompt=user_prompt,
-        tools=REPORT_PLAN_SCHEMA
+        tools=REPORT_PLAN_SCHEMA,
+        session_id=session_id,
     )
 
     # 2️⃣ Validate & normalize
@@ -591,13 +738,13 @@ def plan_report(req: ReportPlanRequest):
     assert isinstance(plan["sections"][0], dict)
 
     # 3️⃣ Deterministic execution (REAL data)
-    sections = execute_plan(plan, doc)
+    sections = await run_in_threadpool(execute_plan, plan, doc)
     REPORT_DIR = Path("app/store/reports")
     REPORT_DIR.mkdir(parents=True, exist_ok=True)
 
     output_path = REPORT_DIR / f"{req.session_id}.pdf"
     # 4️⃣ Assemble PDF
-    assemble_pdf(sections, output_path)
+    await run_in_threadpool(assemble_pdf, sections, output_path)
 
     set_session_value(session_id, "report_path", str(output_path))
 
@@ -4,10 +4,9 @@ from app.integrations.google_drive import (
     list_files_in_folder,
     download_file
 )
-from app.rag.ingest import ingest_text
-from app.rag.loaders.pdf_loader import extract_pdf_sections
-from app.rag.loaders.docx_loader import extract_docx_text
-from app.rag.loaders.excel_loader import extract_excel_text
+from app.rag.ingest import text_to_chunks
+from app.rag.pipeline import ingest_stream, iter_document_pages
+from app.memory.utils import DRIVE_SYNC_BATCH_CHUNKS
 
 INGESTED_TRACKER = "app/store/ingested_drive_files.json"
 
@@ -25,56 +24,62 @@ def save_ingested(data):
         json.dump(data, f, indent=2)
 
 
+def _drive_chunker(page: dict):
+    return text_to_chunks(
+        page["text"],
+        page["source"],
+        page=page.get("page"),
+        location=page["location"],
+    )
+
+
 def ingest_from_drive_folder(folder_id: str, creds_path: str):
+    """
+    Streams every new Drive file through the bounded ingestion
+    pipeline (app/rag/pipeline.py): files are downloaded one at a
+    time and a segment is committed every DRIVE_SYNC_BATCH_CHUNKS
+    new chunks, so memory does not grow with the folder size.
+    """
     service = get_drive_service(creds_path)
     files = list_files_in_folder(service, folder_id)
 
     ingested = load_ingested()
-    new_files = 0
-
-    for f in files:
-        if f["id"] in ingested:
-            continue
-
-        name = f["name"].lower()
-        if not name.endswith((".txt", ".pdf", ".docx", ".xlsx")):
-            continue
-
-        with tempfile.NamedTemporaryFile(delete=False) as tmp:
-            tmp_path = download_file(service, f["id"], tmp.name)
-
-        try:
-            pages = []
-
-            if name.endswith(".txt"):
-                with open(tmp_path, "r", encoding="utf-8") as fp:
-                    pages = [{"text": fp.read(), "page": None}]
-
-            elif name.endswith(".pdf"):
-                pages = extract_pdf_sections(
-                    file_path=tmp_path,
-                    source_name=f["name"]
-                )
-
-            elif name.endswith(".docx"):
-                pages = extract_docx_text(tmp_path)
-
-            elif name.endswith(".xlsx"):
-                pages = extract_excel_text(tmp_path)
-
-            for p in pages:
-                ingest_text(
-                    text=p["text"],
-                    source=f["name"],
-                    page=p["page"],
-                    location=f"gdrive:{f['id']}",  
-                )
-
-            ingested[f["id"]] = f["name"]
-            new_files += 1
-
-        finally:
-            os.remove(tmp_path)
-
+    # file_id -> name, for files whose pages were fully streamed
+    streamed = {}
+
+    def iter_pages():
+        for f in files:
+            if f["id"] in ingested:
+                continue
+
+            name = f["name"].lower()
+            if not name.endswith((".txt", ".pdf", ".docx", ".xlsx")):
+                continue
+
+            with tempfile.NamedTemporaryFile(delete=False) as tmp:
+                tmp_path = download_file(service, f["id"], tmp.name)
+
+            try:
+                for page in iter_document_pages(tmp_path, f["name"]):
+                    yield {
+                        "text": page["text"],
+                        "page": page.get("page"),
+                        "source": f["name"],
+                        "location": f"gdrive:{f['id']}",
+                    }
+            finally:
+                os.remove(tmp_path)
+
+            streamed[f["id"]] = f["name"]
+
+    ingest_stream(
+        iter_pages(),
+        _drive_chunker,
+        segment_chunks=DRIVE_SYNC_BATCH_CHUNKS,
+    )
+
+    # Re-running after a crash is safe: committed chunks are
+    # skipped by the hash index
+    ingested.update(streamed)
     save_ingested(ingested)
-    return new_files
+    return len(streamed)
@@ -2,6 +2,9 @@ from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from app.api import router
 from app.integrations.drive_ingest import ingest_from_drive_folder
+from app.rag.jobs import resume_jobs
+from app.rag.llm import aclose_clients
+from app.rag.loaders.pdf_loader import shutdown_pdf_pools
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -9,6 +12,12 @@ async def lifespan(app: FastAPI):
     FOLDER_ID = "1Ccz5XU9YTMHf9xxIpN7q3T8DYIqU9-ZW"
     CREDS_PATH = "app/integrations/credentials.json"
 
+    try:
+        resumed = resume_jobs()
+        print(f"[Startup] Resumed ingestion jobs: {resumed}")
+    except Exception as e:
+        print(f"[Startup] Resuming ingestion jobs failed: {e}")
+
     try:
         new_files = ingest_from_drive_folder(FOLDER_ID, CREDS_PATH)
         print(f"[Startup] Drive ingestion complete. New files: {new_files}")
@@ -18,7 +27,8 @@ async def lifespan(app: FastAPI):
     yield
     
     # Shutdown
-    pass
+    await aclose_clients()
+    shutdown_pdf_pools()
 
 app = FastAPI(title="Local RAG Backend", lifespan=lifespan)
 app.include_router(router)
\ No newline at end of file
@@ -7,6 +7,89 @@ STORE_DIR = BASE_DIR / "app" / "store"
 DOCS_PATH = STORE_DIR / "docs.pkl"
 INDEX_PATH = STORE_DIR / "index.faiss"
 UPLOAD_DIR = STORE_DIR / "uploads"
+
+# Segmented vector store (see app/rag/store.py)
+SEGMENTS_DIR = STORE_DIR / "segments"
+MANIFEST_PATH = STORE_DIR / "manifest.log"
+# The manifest log is rewritten as one snapshot record every this many records
+MANIFEST_CHECKPOINT_RECORDS = int(os.getenv("MANIFEST_CHECKPOINT_RECORDS", "1000"))
+SEGMENT_MERGE_THRESHOLD = int(os.getenv("SEGMENT_MERGE_THRESHOLD", "8"))
+# Index type per segment: auto | flat | hnsw | ivf (see app/rag/ann.py)
+INDEX_TYPE = os.getenv("INDEX_TYPE", "auto")
+ANN_THRESHOLD = int(os.getenv("ANN_THRESHOLD", "50000"))
+ANN_MIN_SEGMENT_ROWS = int(os.getenv("ANN_MIN_SEGMENT_ROWS", "10000"))
+IVF_THRESHOLD = int(os.getenv("IVF_THRESHOLD", "1000000"))
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # 0 = 4 * sqrt(rows)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+IVF_TRAIN_SAMPLE = int(os.getenv("IVF_TRAIN_SAMPLE", "100000"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+# Compressed index vectors: none | sq8 | pq, re-ranked exactly
+# against the on-disk float32 vectors (RERANK_FACTOR x k candidates)
+VECTOR_CODEC = os.getenv("VECTOR_CODEC", "none")
+VECTOR_CODEC_MIN_ROWS = int(os.getenv("VECTOR_CODEC_MIN_ROWS", "10000"))
+PQ_M = int(os.getenv("PQ_M", "48"))
+RERANK_FACTOR = int(os.getenv("RERANK_FACTOR", "4"))
+# Memory-map segment indexes (shared page cache, no heap copy) and
+# optionally warm the page cache in the background after opening
+INDEX_MMAP = os.getenv("INDEX_MMAP", "true").lower() in ("1", "true", "yes")
+INDEX_PREFETCH = os.getenv("INDEX_PREFETCH", "false").lower() in ("1", "true", "yes")
+# Segments with at least this fraction of deleted rows are compacted
+COMPACT_DELETED_RATIO = float(os.getenv("COMPACT_DELETED_RATIO", "0.2"))
+HASH_INDEX_PATH = STORE_DIR / "hashes.sqlite"
+# Embed a chunk only once even if several documents contain it
+DEDUP_ACROSS_SOURCES = os.getenv("DEDUP_ACROSS_SOURCES", "false").lower() in ("1", "true", "yes")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+# Sentence-transformer model used for chunks and queries
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# torch | onnx | onnx-int8 (see app/rag/embeddings.py)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# Micro-batching window for concurrent encode requests (app/rag/embedding_service.py)
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "3"))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "64"))
+# Retrieval mode: dense | hybrid (dense + BM25 fused with reciprocal rank fusion)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+RRF_K = int(os.getenv("RRF_K", "60"))
+HYBRID_FETCH_FACTOR = int(os.getenv("HYBRID_FETCH_FACTOR", "4"))
+# MMR diversification in retrieve(): 1.0 = pure relevance (off, default),
+# lower values (e.g. 0.7) trade relevance for diversity among the top-k
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "1.0"))
+MMR_FETCH_FACTOR = int(os.getenv("MMR_FETCH_FACTOR", "3"))
+# /chat context packing: token budget (0 = unlimited), L2 distance
+# cutoff (0 = off), smallest remainder worth trimming a chunk into
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_MAX_DISTANCE = float(os.getenv("CONTEXT_MAX_DISTANCE", "0"))
+CONTEXT_MIN_TRIM_TOKENS = int(os.getenv("CONTEXT_MIN_TRIM_TOKENS", "64"))
+# Filtered searches selecting at most this many rows of a segment scan them exactly
+FILTER_EXACT_MAX = int(os.getenv("FILTER_EXACT_MAX", "20000"))
+# Query embedding LRU in the retriever (entries, seconds)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+# /chat answer cache (entries, seconds, near-duplicate cosine; 0 = exact only)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0"))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 = library default
+ONNX_MODEL_DIR = Path(os.getenv("ONNX_MODEL_DIR", str(STORE_DIR / "onnx")))
+# chunk text hash -> vector cache, reused across index rebuilds and re-ingests.
+# float16 halves its size, but cache hits then return vectors rounded to half
+# precision (cosine drift ~1e-3 against freshly encoded ones)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE", "true").lower() in ("1", "true", "yes")
+EMBEDDING_CACHE_DIR = Path(os.getenv("EMBEDDING_CACHE_DIR", str(STORE_DIR / "embedding_cache")))
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float32")
+# Streaming pipeline: items buffered between stages, chunks per committed segment
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "64"))
+PIPELINE_SEGMENT_CHUNKS = int(os.getenv("PIPELINE_SEGMENT_CHUNKS", "2048"))
+# Background ingestion jobs
+INGEST_JOBS_PATH = STORE_DIR / "ingest_jobs.sqlite"
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Process-pool PDF extraction for long documents
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))
+# Drive sync commits a segment every this many new chunks (streamed, see app/rag/pipeline.py)
+DRIVE_SYNC_BATCH_CHUNKS = int(os.getenv("DRIVE_SYNC_BATCH_CHUNKS", "5000"))
+
 OLLAMA_BASE_URL = os.getenv(
     "OLLAMA_BASE_URL",
     "http://localhost:11434"  # fallback for local non-Docker runs
@@ -15,6 +98,20 @@ MODEL_NAME = os.getenv(
     "OLLAMA_MODEL",
     "llama3.1:8b"
 )
+# Pooled Ollama HTTP client (see app/rag/llm.py); timeouts in seconds
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "120"))
+OLLAMA_POOL_TIMEOUT = float(os.getenv("OLLAMA_POOL_TIMEOUT", "30"))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "256"))
+OLLAMA_MAX_KEEPALIVE = int(os.getenv("OLLAMA_MAX_KEEPALIVE", "32"))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "60"))
+# Retries for connection errors and 429/502/503/504, exponential backoff with full jitter
+OLLAMA_RETRIES = int(os.getenv("OLLAMA_RETRIES", "2"))
+OLLAMA_RETRY_BACKOFF = float(os.getenv("OLLAMA_RETRY_BACKOFF", "0.5"))
+# LLM scheduler (see app/rag/scheduler.py): concurrent Ollama calls, match the
+# server's OLLAMA_NUM_PARALLEL; slots that only chat may use while background work waits
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", os.getenv("OLLAMA_NUM_PARALLEL", "4")))
+LLM_CHAT_RESERVED = int(os.getenv("LLM_CHAT_RESERVED", "1"))
 def build_memory_aware_query(query: str, memory: list):
     if not memory:
         return query
@@ -0,0 +1,157 @@
+import math
+
+import faiss
+import numpy as np
+
+from app.memory.utils import (
+    ANN_MIN_SEGMENT_ROWS,
+    ANN_THRESHOLD,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+    HNSW_M,
+    INDEX_TYPE,
+    IVF_NLIST,
+    IVF_NPROBE,
+    IVF_THRESHOLD,
+    IVF_TRAIN_SAMPLE,
+    PQ_M,
+    VECTOR_CODEC,
+    VECTOR_CODEC_MIN_ROWS,
+)
+
+# -------------------------------------------------
+# Index types per segment
+#
+#   flat  exact brute force (IndexFlatL2)
+#   hnsw  graph index (IndexHNSWFlat)
+#   ivf   inverted lists (IndexIVFFlat), trained on a sample
+#
+# INDEX_TYPE=auto keeps everything flat until the store holds
+# ANN_THRESHOLD chunks, then builds HNSW for large segments and
+# IVF-Flat for very large ones (>= IVF_THRESHOLD rows).
+# Segments below ANN_MIN_SEGMENT_ROWS always stay flat: brute
+# force over a few thousand vectors is already sub-millisecond.
+#
+# VECTOR_CODEC=sq8|pq compresses the vectors held by the index
+# (kind "flat-sq8", "hnsw-pq", ...): SQ8 is 1 byte per dimension,
+# PQ is PQ_M bytes per vector. Full-precision vectors stay on disk
+# (vectors.npy) for exact re-ranking, see store.StoreSnapshot.
+# -------------------------------------------------
+
+INDEX_KINDS = ("flat", "hnsw", "ivf")
+CODECS = ("none", "sq8", "pq")
+
+
+def _base_kind(rows: int, store_ntotal: int) -> str:
+    if INDEX_TYPE == "flat" or rows < ANN_MIN_SEGMENT_ROWS:
+        return "flat"
+    if INDEX_TYPE in INDEX_KINDS:
+        return INDEX_TYPE
+    if INDEX_TYPE != "auto":
+        raise ValueError(f"Unknown INDEX_TYPE: {INDEX_TYPE}")
+
+    if store_ntotal < ANN_THRESHOLD:
+        return "flat"
+    return "ivf" if rows >= IVF_THRESHOLD else "hnsw"
+
+
+def index_kind_for(rows: int, store_ntotal: int) -> str:
+    kind = _base_kind(rows, store_ntotal)
+    if VECTOR_CODEC not in CODECS:
+        raise ValueError(f"Unknown VECTOR_CODEC: {VECTOR_CODEC}")
+    # Quantizers need enough rows to train their codebooks
+    if VECTOR_CODEC != "none" and rows >= VECTOR_CODEC_MIN_ROWS:
+        kind = f"{kind}-{VECTOR_CODEC}"
+    return kind
+
+
+def is_compressed(kind: str) -> bool:
+    return "-" in kind
+
+
+def _ivf_nlist(rows: int) -> int:
+    nlist = IVF_NLIST or int(4 * math.sqrt(rows))
+    return max(1, min(nlist, rows // 39))
+
+
+def _pq_m(dim: int) -> int:
+    # Sub-quantizers must split the dimension evenly
+    m = min(PQ_M, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def _factory_string(kind: str, rows: int, dim: int) -> str:
+    base, _, codec = kind.partition("-")
+    if base not in INDEX_KINDS or codec not in ("", "sq8", "pq"):
+        raise ValueError(f"Unknown index kind: {kind}")
+
+    code = {"": "Flat", "sq8": "SQ8", "pq": f"PQ{_pq_m(dim)}"}[codec]
+    if base == "flat":
+        # IndexPQ cannot take an IDSelector; a single-list IVF-PQ
+        # is the same exhaustive scan and supports one
+        if codec == "pq":
+            return f"IVF1,{code}"
+        return "Flat" if not codec else code
+    if base == "hnsw":
+        return f"HNSW{HNSW_M}" if not codec else f"HNSW{HNSW_M}_{code}"
+    return f"IVF{_ivf_nlist(rows)},{code}"
+
+
+def build_index(vectors: np.ndarray, kind: str):
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    dim = vectors.shape[1]
+    index = faiss.index_factory(dim, _factory_string(kind, len(vectors), dim))
+
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = IVF_NPROBE
+
+    if not index.is_trained:
+        sample_size = IVF_TRAIN_SAMPLE
+        if ivf is not None:
+            # faiss wants ~39 training points per centroid
+            sample_size = max(sample_size, 39 * ivf.nlist)
+        sample_size = min(len(vectors), sample_size)
+
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        index.train(sample)
+
+    index.add(vectors)
+    return index
+
+
+def search_params(
+    index,
+    nprobe: int | None = None,
+    ef_search: int | None = None,
+    sel=None,
+):
+    """
+    Per-query search parameters, so concurrent queries never
+    mutate the shared index object. `sel` is a faiss IDSelector
+    over segment positions (e.g. to skip tombstoned rows).
+    Returns None when the index defaults apply.
+    """
+    if not (nprobe or ef_search or sel is not None):
+        return None
+
+    kwargs = {"sel": sel} if sel is not None else {}
+
+    # faiss requires the parameter class matching the index, and
+    # fields left unset fall back to faiss defaults rather than the
+    # index's own settings, so always pass them explicitly
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(nprobe=nprobe or ivf.nprobe, **kwargs)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search or index.hnsw.efSearch, **kwargs)
+    if kwargs:
+        return faiss.SearchParameters(**kwargs)
+    return None
@@ -0,0 +1,117 @@
+import threading
+
+import numpy as np
+
+from app.rag.cache import LRUCache, normalize_query
+from app.memory.utils import (
+    ANSWER_CACHE_SIMILARITY,
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_TTL,
+    MODEL_NAME,
+)
+
+# -------------------------------------------------
+# /chat answer cache
+#
+# Caches the LLM output for (normalized query, retrieved chunk
+# ids, store content generation). Generation is temperature 0, so
+# the same prompt gives the same answer. Any ingest or delete bumps
+# the content generation (merges do not), which makes older entries
+# unreachable; they are dropped as soon as a newer generation is
+# seen. Requests still running on an older snapshot neither read
+# nor write the cache.
+#
+# With ANSWER_CACHE_SIMILARITY > 0, a near-identical question
+# (query embedding cosine >= threshold) that retrieved exactly the
+# same chunks also reuses the answer; only then is the query
+# embedding needed (see uses_embeddings).
+# -------------------------------------------------
+
+_cache = LRUCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL)
+_lock = threading.Lock()
+_generation = None
+
+# (generation, chunk ids) -> [(query embedding, exact key)]
+_by_context = {}
+
+
+def _context_key(generation: int, chunk_ids) -> tuple:
+    return (generation, frozenset(chunk_ids))
+
+
+def uses_embeddings() -> bool:
+    """
+    Whether lookups use the query embedding (near-duplicate matching).
+    """
+    return ANSWER_CACHE_SIMILARITY > 0
+
+
+def _check_generation(generation: int | None) -> bool:
+    """
+    Tracks the newest generation seen. Returns False for a stale
+    (older) generation, which must not read or write the cache.
+    """
+    global _generation
+    if generation is None:
+        return False
+    with _lock:
+        if _generation is not None and generation < _generation:
+            return False
+        if generation != _generation:
+            # Every cached entry belongs to an older generation
+            _cache.clear()
+            _by_context.clear()
+            _generation = generation
+    return True
+
+
+def get_answer(query: str, chunk_ids, generation: int | None, q_emb=None):
+    """
+    Cached LLM output for this question and context, or None.
+    """
+    if not _check_generation(generation):
+        return None
+    ctx = _context_key(generation, chunk_ids)
+
+    hit = _cache.get((MODEL_NAME, normalize_query(query), ctx))
+    if hit is not None or q_emb is None or not uses_embeddings():
+        return hit
+
+    q = np.asarray(q_emb, dtype="float32").reshape(-1)
+    with _lock:
+        candidates = list(_by_context.get(ctx, ()))
+    for emb, key in candidates:
+        # Embeddings are L2-normalized: dot product == cosine
+        if float(np.dot(emb, q)) >= ANSWER_CACHE_SIMILARITY:
+            hit = _cache.get(key)
+            if hit is not None:
+                return hit
+    return None
+
+
+def put_answer(query: str, chunk_ids, generation: int | None, llm_output: dict, q_emb=None):
+    if not _check_generation(generation):
+        return
+    ctx = _context_key(generation, chunk_ids)
+    key = (MODEL_NAME, normalize_query(query), ctx)
+    _cache.put(key, llm_output)
+
+    if q_emb is not None and uses_embeddings():
+        with _lock:
+            entries = _by_context.setdefault(ctx, [])
+            entries.append((np.asarray(q_emb, dtype="float32").reshape(-1), key))
+
+            # Bounded like the main cache; stale keys just miss
+            del entries[:-ANSWER_CACHE_SIZE]
+            while len(_by_context) > ANSWER_CACHE_SIZE:
+                _by_context.pop(next(iter(_by_context)))
+
+
+def clear():
+    with _lock:
+        _cache.clear()
+        _by_context.clear()
+
+
+def stats() -> dict:
+    return _cache.stats()
@@ -0,0 +1,135 @@
+import json
+import math
+import re
+from collections import Counter
+
+import numpy as np
+
+# -------------------------------------------------
+# BM25 inverted index (one per segment)
+#
+#   bm25_terms.json     sorted vocabulary
+#   bm25_offsets.npy    term i -> postings[off[i]:off[i+1]]
+#   bm25_postings.npy   segment positions, grouped by term
+#   bm25_tfs.npy        term frequency per posting
+#   bm25_doclen.npy     tokens per chunk
+#
+# Tokens keep internal dots, dashes and slashes so dosages,
+# trial ids and codes (5mg, nct01234567, e11.9, 10/325) survive
+# as single terms. IDF and the average length are computed over
+# the live (not tombstoned) chunks of all live segments.
+# -------------------------------------------------
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+_STOPWORDS = frozenset("""
+a an and are as at be but by for from has have in is it its of on or
+that the this to was were which with what who how when where does do
+""".split())
+
+
+def tokenize(text: str) -> list[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class Postings:
+    def __init__(self, terms: list[str], offsets, postings, tfs, doclen):
+        self.terms = {t: i for i, t in enumerate(terms)}
+        self.offsets = offsets
+        self.postings = postings
+        self.tfs = tfs
+        self.doclen = doclen
+
+    @classmethod
+    def build(cls, texts) -> "Postings":
+        index = {}
+        doclen = []
+        for pos, text in enumerate(texts):
+            tokens = tokenize(text)
+            doclen.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                index.setdefault(term, []).append((pos, tf))
+
+        terms = sorted(index)
+        offsets = np.zeros(len(terms) + 1, dtype="int64")
+        np.cumsum([len(index[t]) for t in terms], out=offsets[1:])
+        pairs = [p for t in terms for p in index[t]]
+        postings = np.array([p for p, _ in pairs], dtype="int32")
+        tfs = np.array([tf for _, tf in pairs], dtype="int32")
+        return cls(terms, offsets, postings, tfs, np.array(doclen, dtype="int32"))
+
+    def save(self, seg_dir):
+        with open(seg_dir / "bm25_terms.json", "w", encoding="utf-8") as f:
+            json.dump(list(self.terms), f, ensure_ascii=False)
+        np.save(seg_dir / "bm25_offsets.npy", self.offsets)
+        np.save(seg_dir / "bm25_postings.npy", self.postings)
+        np.save(seg_dir / "bm25_tfs.npy", self.tfs)
+        np.save(seg_dir / "bm25_doclen.npy", self.doclen)
+
+    @classmethod
+    def load(cls, seg_dir) -> "Postings":
+        with open(seg_dir / "bm25_terms.json", "r", encoding="utf-8") as f:
+            terms = json.load(f)
+        return cls(
+            terms,
+            np.load(seg_dir / "bm25_offsets.npy", mmap_mode="r"),
+            np.load(seg_dir / "bm25_postings.npy", mmap_mode="r"),
+            np.load(seg_dir / "bm25_tfs.npy", mmap_mode="r"),
+            np.load(seg_dir / "bm25_doclen.npy", mmap_mode="r"),
+        )
+
+    @property
+    def total_tokens(self) -> int:
+        return int(self.doclen.sum())
+
+    def df(self, term: str, deleted=None) -> int:
+        """
+        Chunks containing `term`, not counting the tombstoned
+        positions in `deleted`.
+        """
+        i = self.terms.get(term)
+        if i is None:
+            return 0
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        if deleted is None or not len(deleted):
+            return end - start
+        return int((~np.isin(self.postings[start:end], deleted)).sum())
+
+    def score(self, terms: list[str], idf: dict, avgdl: float):
+        """
+        BM25 scores for every chunk matching at least one term.
+        Returns (positions, scores).
+        """
+        positions, contributions = [], []
+        for term in terms:
+            i = self.terms.get(term)
+            if i is None:
+                continue
+            start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+            pos = np.asarray(self.postings[start:end])
+            tf = np.asarray(self.tfs[start:end], dtype="float32")
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doclen[pos] / avgdl)
+            positions.append(pos)
+            contributions.append(idf[term] * tf * (BM25_K1 + 1) / (tf + norm))
+
+        if not positions:
+            return np.zeros(0, dtype="int32"), np.zeros(0, dtype="float32")
+
+        unique, inverse = np.unique(np.concatenate(positions), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions))
+        return unique, scores
+
+
+def idf_weights(terms: list[str], postings: list[Postings], n_docs: int, deleted=None) -> dict:
+    """
+    Corpus-wide BM25 idf (Lucene variant, always positive).
+    deleted: tombstoned positions per postings list, not counted.
+    """
+    deleted = deleted or [None] * len(postings)
+    idf = {}
+    for term in set(terms):
+        df = sum(p.df(term, d) for p, d in zip(postings, deleted))
+        idf[term] = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+    return idf
@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import OrderedDict
+
+# -------------------------------------------------
+# Small in-process caches
+#
+# Bounded LRU with an optional per-entry TTL and hit/miss
+# counters. Thread-safe: FastAPI runs sync handlers in a pool.
+# -------------------------------------------------
+
+_MISSING = object()
+
+
+def normalize_query(query: str) -> str:
+    """
+    Cache key for user questions: case and whitespace do not matter.
+    """
+    return " ".join(query.split()).lower()
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
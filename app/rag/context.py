@@ -0,0 +1,69 @@
+from app.rag.utils import estimate_tokens
+from app.memory.utils import (
+    CONTEXT_MAX_DISTANCE,
+    CONTEXT_MIN_TRIM_TOKENS,
+    CONTEXT_TOKEN_BUDGET,
+)
+
+# -------------------------------------------------
+# Token-budgeted context packing for /chat
+#
+# Prompt prefill dominates CPU latency, so chunks are added in
+# retrieval order until the budget is spent: chunks beyond the
+# distance cutoff are skipped, the first chunk that does not fit
+# is trimmed (if enough budget is left) and packing stops.
+# Per-chunk token counts come from ingest (n_tokens).
+# -------------------------------------------------
+
+
+def _chunk_tokens(chunk: dict) -> int:
+    n = chunk.get("n_tokens")
+    return n if isinstance(n, int) else estimate_tokens(chunk["text"])
+
+
+def _trim_text(text: str, tokens: int, budget: int) -> str:
+    words = text.split()
+    keep = max(1, int(len(words) * budget / max(tokens, 1)))
+    return " ".join(words[:keep]) + " ..."
+
+
+def format_chunk(chunk: dict) -> str:
+    return f"[{chunk['chunk_id']}]\n{chunk['text']}"
+
+
+def pack_context(
+    chunks: list[dict],
+    budget: int = CONTEXT_TOKEN_BUDGET,
+    max_distance: float = CONTEXT_MAX_DISTANCE,
+):
+    """
+    Returns (context string, packed chunks, tokens used).
+    Chunks need chunk_id and text; budget <= 0 disables the
+    budget and max_distance <= 0 disables the cutoff.
+    """
+    packed = []
+    used = 0
+
+    for chunk in chunks:
+        distance = chunk.get("distance")
+        if max_distance > 0 and distance is not None and distance > max_distance:
+            continue
+
+        header = estimate_tokens(f"[{chunk['chunk_id']}]") + 1
+        tokens = _chunk_tokens(chunk) + header
+
+        if budget > 0 and used + tokens > budget:
+            # Leave room for the " ..." marker
+            remaining = budget - used - header - estimate_tokens(" ...")
+            if remaining >= CONTEXT_MIN_TRIM_TOKENS:
+                trimmed = dict(chunk)
+                trimmed["text"] = _trim_text(chunk["text"], tokens - header, remaining)
+                packed.append(trimmed)
+                used += header + estimate_tokens(trimmed["text"])
+            break
+
+        packed.append(chunk)
+        used += tokens
+
+    context = "\n\n".join(format_chunk(c) for c in packed)
+    return context, packed, used
@@ -0,0 +1,238 @@
+import json
+
+import numpy as np
+
+# -------------------------------------------------
+# Columnar chunk metadata (one per segment)
+#
+#   text.bin + text_offsets.npy    utf-8 blob, row i = [off[i], off[i+1])
+#   <field>.codes.npy              dictionary-encoded strings
+#                                  (source, section, location)
+#   <field>.npy                    integer columns (page, section_level, n_tokens)
+#   extra.bin + extra_offsets.npy  remaining keys as one JSON object per row
+#   columns.json                   dictionaries and column layout
+#
+# Everything is opened with mmap, so a reader only pages in the
+# rows it materializes (the top-k of a query), not the corpus.
+# -------------------------------------------------
+
+DICT_COLUMNS = ("source", "section", "location")
+INT_COLUMNS = ("page", "section_level", "n_tokens")
+
+# Codes / values for a key that is None, or missing from the chunk dict
+_NULL_CODE, _ABSENT_CODE = -1, -2
+_NULL_INT, _ABSENT_INT = np.iinfo("int64").min, np.iinfo("int64").min + 1
+
+
+# -------------------------------------------------
+# Metadata filters
+#
+#   {"sources": [...], "section_prefix": str,
+#    "page_range": (first, last), "location_prefix": str}
+#
+# All given conditions must hold; None / missing keys are ignored.
+# -------------------------------------------------
+def _clean_filters(filters: dict | None) -> dict:
+    return {k: v for k, v in (filters or {}).items() if v not in (None, "", [], ())}
+
+
+def doc_matches(doc: dict, filters: dict) -> bool:
+    if "sources" in filters and doc.get("source") not in set(filters["sources"]):
+        return False
+    if "section_prefix" in filters and not (doc.get("section") or "").startswith(filters["section_prefix"]):
+        return False
+    if "location_prefix" in filters and not (doc.get("location") or "").startswith(filters["location_prefix"]):
+        return False
+    if "page_range" in filters:
+        first, last = filters["page_range"]
+        page = doc.get("page")
+        if not isinstance(page, int):
+            return False
+        if (first is not None and page < first) or (last is not None and page > last):
+            return False
+    return True
+
+
+def match_filters(docs, filters: dict | None):
+    """
+    Boolean mask over a segment's rows, or None when there is nothing to filter.
+    """
+    filters = _clean_filters(filters)
+    if not filters:
+        return None
+    if isinstance(docs, ColumnarDocs):
+        return docs.match(filters)
+    return np.fromiter((doc_matches(d, filters) for d in docs), dtype=bool, count=len(docs))
+
+
+def _write_blob(path_prefix, values: list[str]):
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype="int64")
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    with open(f"{path_prefix}.bin", "wb") as f:
+        for b in encoded:
+            f.write(b)
+    np.save(f"{path_prefix}_offsets.npy", offsets)
+
+
+def write_columns(seg_dir, docs: list[dict]):
+    """
+    Writes chunk dicts to seg_dir in the columnar layout.
+    """
+    dict_cols = [
+        f for f in DICT_COLUMNS
+        if all(isinstance(d.get(f), (str, type(None))) for d in docs)
+    ]
+    int_cols = [
+        f for f in INT_COLUMNS
+        if all(
+            d.get(f) is None or (isinstance(d[f], int) and not isinstance(d[f], bool))
+            for d in docs
+        )
+    ]
+
+    dictionaries = {}
+    for field in dict_cols:
+        values = {}
+        codes = np.empty(len(docs), dtype="int32")
+        for i, d in enumerate(docs):
+            if field not in d:
+                codes[i] = _ABSENT_CODE
+            elif d[field] is None:
+                codes[i] = _NULL_CODE
+            else:
+                codes[i] = values.setdefault(d[field], len(values))
+        np.save(seg_dir / f"{field}.codes.npy", codes)
+        dictionaries[field] = list(values)
+
+    for field in int_cols:
+        column = np.array(
+            [
+                _ABSENT_INT if field not in d else _NULL_INT if d[field] is None else d[field]
+                for d in docs
+            ],
+            dtype="int64",
+        )
+        np.save(seg_dir / f"{field}.npy", column)
+
+    columnar = {"text", *dict_cols, *int_cols}
+    _write_blob(seg_dir / "text", [d.get("text", "") for d in docs])
+    _write_blob(seg_dir / "extra", [
+        json.dumps({k: v for k, v in d.items() if k not in columnar}, ensure_ascii=False)
+        for d in docs
+    ])
+
+    with open(seg_dir / "columns.json", "w", encoding="utf-8") as f:
+        json.dump({"dict": dictionaries, "int": int_cols, "rows": len(docs)}, f)
+
+
+class ColumnarDocs:
+    """
+    Read-only, list-like view over a segment's chunk metadata.
+    docs[i] materializes one chunk dict.
+    """
+
+    def __init__(self, seg_dir):
+        with open(seg_dir / "columns.json", "r", encoding="utf-8") as f:
+            layout = json.load(f)
+
+        self.rows = layout["rows"]
+        self.dictionaries = layout["dict"]
+        self.codes = {
+            field: np.load(seg_dir / f"{field}.codes.npy", mmap_mode="r")
+            for field in self.dictionaries
+        }
+        self.ints = {
+            field: np.load(seg_dir / f"{field}.npy", mmap_mode="r")
+            for field in layout["int"]
+        }
+        self._text = self._open_blob(seg_dir / "text")
+        self._extra = self._open_blob(seg_dir / "extra")
+
+    @staticmethod
+    def _open_blob(path_prefix):
+        offsets = np.load(f"{path_prefix}_offsets.npy", mmap_mode="r")
+        blob_path = f"{path_prefix}.bin"
+        if offsets[-1] == 0:
+            # np.memmap cannot map an empty file
+            return offsets, np.zeros(0, dtype="uint8")
+        return offsets, np.memmap(blob_path, dtype="uint8", mode="r")
+
+    @staticmethod
+    def _read(blob, i: int) -> str:
+        offsets, data = blob
+        return data[offsets[i]:offsets[i + 1]].tobytes().decode("utf-8")
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def __getitem__(self, i: int) -> dict:
+        if not -self.rows <= i < self.rows:
+            raise IndexError(i)
+        i %= self.rows
+
+        doc = {"text": self._read(self._text, i)}
+        doc.update(json.loads(self._read(self._extra, i)))
+
+        for field, codes in self.codes.items():
+            code = int(codes[i])
+            if code != _ABSENT_CODE:
+                doc[field] = None if code == _NULL_CODE else self.dictionaries[field][code]
+
+        for field, column in self.ints.items():
+            value = int(column[i])
+            if value != _ABSENT_INT:
+                doc[field] = None if value == _NULL_INT else value
+
+        return doc
+
+    def __iter__(self):
+        for i in range(self.rows):
+            yield self[i]
+
+    # ---------------------------------------------
+    # Filtering (vectorized over the columns)
+    # ---------------------------------------------
+    def _match_dict(self, field: str, predicate):
+        codes = self.codes[field]
+        allowed = [i for i, value in enumerate(self.dictionaries[field]) if predicate(value)]
+        return np.isin(codes, np.array(allowed, dtype="int32"))
+
+    def match(self, filters: dict):
+        mask = np.ones(self.rows, dtype=bool)
+        slow = {}
+
+        if "sources" in filters:
+            if "source" in self.codes:
+                sources = set(filters["sources"])
+                mask &= self._match_dict("source", lambda v: v in sources)
+            else:
+                slow["sources"] = filters["sources"]
+
+        for key, field in (("section_prefix", "section"), ("location_prefix", "location")):
+            if key not in filters:
+                continue
+            if field in self.codes:
+                prefix = filters[key]
+                mask &= self._match_dict(field, lambda v: v.startswith(prefix))
+            else:
+                slow[key] = filters[key]
+
+        if "page_range" in filters:
+            if "page" in self.ints:
+                first, last = filters["page_range"]
+                pages = np.asarray(self.ints["page"])
+                mask &= (pages != _NULL_INT) & (pages != _ABSENT_INT)
+                if first is not None:
+                    mask &= pages >= first
+                if last is not None:
+                    mask &= pages <= last
+            else:
+                slow["page_range"] = filters["page_range"]
+
+        # Fields that were not stored as columns: check row by row
+        if slow:
+            for i in np.flatnonzero(mask):
+                mask[i] = doc_matches(self[int(i)], slow)
+
+        return mask
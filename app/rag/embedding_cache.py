@@ -0,0 +1,191 @@
+import re
+import sqlite3
+import threading
+from contextlib import closing
+
+import numpy as np
+
+from app.memory.utils import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_CACHE_DTYPE,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_MODEL,
+)
+
+# -------------------------------------------------
+# Content-addressed embedding cache
+#
+# hash of the chunk text -> vector, one directory per embedding
+# model, backend (int8 vectors must not mix with fp32 ones) and
+# storage dtype. Keyed by text alone, not chunk_hash: the same
+# text under another filename or page reuses the vector.
+# Vectors live in an append-only raw file read through
+# np.memmap; a small SQLite table maps hash -> row.
+# Survives index rebuilds and deleting the vector store.
+# -------------------------------------------------
+
+_LOOKUP_BATCH = 500
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class EmbeddingCache:
+    def __init__(self, root, model_name: str, dtype: str = "float32"):
+        self.dtype = np.dtype(dtype)
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.dir = root / f"{slug}-{self.dtype.name}"
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.vec_path = self.dir / "vectors.bin"
+        self.db_path = self.dir / "index.sqlite"
+
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._mmap_rows = 0
+        self.dim = self._read_dim()
+
+        self.hits = 0
+        self.misses = 0
+
+    # ---------------------------------------------
+    # Storage
+    # ---------------------------------------------
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors (text_hash TEXT PRIMARY KEY, row INTEGER NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        return conn
+
+    def _read_dim(self):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        return int(row[0]) if row else None
+
+    def _rows_on_disk(self) -> int:
+        if self.dim is None or not self.vec_path.exists():
+            return 0
+        return self.vec_path.stat().st_size // (self.dim * self.dtype.itemsize)
+
+    def _vectors(self, needed_rows: int):
+        # Remap only when the file has grown past the mapped range
+        if self._mmap is None or needed_rows > self._mmap_rows:
+            rows = self._rows_on_disk()
+            self._mmap = np.memmap(
+                self.vec_path, dtype=self.dtype, mode="r", shape=(rows, self.dim)
+            )
+            self._mmap_rows = rows
+        return self._mmap
+
+    # ---------------------------------------------
+    # API
+    # ---------------------------------------------
+    def lookup(self, hashes: list[str]):
+        """
+        Returns (vectors, hit_mask). vectors is float32 (n, dim) with
+        rows filled where hit_mask is True, or None if nothing is cached.
+        """
+        hit = np.zeros(len(hashes), dtype=bool)
+        if self.dim is None or not hashes:
+            self.misses += len(hashes)
+            return None, hit
+
+        rows = {}
+        unique = list({h for h in hashes if h})
+        with closing(self._connect()) as conn:
+            for i in range(0, len(unique), _LOOKUP_BATCH):
+                batch = unique[i:i + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows.update(conn.execute(
+                    f"SELECT text_hash, row FROM vectors WHERE text_hash IN ({placeholders})",
+                    batch,
+                ).fetchall())
+
+        if not rows:
+            self.misses += len(hashes)
+            return None, hit
+
+        out = np.zeros((len(hashes), self.dim), dtype="float32")
+        with self._lock:
+            mm = self._vectors(max(rows.values()) + 1)
+            for i, h in enumerate(hashes):
+                r = rows.get(h)
+                if r is not None:
+                    out[i] = mm[r]
+                    hit[i] = True
+
+        n_hits = int(hit.sum())
+        self.hits += n_hits
+        self.misses += len(hashes) - n_hits
+        return out, hit
+
+    def put(self, hashes: list[str], vectors: np.ndarray):
+        vectors = np.asarray(vectors)
+        if len(hashes) != len(vectors) or not len(hashes):
+            return
+
+        with self._lock, closing(self._connect()) as conn:
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO meta VALUES ('dim', ?)", (str(self.dim),))
+                    conn.execute("INSERT OR REPLACE INTO meta VALUES ('dtype', ?)", (self.dtype.name,))
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dim {vectors.shape[1]} != cache dim {self.dim}")
+
+            # Skip hashes already cached (and repeats inside this batch)
+            existing = set()
+            for i in range(0, len(hashes), _LOOKUP_BATCH):
+                batch = hashes[i:i + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                existing.update(h for (h,) in conn.execute(
+                    f"SELECT text_hash FROM vectors WHERE text_hash IN ({placeholders})",
+                    batch,
+                ))
+
+            keep = []
+            for i, h in enumerate(hashes):
+                if h and h not in existing:
+                    existing.add(h)
+                    keep.append(i)
+            if not keep:
+                return
+
+            # Vectors first, then the index rows that point at them
+            first_row = self._rows_on_disk()
+            with open(self.vec_path, "ab") as f:
+                f.write(np.ascontiguousarray(vectors[keep], dtype=self.dtype).tobytes())
+
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO vectors (text_hash, row) VALUES (?, ?)",
+                    [(hashes[i], first_row + j) for j, i in enumerate(keep)],
+                )
+
+    def stats(self) -> dict:
+        return {
+            "rows": self._rows_on_disk(),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def get_embedding_cache():
+    """
+    Process-wide cache for the configured model, or None when disabled.
+    """
+    global _cache
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(
+                EMBEDDING_CACHE_DIR,
+                f"{EMBEDDING_MODEL}-{EMBEDDING_BACKEND}",
+                EMBEDDING_CACHE_DTYPE,
+            )
+    return _cache
@@ -0,0 +1,185 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from app.memory.utils import EMBED_BATCH_WINDOW_MS, EMBED_MAX_BATCH
+from app.rag.embeddings import get_embedding_backend
+
+# -------------------------------------------------
+# Shared embedding service (dynamic micro-batching)
+#
+# Callers (retriever queries, ingest batches) submit texts and
+# block on a future. One worker thread owns the model: it takes
+# the first pending request, gathers whatever else arrives within
+# EMBED_BATCH_WINDOW_MS (up to EMBED_MAX_BATCH texts), runs one
+# forward pass and hands every caller its rows. Concurrent /chat
+# queries share a batch instead of fighting over torch threads.
+#
+# Large requests (ingest) are encoded in EMBED_MAX_BATCH slices.
+# Each batch is filled smallest-remaining-request first, so a
+# query that arrives mid-ingest waits for at most one slice.
+# -------------------------------------------------
+
+_service = None
+_service_lock = threading.Lock()
+
+
+class _Request:
+    def __init__(self, texts, batch_size, show_progress_bar, normalize_embeddings):
+        self.texts = texts
+        self.batch_size = batch_size
+        self.show_progress_bar = show_progress_bar
+        self.normalize_embeddings = normalize_embeddings
+        self.future = Future()
+
+        self.offset = 0     # texts already encoded
+        self.parts = []
+
+    @property
+    def remaining(self) -> int:
+        return len(self.texts) - self.offset
+
+
+class EmbeddingService:
+    """
+    Drop-in for a backend: same encode() signature.
+    """
+
+    def __init__(self, backend, window_ms: float = EMBED_BATCH_WINDOW_MS, max_batch: int = EMBED_MAX_BATCH):
+        self.backend = backend
+        self.name = backend.name
+        self.model_name = backend.model_name
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+
+        self._queue = queue.Queue()
+        self._active = []   # accepted requests, in arrival order
+
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+
+        self._thread = threading.Thread(target=self._run, name="embedding-service", daemon=True)
+        self._thread.start()
+
+    def encode(
+        self,
+        texts: list[str],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        normalize_embeddings: bool = True,
+    ) -> np.ndarray:
+        if not texts:
+            return self.backend.encode(
+                texts, batch_size=batch_size, normalize_embeddings=normalize_embeddings
+            )
+
+        req = _Request(list(texts), batch_size, show_progress_bar, normalize_embeddings)
+        self._queue.put(req)
+        return req.future.result()
+
+    # ---------------------------------------------
+    # Worker
+    # ---------------------------------------------
+    def _collect(self):
+        """
+        Accepts queued requests. Blocks (plus the batching window)
+        only when there is no work in progress.
+        """
+        if not self._active:
+            self._active.append(self._queue.get())
+            deadline = time.monotonic() + self.window
+            while sum(r.remaining for r in self._active) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    self._active.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+        while True:
+            try:
+                self._active.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+    def _next_batch(self) -> list[tuple[_Request, int, int]]:
+        """
+        Up to max_batch texts as (request, start, end) slices,
+        smallest remaining request first.
+        """
+        pending = sorted(self._active, key=lambda r: r.remaining)
+        normalize = pending[0].normalize_embeddings
+
+        batch = []
+        room = self.max_batch
+        for req in pending:
+            if room <= 0:
+                break
+            if req.normalize_embeddings != normalize:
+                continue
+            n = min(req.remaining, room)
+            batch.append((req, req.offset, req.offset + n))
+            room -= n
+        return batch
+
+    def _run(self):
+        while True:
+            self._collect()
+            batch = self._next_batch()
+            texts = [t for req, start, end in batch for t in req.texts[start:end]]
+
+            try:
+                vectors = np.asarray(
+                    self.backend.encode(
+                        texts,
+                        batch_size=max(req.batch_size for req, _, _ in batch),
+                        show_progress_bar=any(req.show_progress_bar for req, _, _ in batch),
+                        normalize_embeddings=batch[0][0].normalize_embeddings,
+                    ),
+                    dtype="float32",
+                )
+            except Exception as e:
+                for req, _, _ in batch:
+                    req.future.set_exception(e)
+                    self._active.remove(req)
+                continue
+
+            self.batches += 1
+            self.texts += len(texts)
+
+            pos = 0
+            for req, start, end in batch:
+                req.parts.append(vectors[pos:pos + end - start])
+                pos += end - start
+                req.offset = end
+
+                if req.remaining == 0:
+                    self._active.remove(req)
+                    self.requests += 1
+                    result = req.parts[0] if len(req.parts) == 1 else np.concatenate(req.parts)
+                    req.future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "texts": self.texts,
+            "queued": self._queue.qsize(),
+            "in_progress": len(self._active),
+        }
+
+
+def get_embedding_service():
+    """
+    Process-wide service around the configured backend.
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = EmbeddingService(get_embedding_backend())
+    return _service
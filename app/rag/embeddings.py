@@ -0,0 +1,231 @@
+import inspect
+import re
+import threading
+
+import numpy as np
+
+from app.memory.utils import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL,
+    EMBEDDING_THREADS,
+    ONNX_MODEL_DIR,
+)
+
+# -------------------------------------------------
+# Pluggable embedding backends
+#
+#   torch      sentence-transformers on PyTorch (default)
+#   onnx       ONNX Runtime, fp32
+#   onnx-int8  ONNX Runtime, dynamically int8-quantized weights
+#
+# All backends expose encode(texts, batch_size, show_progress_bar,
+# normalize_embeddings) -> float32 ndarray, so ingest and the
+# retriever do not care which one is configured.
+# -------------------------------------------------
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+class SentenceTransformerBackend:
+    name = "torch"
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        if EMBEDDING_THREADS:
+            import torch
+            torch.set_num_threads(EMBEDDING_THREADS)
+
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+
+    def encode(
+        self,
+        texts: list[str],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        normalize_embeddings: bool = True,
+    ) -> np.ndarray:
+        return np.asarray(
+            self.model.encode(
+                texts,
+                batch_size=batch_size,
+                show_progress_bar=show_progress_bar,
+                normalize_embeddings=normalize_embeddings,
+            ),
+            dtype="float32",
+        )
+
+
+class OnnxBackend:
+    """
+    Runs the transformer through ONNX Runtime and reproduces the
+    sentence-transformers head (mean pooling + L2 normalization).
+    The model is exported once from PyTorch into ONNX_MODEL_DIR;
+    after that only onnxruntime and the tokenizer are needed.
+    """
+
+    def __init__(self, model_name: str, quantize: bool = False):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise RuntimeError(
+                "EMBEDDING_BACKEND=onnx requires the onnxruntime package"
+            ) from e
+        from transformers import AutoTokenizer
+
+        self.name = "onnx-int8" if quantize else "onnx"
+        self.model_name = model_name
+
+        model_dir = ONNX_MODEL_DIR / re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        fp32_path = model_dir / "model.onnx"
+        if not fp32_path.exists():
+            export_onnx(model_name, model_dir)
+
+        model_path = fp32_path
+        if quantize:
+            model_path = model_dir / "model.int8.onnx"
+            if not model_path.exists():
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+                quantize_dynamic(str(fp32_path), str(model_path), weight_type=QuantType.QInt8)
+
+        options = ort.SessionOptions()
+        if EMBEDDING_THREADS:
+            options.intra_op_num_threads = EMBEDDING_THREADS
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(
+            str(model_path), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+        self.max_length = min(self.tokenizer.model_max_length, 256)
+
+    def encode(
+        self,
+        texts: list[str],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        normalize_embeddings: bool = True,
+    ) -> np.ndarray:
+        out = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            enc = self.tokenizer(
+                batch,
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            feeds = {
+                k: v.astype("int64")
+                for k, v in enc.items()
+                if k in self.input_names
+            }
+            token_embeddings = self.session.run(None, feeds)[0]
+
+            # Mean pooling over non-padding tokens
+            mask = enc["attention_mask"][..., None].astype("float32")
+            summed = (token_embeddings * mask).sum(axis=1)
+            pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+            out.append(pooled.astype("float32"))
+
+        if not out:
+            return np.zeros((0, 0), dtype="float32")
+
+        vectors = np.concatenate(out)
+        if normalize_embeddings:
+            vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors
+
+
+def export_onnx(model_name: str, out_dir):
+    """
+    Exports the HF transformer behind a sentence-transformers model to ONNX.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name)
+    model.eval()
+
+    dummy = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in dummy]
+    dynamic_axes = {n: {0: "batch", 1: "sequence"} for n in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    # Newer torch defaults to the dynamo exporter; the TorchScript one
+    # handles dynamic batch/sequence axes without extra dependencies
+    export_kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs["dynamo"] = False
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(dummy[n] for n in input_names),
+            str(out_dir / "model.onnx"),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+            **export_kwargs,
+        )
+    tokenizer.save_pretrained(str(out_dir))
+    print(f"[embeddings] Exported {model_name} to {out_dir}")
+
+
+def create_backend(name: str = EMBEDDING_BACKEND, model_name: str = EMBEDDING_MODEL):
+    if name == "torch":
+        return SentenceTransformerBackend(model_name)
+    if name == "onnx":
+        return OnnxBackend(model_name)
+    if name == "onnx-int8":
+        return OnnxBackend(model_name, quantize=True)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {name} (expected one of {BACKENDS})")
+
+
+def get_embedding_backend():
+    """
+    Process-wide backend shared by ingest and the retriever.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend()
+            print(f"[embeddings] Using {_backend.name} backend for {EMBEDDING_MODEL}")
+    return _backend
+
+
+def check_backend_parity(
+    texts: list[str],
+    backend=None,
+    reference=None,
+    max_drift: float = 0.01,
+) -> dict:
+    """
+    Compares a backend against the PyTorch reference.
+    Drift is 1 - cosine similarity per text; the check passes
+    if the worst drift stays within max_drift.
+    """
+    backend = backend or get_embedding_backend()
+    reference = reference or SentenceTransformerBackend(backend.model_name)
+
+    a = backend.encode(texts, normalize_embeddings=True)
+    b = reference.encode(texts, normalize_embeddings=True)
+    drift = 1.0 - np.sum(a * b, axis=1)
+
+    return {
+        "backend": backend.name,
+        "texts": len(texts),
+        "mean_drift": float(drift.mean()),
+        "max_drift": float(drift.max()),
+        "max_allowed": max_drift,
+        "passed": bool(drift.max() <= max_drift),
+    }
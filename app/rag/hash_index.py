@@ -0,0 +1,151 @@
+import sqlite3
+from contextlib import closing
+
+from app.memory.utils import HASH_INDEX_PATH
+
+# -------------------------------------------------
+# Persistent chunk-hash index (SQLite)
+#
+# One row per committed chunk, keyed by chunk_hash.
+# Dedup at ingest is a lookup per chunk instead of a
+# scan over every stored chunk. The source column also
+# resolves a document to its stable chunk ids for deletes.
+# -------------------------------------------------
+
+_LOOKUP_BATCH = 500
+
+
+def _connect():
+    HASH_INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(HASH_INDEX_PATH), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chunk_hashes (
+            chunk_hash TEXT NOT NULL,
+            source TEXT,
+            chunk_id INTEGER PRIMARY KEY
+        )
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chunk_hash ON chunk_hashes (chunk_hash)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_source ON chunk_hashes (source)"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)"
+    )
+    return conn
+
+
+def _meta(key: str) -> int:
+    with closing(_connect()) as conn:
+        row = conn.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+    return row[0] if row else 0
+
+
+def _set_meta(conn, key: str, value: int | None):
+    if value is not None:
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            (key, int(value)),
+        )
+
+
+def synced_next_id() -> int:
+    """
+    Stable chunk ids below this value are recorded in the index.
+    """
+    return _meta("next_id")
+
+
+def synced_generation() -> int:
+    """
+    Manifest content generation whose deletes are applied to the index.
+    """
+    return _meta("content_generation")
+
+
+def all_ids() -> list[int]:
+    with closing(_connect()) as conn:
+        return [cid for (cid,) in conn.execute("SELECT chunk_id FROM chunk_hashes")]
+
+
+def record_chunks(ids, chunks: list[dict], next_id: int, generation: int | None = None):
+    """
+    Records committed chunks and marks the index as synced up to
+    next_id (and, if given, the manifest content generation).
+    """
+    # Chunks without a hash are kept too (never match a lookup),
+    # so delete-by-source still finds them
+    rows = [
+        (c.get("chunk_hash") or "", c.get("source"), int(cid))
+        for cid, c in zip(ids, chunks)
+    ]
+
+    with closing(_connect()) as conn, conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO chunk_hashes (chunk_hash, source, chunk_id) VALUES (?, ?, ?)",
+            rows,
+        )
+        _set_meta(conn, "next_id", next_id)
+        _set_meta(conn, "content_generation", generation)
+
+
+def ids_for_sources(sources) -> list[int]:
+    sources = list(sources)
+    ids = []
+    with closing(_connect()) as conn:
+        for i in range(0, len(sources), _LOOKUP_BATCH):
+            batch = sources[i:i + _LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            ids.extend(cid for (cid,) in conn.execute(
+                f"SELECT chunk_id FROM chunk_hashes WHERE source IN ({placeholders})",
+                batch,
+            ))
+    return sorted(ids)
+
+
+def forget(ids, generation: int | None = None):
+    """
+    Drops deleted chunks so their content can be ingested again.
+    """
+    with closing(_connect()) as conn, conn:
+        conn.executemany(
+            "DELETE FROM chunk_hashes WHERE chunk_id = ?",
+            [(int(cid),) for cid in ids],
+        )
+        _set_meta(conn, "content_generation", generation)
+
+
+def find_known(chunks: list[dict], across_sources: bool = False) -> list[bool]:
+    """
+    For each chunk, whether its hash is already stored.
+    By default a hash only counts as known within the same source.
+    """
+    hashes = list({c["chunk_hash"] for c in chunks if c.get("chunk_hash")})
+    found = set()
+
+    with closing(_connect()) as conn:
+        for i in range(0, len(hashes), _LOOKUP_BATCH):
+            batch = hashes[i:i + _LOOKUP_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            found.update(conn.execute(
+                f"SELECT chunk_hash, source FROM chunk_hashes WHERE chunk_hash IN ({placeholders})",
+                batch,
+            ).fetchall())
+
+    known_hashes = {h for h, _ in found}
+
+    result = []
+    for c in chunks:
+        h = c.get("chunk_hash")
+        if not h:
+            result.append(False)
+        elif across_sources:
+            result.append(h in known_hashes)
+        else:
+            result.append((h, c.get("source")) in found)
+    return result
@@ -1,41 +1,59 @@
-import os
-import faiss
-import pickle
+import numpy as np
 from app.rag.chunking import clean_extracted_text, chunk_sections_safely
 from app.rag.utils import hash_text
-from app.memory.utils import DOCS_PATH, INDEX_PATH
-
-_model = None
-
-
-def get_embedding_model():
-    global _model
-    if _model is None:
-        from sentence_transformers import SentenceTransformer
-        _model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-    return _model
-
-
-def load_or_create_index(dim: int):
-    if INDEX_PATH.exists():
-        return faiss.read_index(str(INDEX_PATH))
-    return faiss.IndexFlatL2(dim)
+from app.rag.store import commit_segment, sync_hash_index
+from app.rag.hash_index import find_known
+from app.rag.embedding_cache import get_embedding_cache
+from app.rag.embedding_service import get_embedding_service
+from app.memory.utils import DEDUP_ACROSS_SOURCES, EMBED_BATCH_SIZE
+
+# Chunks embedded between progress callbacks (a multiple of the encode batch)
+_PROGRESS_SLICE = 8 * EMBED_BATCH_SIZE
+
+
+def embed_chunks(chunks: list[dict], show_progress_bar: bool = False) -> np.ndarray:
+    """
+    Embeds chunk texts, reusing cached vectors by text hash
+    (chunk_hash also covers filename/page and is only for dedup).
+    Only cache misses go through model.encode.
+    """
+    cache = get_embedding_cache()
+    hashes = [hash_text(c["text"]) for c in chunks]
+
+    if cache is not None:
+        vectors, hit = cache.lookup(hashes)
+    else:
+        vectors, hit = None, np.zeros(len(chunks), dtype=bool)
+
+    misses = np.flatnonzero(~hit)
+    if len(misses) == 0:
+        return vectors
+
+    model = get_embedding_service()
+    encoded = model.encode(
+        [chunks[i]["text"] for i in misses],
+        batch_size=EMBED_BATCH_SIZE,
+        show_progress_bar=show_progress_bar,
+        normalize_embeddings=True,
+    )
+    encoded = np.asarray(encoded, dtype="float32")
 
+    if cache is not None:
+        cache.put([hashes[i] for i in misses], encoded)
 
+    if vectors is None:
+        return encoded
 
-def load_existing_docs():
-    if os.path.exists(DOCS_PATH):
-        with open(DOCS_PATH, "rb") as f:
-            return pickle.load(f)
-    return []
+    vectors[misses] = encoded
+    return vectors
 
 
-def ingest_text(
+def text_to_chunks(
     text: str,
     source: str,
     page: int | None = None,
     location: str | None = None,
-):
+) -> list[dict]:
     clean_text = clean_extracted_text(text)
     section_chunks = chunk_sections_safely(clean_text)
 
@@ -57,56 +75,133 @@ def ingest_text(
             "chunk_id": f"{source}_p{page}_s{i}" if page is not None else f"{source}_s{i}",
         })
 
-    return ingest_chunks(chunks_with_meta)
+    return chunks_with_meta
 
 
-def ingest_chunks(chunks_with_meta: list[dict]) -> int:
-    if not chunks_with_meta:
-        return 0
-
-    os.makedirs("store", exist_ok=True)
+def pages_to_chunks(
+    pages: list[dict],
+    source: str,
+    location: str | None = None,
+) -> list[dict]:
+    """
+    Chunks every page of one document ({"text", "page"} dicts,
+    as returned by the loaders).
+    """
+    chunks_with_meta = []
+    for p in pages:
+        chunks_with_meta.extend(
+            text_to_chunks(p["text"], source, page=p.get("page"), location=location)
+        )
+    return chunks_with_meta
 
-    existing_docs = load_existing_docs()
-    existing_hashes = {
-        d["chunk_hash"]
-        for d in existing_docs
-        if d.get("chunk_hash") and d.get("source") == chunks_with_meta[0].get("source")
-    }
 
+def ingest_text(
+    text: str,
+    source: str,
+    page: int | None = None,
+    location: str | None = None,
+):
+    from app.rag.pipeline import ingest_stream, text_chunker
 
-    new_chunks = []
-    new_texts = []
+    return ingest_stream(
+        [{"text": text, "page": page}],
+        text_chunker(source, location),
+    )
 
-    for c in chunks_with_meta:
-        chunk_hash = c.get("chunk_hash")
-        if chunk_hash and chunk_hash in existing_hashes:
-            continue
-        new_chunks.append(c)
-        new_texts.append(c["text"])
 
-    if not new_chunks:
-        return 0
+def ingest_pages(
+    pages: list[dict],
+    source: str,
+    location: str | None = None,
+) -> int:
+    """
+    Document-level ingest for all pages of a file.
+    `pages` may be a generator (e.g. iter_pdf_sections); it is
+    streamed through the bounded pipeline in app/rag/pipeline.py.
+    """
+    from app.rag.pipeline import ingest_stream, text_chunker
+
+    return ingest_stream(pages, text_chunker(source, location))
+
+
+def ingest_chunks(chunks_with_meta: list[dict], across_sources: bool = DEDUP_ACROSS_SOURCES) -> int:
+    return ingest_chunk_batches({None: chunks_with_meta}, across_sources)[None]
+
+
+def ingest_chunk_batches(
+    batches: dict,
+    across_sources: bool = DEDUP_ACROSS_SOURCES,
+    progress=None,
+    replace: bool = False,
+) -> dict:
+    """
+    Ingests chunks from several files at once.
+    All new chunks are embedded in one encode pass and committed
+    as a single segment. Returns new chunk counts per batch key.
+
+    progress, if given, is called with {key: chunks embedded so far}
+    as embedding advances.
+
+    replace=True treats the chunks as the new full version of their
+    sources: previously stored chunks of those sources are deleted
+    in the same commit (unchanged chunks come from the embedding cache).
+    """
+    counts = {key: 0 for key in batches}
+    keyed_chunks = [
+        (key, c)
+        for key, chunks in batches.items()
+        for c in chunks
+    ]
+    if not keyed_chunks:
+        return counts
+
+    if replace:
+        known = [False] * len(keyed_chunks)
+    else:
+        sync_hash_index()
+        known = find_known([c for _, c in keyed_chunks], across_sources=across_sources)
 
-    model = get_embedding_model()
-    embeddings = model.encode(
-        new_texts,
-        batch_size=32,
-        show_progress_bar=True,
-        normalize_embeddings=True,
-    )
+    new_chunks = []
+    new_keys = []
+    seen = set()
 
-    index = load_or_create_index(embeddings.shape[1])
-    index.add(embeddings)
+    for (key, c), is_known in zip(keyed_chunks, known):
+        if is_known:
+            continue
 
-    existing_docs.extend(new_chunks)
+        # Also dedup inside the batch itself
+        chunk_hash = c.get("chunk_hash")
+        if chunk_hash:
+            dedup_key = chunk_hash if across_sources else (chunk_hash, c.get("source"))
+            if dedup_key in seen:
+                continue
+            seen.add(dedup_key)
 
-    faiss.write_index(index, str(INDEX_PATH))
-    with open(DOCS_PATH, "wb") as f:
-        pickle.dump(existing_docs, f)
-    
-    index = faiss.read_index(str(INDEX_PATH))
-    print("FAISS index size:", index.ntotal)
-    print("Docs stored:", len(load_existing_docs()))
+        new_chunks.append(c)
+        new_keys.append(key)
+        counts[key] += 1
 
+    replace_sources = sorted({c.get("source") for _, c in keyed_chunks}) if replace else ()
 
-    return len(new_chunks)
+    if not new_chunks:
+        return counts
+
+    if progress is None:
+        embeddings = embed_chunks(new_chunks, show_progress_bar=True)
+    else:
+        parts = []
+        embedded = {key: 0 for key in batches}
+        for start in range(0, len(new_chunks), _PROGRESS_SLICE):
+            end = start + _PROGRESS_SLICE
+            parts.append(embed_chunks(new_chunks[start:end]))
+            for key in new_keys[start:end]:
+                embedded[key] += 1
+            progress(dict(embedded))
+        embeddings = np.concatenate(parts)
+
+    # Append-only: only the new batch is written
+    manifest = commit_segment(embeddings, new_chunks, replace_sources=replace_sources)
+    print("Segments:", len(manifest["segments"]))
+    print("Docs stored:", sum(s["rows"] for s in manifest["segments"]))
+
+    return counts
@@ -0,0 +1,457 @@
+import itertools
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+from app.rag.ingest import ingest_chunk_batches
+from app.rag.pipeline import ingest_stream, iter_document_pages
+from app.rag.utils import chunk_text, hash_text
+from app.rag.loaders.pdf_loader import extract_pdf_sections
+from app.rag.loaders.docx_loader import extract_docx_text
+from app.rag.loaders.excel_loader import extract_excel_text
+from app.report.extractor import extract_docx_sections
+from app.memory.session_store import set_session_value
+from app.memory.utils import INGEST_JOBS_PATH, INGEST_WORKERS
+
+# -------------------------------------------------
+# Asynchronous ingestion jobs
+#
+# /ingest saves the uploads and returns a job id; a worker
+# pool extracts, embeds and commits them. Active jobs are kept
+# in memory and mirrored to SQLite so unfinished jobs are
+# re-queued after a restart (re-running is safe: chunks that
+# were already committed are skipped by the hash index).
+# Finished jobs are only kept in SQLite.
+# -------------------------------------------------
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+_executor = None
+
+ACTIVE_STATUSES = ("queued", "running")
+# Final job statuses: every file ingested / some / none
+FINAL_STATUSES = ("completed", "partial", "failed")
+
+
+# -------------------------------------------------
+# Extraction (shared with synchronous /ingest)
+# -------------------------------------------------
+def _activate_document(session_id: str, filename: str, file_path: str):
+    """
+    Makes the upload the session's active document (reports, filters).
+    """
+    name = filename.lower()
+
+    if name.endswith(".pdf"):
+        # Set active PDF for this session and invalidate cached section list
+        set_session_value(session_id, "active_pdf", filename)
+        set_session_value(session_id, "active_doc_type", "pdf")
+        set_session_value(session_id, "available_sections", None)
+
+    elif name.endswith(".docx"):
+        sections = extract_docx_sections(file_path)
+
+        set_session_value(session_id, "active_pdf", filename)
+        set_session_value(session_id, "docx_sections", sections)
+        set_session_value(session_id, "active_doc_type", "docx")
+
+
+def upload_chunker(filename: str):
+    """
+    Chunks one page of an upload. PDF "pages" from the loader are
+    already section chunks; other types are split into word windows.
+    """
+    location = f"http://api:8000/files/{filename}"
+
+    if filename.lower().endswith(".pdf"):
+        def chunker(chunk: dict):
+            return [{**chunk, "location": location}]
+        return chunker
+
+    # Chunk numbering continues across blocks of the same page
+    next_index = {}
+
+    def chunker(p: dict):
+        chunks_with_meta = []
+        page = p.get("page")
+        for ch in chunk_text(p["text"]):
+            c_idx = next_index.get(page, 0)
+            next_index[page] = c_idx + 1
+            chunks_with_meta.append({
+                "chunk_id": f"{filename}_p{page}_c{c_idx}",
+                "chunk_hash": hash_text(
+                    f"{filename}|{page}|{ch}"
+                ),
+                "text": ch,
+                "source": filename,
+                "page": page,
+                "location": location
+            })
+        return chunks_with_meta
+
+    return chunker
+
+
+def extract_upload(file_path: str, filename: str, session_id: str):
+    """
+    Extracts chunks from one saved upload and updates the
+    session's active document. Returns None for unsupported types.
+    """
+    name = filename.lower()
+    chunker = upload_chunker(filename)
+
+    if name.endswith(".pdf"):
+        chunks_with_meta = extract_pdf_sections(
+            file_path=file_path,
+            source_name=filename
+        )
+        print("PDF EXTRACT COUNT:", len(chunks_with_meta))
+
+        if not chunks_with_meta:
+            raise ValueError("No extractable text found in PDF")
+
+        _activate_document(session_id, filename, file_path)
+        return [c for chunk in chunks_with_meta for c in chunker(chunk)]
+
+    if name.endswith(".txt"):
+        with open(file_path, "r", encoding="utf-8") as f:
+            pages = [{"text": f.read(), "page": None}]
+
+    elif name.endswith(".docx"):
+        pages = extract_docx_text(file_path)
+
+    elif name.endswith(".xlsx"):
+        pages = extract_excel_text(file_path)
+
+    else:
+        return None
+
+    _activate_document(session_id, filename, file_path)
+    return [c for p in pages for c in chunker(p)]
+
+
+def open_upload(file_path: str, filename: str, session_id: str):
+    """
+    Streaming counterpart of extract_upload: (pages, chunker) for
+    ingest_stream, or None for unsupported types.
+    """
+    name = filename.lower()
+    if not name.endswith((".pdf", ".txt", ".docx", ".xlsx")):
+        return None
+
+    pages = iter_document_pages(file_path, filename)
+
+    if name.endswith(".pdf"):
+        # Fail before anything is committed (or replaced)
+        first = next(pages, None)
+        if first is None:
+            raise ValueError("No extractable text found in PDF")
+        pages = itertools.chain([first], pages)
+
+    _activate_document(session_id, filename, file_path)
+    return pages, upload_chunker(filename)
+
+
+# -------------------------------------------------
+# Persistence
+# -------------------------------------------------
+def _connect():
+    INGEST_JOBS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(INGEST_JOBS_PATH), timeout=30)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            data TEXT NOT NULL
+        )
+    """)
+    return conn
+
+
+def _save(job: dict):
+    job["updated_at"] = time.time()
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO jobs (id, status, created_at, data) VALUES (?, ?, ?, ?)",
+            (job["job_id"], job["status"], job["created_at"], json.dumps(job)),
+        )
+
+
+def _update(job_id: str, **fields):
+    with _jobs_lock:
+        job = _jobs[job_id]
+        job.update(fields)
+        _save(job)
+
+
+def _update_file(job_id: str, index: int, **fields):
+    with _jobs_lock:
+        job = _jobs[job_id]
+        job["files"][index].update(fields)
+        _save(job)
+
+
+# -------------------------------------------------
+# API
+# -------------------------------------------------
+def create_job(
+    session_id: str,
+    files: list[dict],
+    batch: bool = True,
+    replace: bool = True,
+) -> str:
+    """
+    files: [{"filename": ..., "path": <saved upload path>}]
+    replace: a re-uploaded file replaces the stored chunks of the
+    same source instead of being added next to them.
+    """
+    job_id = uuid.uuid4().hex
+    job = {
+        "job_id": job_id,
+        "session_id": session_id,
+        "status": "queued",
+        "batch": batch,
+        "replace": replace,
+        "created_at": time.time(),
+        "error": None,
+        "files": [
+            {
+                "filename": f["filename"],
+                "path": str(f["path"]),
+                "status": "queued",
+                "pages_extracted": 0,
+                "chunks_extracted": 0,
+                "chunks_embedded": 0,
+                "committed": False,
+            }
+            for f in files
+        ],
+    }
+    with _jobs_lock:
+        _jobs[job_id] = job
+        _save(job)
+    return job_id
+
+
+def get_job(job_id: str) -> dict | None:
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            return json.loads(json.dumps(job))
+
+    with closing(_connect()) as conn:
+        row = conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=INGEST_WORKERS,
+            thread_name_prefix="ingest-job",
+        )
+    return _executor
+
+
+def submit_job(job_id: str):
+    _get_executor().submit(run_job, job_id)
+
+
+def resume_jobs() -> int:
+    """
+    Re-queues jobs that were queued or running when the process stopped.
+    """
+    with closing(_connect()) as conn:
+        rows = conn.execute(
+            f"SELECT data FROM jobs WHERE status IN ({','.join('?' * len(ACTIVE_STATUSES))}) "
+            "ORDER BY created_at",
+            ACTIVE_STATUSES,
+        ).fetchall()
+
+    for (data,) in rows:
+        job = json.loads(data)
+        job["status"] = "queued"
+        for f in job["files"]:
+            if f["status"] not in ("ingested", "skipped", "failed"):
+                f.update(status="queued", chunks_embedded=0)
+        with _jobs_lock:
+            _jobs[job["job_id"]] = job
+            _save(job)
+        submit_job(job["job_id"])
+
+    return len(rows)
+
+
+# -------------------------------------------------
+# Worker
+# -------------------------------------------------
+def _commit(job_id: str, pending: dict):
+    """
+    Embeds and commits every extracted file in `pending` at once.
+    pending: file index -> chunks
+    """
+    if not pending:
+        return
+
+    for i in pending:
+        _update_file(job_id, i, status="embedding")
+
+    def progress(embedded: dict):
+        for i, n in embedded.items():
+            _update_file(job_id, i, chunks_embedded=n)
+
+    try:
+        counts = ingest_chunk_batches(
+            pending,
+            progress=progress,
+            replace=_jobs[job_id].get("replace", False),
+        )
+    except Exception as e:
+        for i in pending:
+            _update_file(job_id, i, status="failed", error=str(e))
+    else:
+        for i, n in counts.items():
+            _update_file(job_id, i, status="ingested", chunks_created=n, committed=True)
+            print("INGESTED CHUNKS:", n, "SOURCE:", _jobs[job_id]["files"][i]["filename"])
+
+    pending.clear()
+
+
+def _stream_file(job_id: str, index: int, f: dict, session_id: str):
+    """
+    Per-file mode: streams one upload through the bounded pipeline
+    (app/rag/pipeline.py), so neither its chunks nor its embeddings
+    are held in memory all at once.
+    """
+    _update_file(job_id, index, status="extracting")
+    try:
+        opened = open_upload(f["path"], f["filename"], session_id)
+    except Exception as e:
+        _update_file(job_id, index, status="failed", error=str(e))
+        return
+
+    if opened is None:
+        _update_file(job_id, index, status="skipped", reason="Unsupported file type")
+        return
+
+    pages, chunker = opened
+    seen_pages = set()
+    extracted = 0
+
+    def counting_chunker(page):
+        nonlocal extracted
+        chunks = chunker(page)
+        extracted += len(chunks)
+        seen_pages.update(c.get("page") for c in chunks)
+        return chunks
+
+    def progress(committed: int):
+        _update_file(
+            job_id, index,
+            status="embedding",
+            pages_extracted=len(seen_pages),
+            chunks_extracted=extracted,
+            chunks_embedded=committed,
+        )
+
+    replace = _jobs[job_id].get("replace", False)
+    try:
+        n = ingest_stream(
+            pages,
+            counting_chunker,
+            replace_sources=[f["filename"]] if replace else (),
+            progress=progress,
+        )
+    except Exception as e:
+        _update_file(job_id, index, status="failed", error=str(e))
+        return
+
+    _update_file(
+        job_id, index,
+        status="ingested",
+        pages_extracted=len(seen_pages),
+        chunks_extracted=extracted,
+        chunks_created=n,
+        committed=True,
+    )
+    print("INGESTED CHUNKS:", n, "SOURCE:", f["filename"])
+
+
+def _final_status(files: list[dict]) -> tuple[str, str | None]:
+    """
+    (status, error) of a finished job, derived from its files.
+    """
+    not_ingested = [f for f in files if f["status"] != "ingested"]
+    if not not_ingested:
+        return "completed", None
+
+    error = "; ".join(
+        f"{f['filename']}: {f.get('error') or f.get('reason') or f['status']}"
+        for f in not_ingested
+    )
+    if len(not_ingested) == len(files):
+        return "failed", error
+    return "partial", error
+
+
+def run_job(job_id: str) -> dict:
+    job = get_job(job_id)
+    if job is None:
+        raise KeyError(job_id)
+
+    with _jobs_lock:
+        # Jobs loaded back from SQLite are tracked again while they run
+        _jobs.setdefault(job_id, job)
+    pending = {}
+
+    try:
+        _update(job_id, status="running")
+
+        for i, f in enumerate(job["files"]):
+            if f["status"] in ("ingested", "skipped", "failed"):
+                continue
+
+            # Per-file mode: stream each file straight into the store
+            if not job["batch"]:
+                _stream_file(job_id, i, f, job["session_id"])
+                continue
+
+            _update_file(job_id, i, status="extracting")
+            try:
+                chunks_with_meta = extract_upload(f["path"], f["filename"], job["session_id"])
+            except Exception as e:
+                _update_file(job_id, i, status="failed", error=str(e))
+                continue
+
+            if chunks_with_meta is None:
+                _update_file(job_id, i, status="skipped", reason="Unsupported file type")
+                continue
+
+            pending[i] = chunks_with_meta
+            _update_file(
+                job_id, i,
+                status="extracted",
+                pages_extracted=len({c.get("page") for c in chunks_with_meta}),
+                chunks_extracted=len(chunks_with_meta),
+            )
+
+        # Batch mode: one embedding pass and one commit for the whole job
+        # (all files appear together, at the cost of holding them in memory)
+        _commit(job_id, pending)
+        status, error = _final_status(_jobs[job_id]["files"])
+        _update(job_id, status=status, error=error)
+
+    except Exception as e:
+        _update(job_id, status="failed", error=str(e))
+
+    finally:
+        with _jobs_lock:
+            _jobs.pop(job_id, None)
+
+    return get_job(job_id)
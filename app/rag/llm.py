@@ -1,22 +1,178 @@
-import requests, json
-from app.memory.utils import OLLAMA_BASE_URL
-
-
-def call_llm(prompt: str) -> dict:
-    res = requests.post(
-        f"{OLLAMA_BASE_URL}/api/generate",
-        json={
-            "model": "llama3.1:8b",
-            "prompt": prompt,
-            "stream": False,
-            "temperature": 0
-        },
-        timeout=60
-    )
+import asyncio
+import json
+import random
+import threading
+import time
+
+import httpx
+
+from app.memory.utils import (
+    MODEL_NAME,
+    OLLAMA_BASE_URL,
+    OLLAMA_CONNECT_TIMEOUT,
+    OLLAMA_KEEPALIVE_EXPIRY,
+    OLLAMA_MAX_CONNECTIONS,
+    OLLAMA_MAX_KEEPALIVE,
+    OLLAMA_POOL_TIMEOUT,
+    OLLAMA_READ_TIMEOUT,
+    OLLAMA_RETRIES,
+    OLLAMA_RETRY_BACKOFF,
+)
+from app.rag.scheduler import get_scheduler
+
+# -------------------------------------------------
+# Ollama client
+#
+# One keep-alive connection pool per process: an httpx.AsyncClient
+# for the async endpoints (an awaiting request holds no thread, so
+# one worker can have hundreds of generations in flight) and an
+# httpx.Client for sync callers running in worker threads.
+#
+# Connection errors and 429/502/503/504 are retried with
+# exponential backoff and full jitter. Read timeouts are not
+# retried: the model was busy generating, a retry only queues
+# the same work again.
+#
+# Every call first takes a slot from the LLM scheduler
+# (app/rag/scheduler.py) under its priority class: call_llm and
+# streams are "chat", call_llm_function "planner", call_llm_raw
+# "summarize" unless told otherwise.
+# -------------------------------------------------
+
+RETRY_STATUS = {429, 502, 503, 504}
+RETRY_ERRORS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.PoolTimeout,
+    httpx.ReadError,
+    httpx.WriteError,
+    httpx.RemoteProtocolError,
+)
+
+_client = None
+_async_client = None
+_async_loop = None
+_client_lock = threading.Lock()
+
+
+def _client_options() -> dict:
+    return {
+        "base_url": OLLAMA_BASE_URL,
+        "timeout": httpx.Timeout(
+            OLLAMA_READ_TIMEOUT,
+            connect=OLLAMA_CONNECT_TIMEOUT,
+            pool=OLLAMA_POOL_TIMEOUT,
+        ),
+        "limits": httpx.Limits(
+            max_connections=OLLAMA_MAX_CONNECTIONS,
+            max_keepalive_connections=OLLAMA_MAX_KEEPALIVE,
+            keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY,
+        ),
+    }
+
+
+def get_client() -> httpx.Client:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = httpx.Client(**_client_options())
+        return _client
+
 
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Pooled async client, bound to the running event loop.
+    """
+    global _async_client, _async_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_loop is not loop:
+        _async_client = httpx.AsyncClient(**_client_options())
+        _async_loop = loop
+    return _async_client
+
+
+async def aclose_clients():
+    global _client, _async_client, _async_loop
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client, _async_loop = None, None
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, OLLAMA_RETRY_BACKOFF * (2 ** attempt))
+
+
+def _check(res: httpx.Response, label: str = "Ollama error: "):
     if res.status_code != 200:
-        raise RuntimeError(f"Ollama error: {res.text}")
+        raise RuntimeError(f"{label}{res.text}")
+
+
+def _post(path: str, payload: dict, priority: str, session_id: str | None) -> httpx.Response:
+    client = get_client()
+    with get_scheduler().slot(priority, session_id):
+        for attempt in range(OLLAMA_RETRIES + 1):
+            last = attempt == OLLAMA_RETRIES
+            try:
+                res = client.post(path, json=payload)
+            except RETRY_ERRORS as e:
+                if last:
+                    raise
+                print(f"OLLAMA RETRY {attempt + 1}: {type(e).__name__}")
+            else:
+                if res.status_code not in RETRY_STATUS or last:
+                    return res
+                print(f"OLLAMA RETRY {attempt + 1}: HTTP {res.status_code}")
+            time.sleep(_backoff(attempt))
+
 
+async def _apost(path: str, payload: dict, priority: str, session_id: str | None) -> httpx.Response:
+    client = get_async_client()
+    async with get_scheduler().aslot(priority, session_id):
+        for attempt in range(OLLAMA_RETRIES + 1):
+            last = attempt == OLLAMA_RETRIES
+            try:
+                res = await client.post(path, json=payload)
+            except RETRY_ERRORS as e:
+                if last:
+                    raise
+                print(f"OLLAMA RETRY {attempt + 1}: {type(e).__name__}")
+            else:
+                if res.status_code not in RETRY_STATUS or last:
+                    return res
+                print(f"OLLAMA RETRY {attempt + 1}: HTTP {res.status_code}")
+            await asyncio.sleep(_backoff(attempt))
+
+
+# -------------------------------------------------
+# Payloads / response parsing (shared by sync and async calls)
+# -------------------------------------------------
+def _generate_payload(prompt: str, stream: bool = False) -> dict:
+    return {
+        "model": MODEL_NAME,
+        "prompt": prompt,
+        "stream": stream,
+        "temperature": 0
+    }
+
+
+def _chat_payload(system_prompt, user_prompt, tools) -> dict:
+    return {
+        "model": MODEL_NAME,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        "tools": tools,
+        "stream": False,
+    }
+
+
+def _parse_answer(res: httpx.Response) -> dict:
+    _check(res)
     raw = res.json().get("response", "").strip()
 
     # Case 1: Valid JSON
@@ -33,55 +189,17 @@ def call_llm(prompt: str) -> dict:
                 }
             ]
         }
-    return response
 
-def call_llm_raw(prompt: str) -> str:
-    # response should already be parsed JSON
 
-    """
-    Raw LLM call for controlled tasks like summarization.
-    Uses the SAME Ollama /api/generate endpoint as call_llm,
-    but returns plain text instead of JSON.
-    """
-
-    res = requests.post(
-        f"{OLLAMA_BASE_URL}/api/generate",
-        json={
-            "model": "llama3.1:8b",
-            "prompt": prompt,
-            "stream": False,
-            "temperature": 0
-        },
-        timeout=60
-    )
-
-    if res.status_code != 200:
-        raise RuntimeError(f"Ollama error: {res.text}")
+def _parse_raw(res: httpx.Response) -> str:
+    _check(res)
 
     # IMPORTANT: for /api/generate, summary text is here
     return res.json().get("response", "").strip()
 
 
-
-def call_llm_function(system_prompt, user_prompt, tools):
-    payload = {
-        "model": "llama3.1:8b",
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        "tools": tools,
-        "stream": False,
-    }
-
-    res = requests.post(
-        f"{OLLAMA_BASE_URL}/api/chat",
-        json=payload,
-        timeout=60,
-    )
-
-    if res.status_code != 200:
-        raise RuntimeError(res.text)
+def _parse_function(res: httpx.Response):
+    _check(res, label="")
 
     data = res.json()
     print("🧠 RAW CHAT RESPONSE:", data)
@@ -105,3 +223,121 @@ def call_llm_function(system_prompt, user_prompt, tools):
             pass
 
     raise ValueError("LLM returned neither tool_calls nor valid JSON")
+
+
+def _parse_stream_line(line: str):
+    if not line:
+        return None, False
+    data = json.loads(line)
+    if data.get("error"):
+        raise RuntimeError(f"Ollama error: {data['error']}")
+    return data.get("response") or None, bool(data.get("done"))
+
+
+# -------------------------------------------------
+# Sync API (worker threads, background jobs)
+# -------------------------------------------------
+def call_llm(prompt: str, session_id: str | None = None) -> dict:
+    # response should already be parsed JSON
+    return _parse_answer(_post("/api/generate", _generate_payload(prompt), "chat", session_id))
+
+
+def call_llm_raw(prompt: str, priority: str = "summarize", session_id: str | None = None) -> str:
+    """
+    Raw LLM call for controlled tasks like summarization.
+    Uses the SAME Ollama /api/generate endpoint as call_llm,
+    but returns plain text instead of JSON.
+    """
+    return _parse_raw(_post("/api/generate", _generate_payload(prompt), priority, session_id))
+
+
+def call_llm_function(system_prompt, user_prompt, tools, priority: str = "planner", session_id: str | None = None):
+    return _parse_function(
+        _post("/api/chat", _chat_payload(system_prompt, user_prompt, tools), priority, session_id)
+    )
+
+
+def stream_llm(prompt: str, session_id: str | None = None):
+    """
+    Same request as call_llm, streamed: yields the response text
+    piece by piece as Ollama generates it (NDJSON lines). Retries
+    only until the first piece has been yielded.
+    """
+    client = get_client()
+    payload = _generate_payload(prompt, stream=True)
+    started = False
+
+    with get_scheduler().slot("chat", session_id):
+        for attempt in range(OLLAMA_RETRIES + 1):
+            last = attempt == OLLAMA_RETRIES
+            try:
+                with client.stream("POST", "/api/generate", json=payload) as res:
+                    if res.status_code in RETRY_STATUS and not last:
+                        print(f"OLLAMA RETRY {attempt + 1}: HTTP {res.status_code}")
+                    else:
+                        if res.status_code != 200:
+                            res.read()
+                        _check(res)
+
+                        for line in res.iter_lines():
+                            piece, done = _parse_stream_line(line)
+                            if piece:
+                                started = True
+                                yield piece
+                            if done:
+                                break
+                        return
+            except RETRY_ERRORS as e:
+                if last or started:
+                    raise
+                print(f"OLLAMA RETRY {attempt + 1}: {type(e).__name__}")
+            time.sleep(_backoff(attempt))
+
+
+# -------------------------------------------------
+# Async API (FastAPI endpoints)
+# -------------------------------------------------
+async def acall_llm(prompt: str, session_id: str | None = None) -> dict:
+    return _parse_answer(await _apost("/api/generate", _generate_payload(prompt), "chat", session_id))
+
+
+async def acall_llm_raw(prompt: str, priority: str = "summarize", session_id: str | None = None) -> str:
+    return _parse_raw(await _apost("/api/generate", _generate_payload(prompt), priority, session_id))
+
+
+async def acall_llm_function(system_prompt, user_prompt, tools, priority: str = "planner", session_id: str | None = None):
+    return _parse_function(
+        await _apost("/api/chat", _chat_payload(system_prompt, user_prompt, tools), priority, session_id)
+    )
+
+
+async def astream_llm(prompt: str, session_id: str | None = None):
+    client = get_async_client()
+    payload = _generate_payload(prompt, stream=True)
+    started = False
+
+    async with get_scheduler().aslot("chat", session_id):
+        for attempt in range(OLLAMA_RETRIES + 1):
+            last = attempt == OLLAMA_RETRIES
+            try:
+                async with client.stream("POST", "/api/generate", json=payload) as res:
+                    if res.status_code in RETRY_STATUS and not last:
+                        print(f"OLLAMA RETRY {attempt + 1}: HTTP {res.status_code}")
+                    else:
+                        if res.status_code != 200:
+                            await res.aread()
+                        _check(res)
+
+                        async for line in res.aiter_lines():
+                            piece, done = _parse_stream_line(line)
+                            if piece:
+                                started = True
+                                yield piece
+                            if done:
+                                break
+                        return
+            except RETRY_ERRORS as e:
+                if last or started:
+                    raise
+                print(f"OLLAMA RETRY {attempt + 1}: {type(e).__name__}")
+            await asyncio.sleep(_backoff(attempt))
@@ -1,23 +1,28 @@
 import pandas as pd
 
-def extract_excel_text(file_path: str):
-    sheets = pd.read_excel(file_path, sheet_name=None)
-    rows_as_text = []
+def iter_excel_text(file_path: str):
+    """
+    Yields one text row per non-empty spreadsheet row, reading one
+    sheet at a time. Batch and streaming ingest both use this, so a
+    workbook always produces the same chunk text (and chunk_hash).
+    """
+    with pd.ExcelFile(file_path) as xls:
+        for sheet_name in xls.sheet_names:
+            df = xls.parse(sheet_name).dropna(how="all")
 
-    for sheet_name, df in sheets.items():
-        df = df.dropna(how="all")
+            for _, row in df.iterrows():
+                row_text = ", ".join(
+                    f"{col}: {row[col]}"
+                    for col in df.columns
+                    if pd.notna(row[col])
+                )
 
-        for _, row in df.iterrows():
-            row_text = ", ".join(
-                f"{col}: {row[col]}"
-                for col in df.columns
-                if pd.notna(row[col])
-            )
+                if row_text.strip():
+                    yield {
+                        "page": sheet_name,   # use sheet name as page
+                        "text": row_text
+                    }
 
-            if row_text.strip():
-                rows_as_text.append({
-                    "page": sheet_name,   # use sheet name as page
-                    "text": row_text
-                })
 
-    return rows_as_text
+def extract_excel_text(file_path: str):
+    return list(iter_excel_text(file_path))
@@ -1,6 +1,12 @@
+import multiprocessing
 import pdfplumber
 import re
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from app.rag.utils import hash_text
+from app.memory.utils import PDF_EXTRACT_WORKERS, PDF_PARALLEL_MIN_PAGES
 
 
 # -------------------------------------------------
@@ -26,62 +32,189 @@ def is_heading(line: str) -> bool:
     return False
 
 
+# -------------------------------------------------
+# Per-page heading detection
+# -------------------------------------------------
+def _split_page_blocks(raw_text: str):
+    """
+    Splits one page into (section, text) blocks.
+    section is None for text before the first heading on the page,
+    which belongs to whatever section is open at the page boundary.
+    Returns (blocks, last_heading_on_page).
+    """
+    lines = [
+        l.strip()
+        for l in raw_text.split("\n")
+        if l.strip()
+    ]
+
+    blocks = []
+    current_section = None
+    buffer = []
+
+    for line in lines:
+        if is_heading(line):
+            # Flush previous section
+            if buffer:
+                blocks.append((current_section, " ".join(buffer).strip()))
+                buffer = []
+            current_section = line
+        else:
+            buffer.append(line)
+
+    # Flush remaining text on page
+    if buffer:
+        blocks.append((current_section, " ".join(buffer).strip()))
+
+    return blocks, current_section
+
+
+def _iter_page_range(file_path: str, start: int, end: int | None = None):
+    with pdfplumber.open(file_path) as pdf:
+        end = len(pdf.pages) if end is None else end
+        for page_idx in range(start, end):
+            page = pdf.pages[page_idx]
+            raw_text = page.extract_text()
+            # Drop pdfplumber's per-page layout cache as we go
+            page.close()
+            if not raw_text:
+                continue
+            blocks, last_heading = _split_page_blocks(raw_text)
+            yield page_idx, blocks, last_heading
+
+
+def _extract_page_range(file_path: str, start: int, end: int):
+    """
+    Worker: extracts pages [start, end) and runs heading detection.
+    Opens the PDF itself so it can run in a separate process.
+    """
+    return list(_iter_page_range(file_path, start, end))
+
+
+def _merge_pages(pages, source_name: str):
+    """
+    Yields chunks in page order, carrying the open section
+    across page boundaries.
+    """
+    current_section = "Unknown"
+
+    for page_idx, blocks, last_heading in pages:
+        for section, text_block in blocks:
+            if not text_block:
+                continue
+            yield {
+                "text": text_block,
+                "section": section or current_section,
+                "page": page_idx + 1,
+                "source": source_name,
+                "chunk_hash": hash_text(text_block),
+            }
+
+        if last_heading:
+            current_section = last_heading
+
+
+def _page_ranges(n_pages: int, n_parts: int):
+    step = max(1, -(-n_pages // n_parts))
+    return [(s, min(s + step, n_pages)) for s in range(0, n_pages, step)]
+
+
+# -------------------------------------------------
+# Extraction process pool
+#
+# One pool per worker count, shared by every PDF. Workers are
+# started with forkserver (spawn where unavailable), never fork:
+# forking the API process would copy its threads' locks, the
+# loaded model and open FAISS/SQLite handles into the children.
+# -------------------------------------------------
+_pools = {}
+_pools_lock = threading.Lock()
+_MAX_RANGE_PAGES = 16  # pages per task when streaming long PDFs
+
+
+def _mp_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context())
+            _pools[workers] = pool
+        return pool
+
+
+def _discard_pool(workers: int, pool: ProcessPoolExecutor):
+    """
+    Drops a broken pool (a worker died) so the next PDF gets a new one.
+    """
+    with _pools_lock:
+        if _pools.get(workers) is pool:
+            del _pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pdf_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _iter_parallel_pages(file_path: str, n_pages: int, workers: int):
+    """
+    Yields extracted pages in page order from the shared pool.
+    At most 2 ranges per worker are in flight, so a slow consumer
+    (the streaming pipeline) bounds how much text is buffered.
+    """
+    # A few ranges per worker keeps the pool busy when pages differ in cost
+    n_parts = max(workers * 4, -(-n_pages // _MAX_RANGE_PAGES))
+    ranges = iter(_page_ranges(n_pages, n_parts))
+    pool = _get_pool(workers)
+    pending = deque()
+
+    try:
+        for start, end in ranges:
+            pending.append(pool.submit(_extract_page_range, file_path, start, end))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    except BrokenProcessPool:
+        _discard_pool(workers, pool)
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+
+
 # -------------------------------------------------
 # Section-aware PDF text extraction
 # -------------------------------------------------
-def extract_pdf_sections(file_path: str, source_name: str):
+def extract_pdf_sections(file_path: str, source_name: str, workers: int | None = None):
     """
     Extract text from PDF while preserving section structure.
     Returns chunks ready for ingest_chunks().
     """
-    chunks_with_meta = []
+    return list(iter_pdf_sections(file_path, source_name, workers))
+
 
+def iter_pdf_sections(file_path: str, source_name: str, workers: int | None = None):
+    """
+    Yields the chunks of a PDF in page order without holding the
+    whole document. Long PDFs are split into page ranges and
+    extracted in the shared process pool.
+    """
     with pdfplumber.open(file_path) as pdf:
-        for page_idx, page in enumerate(pdf.pages):
-            raw_text = page.extract_text()
+        n_pages = len(pdf.pages)
 
-            if not raw_text:
-                continue
+    workers = workers or PDF_EXTRACT_WORKERS
+    if workers > 1 and n_pages >= PDF_PARALLEL_MIN_PAGES:
+        pages = _iter_parallel_pages(file_path, n_pages, workers)
+    else:
+        pages = _iter_page_range(file_path, 0, n_pages)
 
-            # Preserve line structure
-            lines = [
-                l.strip()
-                for l in raw_text.split("\n")
-                if l.strip()
-            ]
-
-            current_section = "Unknown"
-            buffer = []
-
-            for line in lines:
-                if is_heading(line):
-                    # Flush previous section
-                    if buffer:
-                        text_block = " ".join(buffer).strip()
-                        if text_block:
-                            chunks_with_meta.append({
-                                "text": text_block,
-                                "section": current_section,
-                                "page": page_idx + 1,
-                                "source": source_name,
-                                "chunk_hash": hash_text(text_block),
-                            })
-                        buffer = []
-
-                    current_section = line
-                else:
-                    buffer.append(line)
-
-            # Flush remaining text on page
-            if buffer:
-                text_block = " ".join(buffer).strip()
-                if text_block:
-                    chunks_with_meta.append({
-                        "text": text_block,
-                        "section": current_section,
-                        "page": page_idx + 1,
-                        "source": source_name,
-                        "chunk_hash": hash_text(text_block),
-                    })
-
-    return chunks_with_meta
+    yield from _merge_pages(pages, source_name)
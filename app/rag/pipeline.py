@@ -0,0 +1,243 @@
+import queue
+import threading
+
+import numpy as np
+
+from app.rag.ingest import embed_chunks, text_to_chunks
+from app.rag.hash_index import find_known
+from app.rag.store import commit_segment, delete_source, load_manifest, sync_hash_index
+from app.rag.loaders.pdf_loader import iter_pdf_sections
+from app.rag.loaders.docx_loader import iter_docx_text
+from app.rag.loaders.excel_loader import iter_excel_text
+from app.memory.utils import (
+    DEDUP_ACROSS_SOURCES,
+    EMBED_BATCH_SIZE,
+    PIPELINE_QUEUE_SIZE,
+    PIPELINE_SEGMENT_CHUNKS,
+)
+
+# -------------------------------------------------
+# Streaming ingestion pipeline
+#
+#   extract -> clean/chunk -> embed -> index
+#
+# Each stage runs in its own thread and hands items to the
+# next through a bounded queue, so a slow stage blocks the
+# ones before it (backpressure) and memory stays flat
+# regardless of document size. Extraction of page N+1
+# overlaps with embedding of page N.
+# -------------------------------------------------
+
+_DONE = object()
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _staged(iterable, maxsize: int = PIPELINE_QUEUE_SIZE):
+    """
+    Runs `iterable` in a background thread behind a bounded queue.
+    Errors in the stage are re-raised in the consumer; if the
+    consumer stops early the stage is told to stop too.
+    """
+    q = queue.Queue(maxsize)
+    stop = threading.Event()
+    errors = []
+
+    def pump():
+        try:
+            for item in iterable:
+                if not _put(q, item, stop):
+                    break
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            if hasattr(iterable, "close"):
+                iterable.close()
+            _put(q, _DONE, stop)
+
+    t = threading.Thread(target=pump, daemon=True)
+    t.start()
+
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                break
+            yield item
+    finally:
+        stop.set()
+        t.join()
+
+    if errors:
+        raise errors[0]
+
+
+def _chunk_stage(pages, chunker):
+    for page in pages:
+        yield from chunker(page)
+
+
+def _embed_stage(chunks, across_sources: bool, dedup_store: bool = True):
+    seen = set()
+    pending = []
+
+    def encode(batch):
+        if dedup_store:
+            known = find_known(batch, across_sources=across_sources)
+        else:
+            known = [False] * len(batch)
+        new_chunks = []
+        for c, is_known in zip(batch, known):
+            if is_known:
+                continue
+            chunk_hash = c.get("chunk_hash")
+            if chunk_hash:
+                key = chunk_hash if across_sources else (chunk_hash, c.get("source"))
+                if key in seen:
+                    continue
+                seen.add(key)
+            new_chunks.append(c)
+
+        if not new_chunks:
+            return None
+
+        return embed_chunks(new_chunks), new_chunks
+
+    for c in chunks:
+        pending.append(c)
+        if len(pending) >= EMBED_BATCH_SIZE:
+            out = encode(pending)
+            pending = []
+            if out:
+                yield out
+
+    if pending:
+        out = encode(pending)
+        if out:
+            yield out
+
+
+def ingest_stream(
+    pages,
+    chunker,
+    across_sources: bool = DEDUP_ACROSS_SOURCES,
+    segment_chunks: int = PIPELINE_SEGMENT_CHUNKS,
+    replace_sources=(),
+    progress=None,
+) -> int:
+    """
+    Ingests an iterable of pages without materializing the document.
+    `chunker(page)` returns the chunk dicts for one page.
+    A segment is committed every `segment_chunks` new chunks.
+    Returns the number of new chunks.
+
+    replace_sources: the stream is the new full version of these
+    sources. Chunks stored before the stream started are tombstoned
+    by the last commit; until then readers keep seeing the old
+    version (next to any new segments already committed). If the
+    stream fails, the segments it already committed are tombstoned,
+    so only the old version stays live.
+
+    progress, if given, is called with the number of chunks
+    committed so far after every commit.
+    """
+    sync_hash_index()
+    replace_below = load_manifest()["next_id"] if replace_sources else None
+
+    pages = _staged(pages)
+    chunks = _staged(_chunk_stage(pages, chunker))
+    embedded = _staged(_embed_stage(chunks, across_sources, dedup_store=not replace_sources))
+
+    total = 0
+    buf_emb, buf_chunks = [], []
+
+    def flush(last: bool = False):
+        nonlocal total, buf_emb, buf_chunks
+        replacing = last and bool(replace_sources)
+        if not buf_chunks and not replacing:
+            return
+        commit_segment(
+            np.concatenate(buf_emb) if buf_emb else np.zeros((0, 1), dtype="float32"),
+            buf_chunks,
+            replace_sources=replace_sources if replacing else (),
+            replace_below=replace_below,
+        )
+        total += len(buf_chunks)
+        buf_emb, buf_chunks = [], []
+        if progress is not None:
+            progress(total)
+
+    try:
+        for embeddings, new_chunks in embedded:
+            buf_emb.append(embeddings)
+            buf_chunks.extend(new_chunks)
+            if len(buf_chunks) >= segment_chunks:
+                flush()
+        flush(last=True)
+    except BaseException:
+        if replace_sources and total:
+            for source in replace_sources:
+                delete_source(source, min_id=replace_below)
+            print(f"[pipeline] Rolled back {total} chunks of a failed replace")
+        raise
+
+    print(f"[pipeline] Streamed {total} new chunks")
+    return total
+
+
+def text_chunker(source: str, location: str | None = None):
+    def chunker(page: dict):
+        return text_to_chunks(page["text"], source, page=page.get("page"), location=location)
+    return chunker
+
+
+def _iter_txt(file_path: str, block_chars: int = 1 << 20):
+    """
+    Yields a text file in blocks of roughly block_chars,
+    split on blank lines so paragraphs stay whole.
+    """
+    buffer = []
+    size = 0
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            buffer.append(line)
+            size += len(line)
+            if size >= block_chars and not line.strip():
+                yield {"text": "".join(buffer), "page": None}
+                buffer, size = [], 0
+    if buffer:
+        yield {"text": "".join(buffer), "page": None}
+
+
+def iter_document_pages(file_path: str, filename: str):
+    """
+    Picks the streaming loader for a file by extension.
+    """
+    name = filename.lower()
+    if name.endswith(".pdf"):
+        return iter_pdf_sections(file_path, filename)
+    if name.endswith(".docx"):
+        return iter_docx_text(file_path)
+    if name.endswith(".xlsx"):
+        return iter_excel_text(file_path)
+    if name.endswith(".txt"):
+        return _iter_txt(file_path)
+    raise ValueError(f"Unsupported file type: {filename}")
+
+
+def ingest_file(file_path: str, source: str, location: str | None = None) -> int:
+    """
+    Streams one file from disk into the store with bounded memory.
+    """
+    return ingest_stream(
+        iter_document_pages(file_path, source),
+        text_chunker(source, location),
+    )
@@ -1,52 +1,108 @@
-import os
-import faiss
-import pickle
-from sentence_transformers import SentenceTransformer
-from app.memory.utils import DOCS_PATH, INDEX_PATH
+import threading
+
+from app.rag.cache import LRUCache, normalize_query
+from app.rag.embedding_service import get_embedding_service
+from app.rag.store import open_store
+from app.memory.utils import MMR_LAMBDA, QUERY_CACHE_SIZE, QUERY_CACHE_TTL, RETRIEVAL_MODE
 
 _model = None
-_index = None
-_docs = None
+_store = None
+_reload_lock = threading.Lock()
 
-INDEX_PATH = "app/store/index.faiss"
-DOCS_PATH = "app/store/docs.pkl"
+# normalized query text -> embedding (1, dim)
+_query_cache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
 
 
 def load_resources():
-    global _model, _index, _docs
+    """
+    Returns the current store snapshot. When the manifest has changed
+    since the snapshot was opened (ingest, delete, merge), a new one
+    is opened that reuses the unchanged segments, and swapped in with
+    a single assignment; queries already running keep their snapshot.
+    """
+    global _model, _store
 
     if _model is None:
-        _model = SentenceTransformer("all-MiniLM-L6-v2")
+        _model = get_embedding_service()
+
+    if _store is None or not _store.is_current():
+        with _reload_lock:
+            if _store is None or not _store.is_current():
+                store = open_store(previous=_store)
+                if _store is not None:
+                    print(f"[retriever] Reloaded store at generation {store.generation}")
+                _store = store
+
+    if _store.ntotal == 0:
+        raise RuntimeError("Vector index not initialized. Please ingest documents first.")
+    return _store
+
+def embed_query(query: str):
+    """
+    Query embedding, served from the LRU cache when the same
+    question was asked recently (skips model inference).
+    """
+    key = normalize_query(query)
+    q_emb = _query_cache.get(key)
+    if q_emb is None:
+        q_emb = _model.encode([query])
+        _query_cache.put(key, q_emb)
+    return q_emb
+
 
-    if _index is None:
-        if not os.path.exists(INDEX_PATH):
-            raise RuntimeError("Vector index not initialized. Please ingest documents first.")
-        _index = faiss.read_index(INDEX_PATH)
+def query_cache_stats() -> dict:
+    return _query_cache.stats()
 
-    if _docs is None:
-        if not os.path.exists(DOCS_PATH):
-            raise RuntimeError("Document store not found. Please ingest documents first.")
-        with open(DOCS_PATH, "rb") as f:
-            _docs = pickle.load(f)
 
-def retrieve(query: str, k: int = 8):
+def retrieve(
+    query: str,
+    k: int = 8,
+    nprobe: int | None = None,
+    ef_search: int | None = None,
+    mode: str | None = None,
+    filters: dict | None = None,
+    mmr_lambda: float | None = None,
+    return_generation: bool = False,
+):
+    """
+    nprobe / ef_search override the IVF / HNSW search breadth
+    for this query (ignored for flat segments).
+    mode: "dense" or "hybrid" (dense + BM25 keyword ranking fused
+    with RRF, for exact tokens such as drug names and trial ids).
+    Defaults to RETRIEVAL_MODE.
+    filters: {"sources", "section_prefix", "page_range", "location_prefix"},
+    applied inside the index search (see app/rag/docstore.py).
+    mmr_lambda: relevance/diversity trade-off for the top-k
+    (1.0 disables MMR). Defaults to MMR_LAMBDA.
+    return_generation: return (results, generation) with the content
+    generation of the snapshot that was searched (answer cache key;
+    unchanged by merges).
+    """
     if not query or not query.strip():
-        return []
+        return ([], None) if return_generation else []
 
-    load_resources()
+    store = load_resources()
 
-    q_emb = _model.encode([query])
-    distances, ids = _index.search(q_emb, k)
+    q_emb = embed_query(query)
+    mode = mode or RETRIEVAL_MODE
+    if mmr_lambda is None:
+        mmr_lambda = MMR_LAMBDA
 
-    results = []
-    for dist, idx in zip(distances[0], ids[0]):
-        chunk = _docs[idx].copy()      # flatten chunk
-        chunk["distance"] = float(dist)
-        results.append(chunk)
+    search_kwargs = dict(
+        nprobe=nprobe, ef_search=ef_search, filters=filters, mmr_lambda=mmr_lambda
+    )
+    if mode == "hybrid":
+        results = store.hybrid_search(q_emb, query, k, **search_kwargs)
+    elif mode == "dense":
+        results = store.search(q_emb, k, **search_kwargs)
+    else:
+        raise ValueError(f"Unknown retrieval mode: {mode}")
 
 
     print("RETRIEVE:", len(results), "chunks")
     for r in results[:3]:
         print(" -", r["source"], "dist=", r["distance"])
 
+    if return_generation:
+        return results, store.content_generation
     return results
@@ -0,0 +1,226 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+import numpy as np
+
+from app.memory.utils import LLM_CHAT_RESERVED, LLM_MAX_INFLIGHT
+
+# -------------------------------------------------
+# LLM request scheduler
+#
+# Every Ollama call takes a slot first. At most LLM_MAX_INFLIGHT
+# calls run at once (Ollama queues anything beyond its
+# OLLAMA_NUM_PARALLEL anyway, in arrival order). Waiting calls
+# are granted by class priority: chat > planner > summarize.
+# LLM_CHAT_RESERVED slots are never given to background classes,
+# so a running batch of report summaries cannot hold every slot
+# while a chat question waits.
+#
+# Within a class, sessions take turns (round robin), so one
+# session queueing many summaries does not delay everyone else's.
+#
+# Sync callers (worker threads) and async callers (event loop)
+# share the same queues; the core is guarded by one lock.
+# -------------------------------------------------
+
+PRIORITIES = ("chat", "planner", "summarize")
+
+_WAIT_SAMPLES = 1000
+
+
+class _Waiter:
+    def __init__(self, priority: str, session_id: str):
+        self.priority = priority
+        self.session_id = session_id
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+        self.event = None
+        self.loop = None
+        self.future = None
+
+
+class LLMScheduler:
+    def __init__(self, max_inflight: int = LLM_MAX_INFLIGHT, chat_reserved: int = LLM_CHAT_RESERVED):
+        self.max_inflight = max(1, max_inflight)
+        self.chat_reserved = min(max(0, chat_reserved), self.max_inflight - 1)
+
+        self._lock = threading.Lock()
+        # priority -> session -> waiters, and the session turn order
+        self._queues = {p: {} for p in PRIORITIES}
+        self._turns = {p: deque() for p in PRIORITIES}
+
+        self.inflight = {p: 0 for p in PRIORITIES}
+        self.served = {p: 0 for p in PRIORITIES}
+        self._waits = {p: deque(maxlen=_WAIT_SAMPLES) for p in PRIORITIES}
+
+    # ---------------------------------------------
+    # Core (caller holds self._lock)
+    # ---------------------------------------------
+    def _can_run(self, priority: str) -> bool:
+        total = sum(self.inflight.values())
+        if total >= self.max_inflight:
+            return False
+        if priority != "chat":
+            background = total - self.inflight["chat"]
+            return background < self.max_inflight - self.chat_reserved
+        return True
+
+    def _enqueue(self, waiter: _Waiter):
+        sessions = self._queues[waiter.priority]
+        if waiter.session_id not in sessions:
+            sessions[waiter.session_id] = deque()
+            self._turns[waiter.priority].append(waiter.session_id)
+        sessions[waiter.session_id].append(waiter)
+
+    def _remove(self, waiter: _Waiter):
+        sessions = self._queues[waiter.priority]
+        pending = sessions.get(waiter.session_id)
+        if pending is None or waiter not in pending:
+            return
+        pending.remove(waiter)
+        if not pending:
+            del sessions[waiter.session_id]
+            self._turns[waiter.priority].remove(waiter.session_id)
+
+    def _next_waiter(self, priority: str) -> _Waiter:
+        turns = self._turns[priority]
+        sessions = self._queues[priority]
+
+        session_id = turns.popleft()
+        pending = sessions[session_id]
+        waiter = pending.popleft()
+        if pending:
+            turns.append(session_id)
+        else:
+            del sessions[session_id]
+        return waiter
+
+    def _grant(self, waiter: _Waiter):
+        waiter.granted = True
+        self.inflight[waiter.priority] += 1
+        self.served[waiter.priority] += 1
+        self._waits[waiter.priority].append(time.monotonic() - waiter.enqueued)
+
+        if waiter.event is not None:
+            waiter.event.set()
+        else:
+            waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+
+    def _dispatch(self):
+        for priority in PRIORITIES:
+            while self._turns[priority] and self._can_run(priority):
+                self._grant(self._next_waiter(priority))
+
+    def _submit(self, waiter: _Waiter):
+        with self._lock:
+            self._enqueue(waiter)
+            self._dispatch()
+
+    def _release(self, priority: str):
+        with self._lock:
+            self.inflight[priority] -= 1
+            self._dispatch()
+
+    def _cancel(self, waiter: _Waiter):
+        """
+        Called when a waiting caller gives up. Returns the slot if
+        it was granted in the meantime.
+        """
+        with self._lock:
+            if not waiter.granted:
+                self._remove(waiter)
+                return
+        self._release(waiter.priority)
+
+    # ---------------------------------------------
+    # Public API
+    # ---------------------------------------------
+    @contextmanager
+    def slot(self, priority: str = "chat", session_id: str | None = None):
+        """
+        Blocks the calling thread until the request may run.
+        """
+        waiter = self._waiter(priority, session_id)
+        waiter.event = threading.Event()
+        self._submit(waiter)
+        try:
+            waiter.event.wait()
+        except BaseException:
+            self._cancel(waiter)
+            raise
+
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    @asynccontextmanager
+    async def aslot(self, priority: str = "chat", session_id: str | None = None):
+        """
+        Awaits a slot without holding a thread.
+        """
+        waiter = self._waiter(priority, session_id)
+        waiter.loop = asyncio.get_running_loop()
+        waiter.future = waiter.loop.create_future()
+        self._submit(waiter)
+        try:
+            await waiter.future
+        except BaseException:
+            self._cancel(waiter)
+            raise
+
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    @staticmethod
+    def _waiter(priority: str, session_id: str | None) -> _Waiter:
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown LLM priority: {priority}")
+        return _Waiter(priority, session_id or "default")
+
+    def stats(self) -> dict:
+        with self._lock:
+            queued = {
+                p: sum(len(pending) for pending in self._queues[p].values())
+                for p in PRIORITIES
+            }
+            waits = {p: list(self._waits[p]) for p in PRIORITIES}
+            return {
+                "max_inflight": self.max_inflight,
+                "chat_reserved": self.chat_reserved,
+                "inflight": dict(self.inflight),
+                "queued": queued,
+                "queued_sessions": {p: len(self._turns[p]) for p in PRIORITIES},
+                "served": dict(self.served),
+                "wait_ms_p50": {p: _percentile_ms(waits[p], 50) for p in PRIORITIES},
+                "wait_ms_p95": {p: _percentile_ms(waits[p], 95) for p in PRIORITIES},
+            }
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _percentile_ms(samples: list[float], q: float) -> float | None:
+    if not samples:
+        return None
+    return round(float(np.percentile(samples, q)) * 1000, 1)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
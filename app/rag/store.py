@@ -0,0 +1,1120 @@
+import copy
+import json
+import os
+import pickle
+import shutil
+import threading
+import uuid
+from collections import defaultdict
+
+import faiss
+import numpy as np
+
+from app.rag import hash_index
+from app.rag.utils import estimate_tokens
+from app.rag.bm25 import Postings, idf_weights, tokenize
+from app.rag.docstore import ColumnarDocs, match_filters, write_columns
+from app.rag.ann import build_index, index_kind_for, is_compressed, search_params
+from app.memory.utils import (
+    COMPACT_DELETED_RATIO,
+    DOCS_PATH,
+    FILTER_EXACT_MAX,
+    HYBRID_FETCH_FACTOR,
+    MMR_FETCH_FACTOR,
+    INDEX_MMAP,
+    INDEX_PATH,
+    INDEX_PREFETCH,
+    MANIFEST_CHECKPOINT_RECORDS,
+    MANIFEST_PATH,
+    RERANK_FACTOR,
+    RRF_K,
+    SEGMENTS_DIR,
+    SEGMENT_MERGE_THRESHOLD,
+)
+
+# -------------------------------------------------
+# Segmented, append-only vector store
+#
+# Every commit writes a small immutable segment directory
+# (index.faiss + vectors.npy + ids.npy + columnar chunk metadata,
+# see app/rag/docstore.py, + a BM25 inverted index, see
+# app/rag/bm25.py) and appends
+# one line to a write-ahead manifest log. Readers replay the
+# log and open the union of live segments. A background merge
+# combines segments of the same size tier and rebuilds segments
+# whose index type no longer fits the corpus size (flat -> ANN).
+#
+# Deletes are tombstones: the manifest records the stable ids of
+# removed chunks, searches skip them, and compaction (part of the
+# merge loop) rewrites segments to drop them physically.
+#
+# Single writer per store: commits and merges are serialized
+# with an in-process lock.
+# -------------------------------------------------
+
+_write_lock = threading.RLock()
+_manifest_repaired = False
+_schedule_lock = threading.Lock()
+_merge_lock = threading.Lock()  # one merge_segments at a time (background loop, compact)
+_merge_thread = None
+_merge_requested = False
+_PREFETCH_BLOCK = 1 << 20
+
+
+# -------------------------------------------------
+# Manifest (write-ahead log)
+#
+# The replayed state is cached per process and only records
+# appended since the last read are applied, so load_manifest()
+# costs O(new records). Every MANIFEST_CHECKPOINT_RECORDS records
+# the log is rewritten as one "checkpoint" record holding the
+# live state (temp file, fsync, rename), which bounds cold starts
+# and drops tombstones that compaction already purged.
+# -------------------------------------------------
+_manifest_lock = threading.Lock()
+_manifest_cache = None  # (path, offset, bytes before offset, state)
+_VERIFY_BYTES = 64
+
+
+def _new_state() -> dict:
+    return {
+        "generation": 0,
+        # Bumped by commits and deletes, not by merges: a merge
+        # rewrites segments but keeps the live content
+        "content_generation": 0,
+        "next_id": 0,
+        "segments": {},
+        "deleted": frozenset(),
+        "log_records": 0,
+    }
+
+
+def _apply_records(state: dict, records: list[dict]):
+    """
+    Applies manifest records to a replay state in place. The
+    deleted set is replaced, never mutated, so views handed out
+    earlier (and snapshots holding them) stay valid.
+    """
+    segments = state["segments"]
+    deleted = None
+
+    for rec in records:
+        if rec["op"] == "checkpoint":
+            segments = {s["name"]: dict(s) for s in rec["segments"]}
+            deleted = set(rec["deleted"])
+            state.update(
+                generation=rec["generation"],
+                content_generation=rec["content_generation"],
+                next_id=rec["next_id"],
+                log_records=0,
+            )
+            continue
+
+        state["generation"] += 1
+        state["log_records"] += 1
+        if rec["op"] != "merge":
+            state["content_generation"] += 1
+        if rec["op"] == "merge":
+            for name in rec["inputs"]:
+                segments.pop(name, None)
+        if rec["op"] in ("add", "merge") and rec["segment"]:
+            segments[rec["segment"]] = {
+                "name": rec["segment"],
+                "rows": rec["rows"],
+                "index": rec["index"],
+            }
+        # "deleted": tombstoned ids, "purged": ids physically removed by compaction
+        if rec.get("deleted") or rec.get("purged"):
+            if deleted is None:
+                deleted = set(state["deleted"])
+            deleted.update(rec.get("deleted", ()))
+            deleted.difference_update(rec.get("purged", ()))
+        state["next_id"] = max(state["next_id"], rec.get("next_id", state["next_id"]))
+
+    state["segments"] = segments
+    if deleted is not None:
+        state["deleted"] = frozenset(deleted)
+
+
+def _view(state: dict) -> dict:
+    return {
+        "generation": state["generation"],
+        "content_generation": state["content_generation"],
+        "next_id": state["next_id"],
+        "segments": [dict(s) for s in state["segments"].values()],
+        "deleted": state["deleted"],
+        "log_records": state["log_records"],
+    }
+
+
+def _replay(records: list[dict]) -> dict:
+    state = _new_state()
+    _apply_records(state, records)
+    return _view(state)
+
+
+def _parse_lines(data: bytes) -> tuple[list[dict], int]:
+    """
+    Parses the complete (newline-terminated) lines of `data`.
+    Returns (records, bytes consumed). Stops at a torn line: a
+    crash mid-append, or an append still in progress.
+    """
+    records = []
+    consumed = 0
+    while True:
+        end = data.find(b"\n", consumed)
+        if end < 0:
+            break
+        line = data[consumed:end].strip()
+        if line:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+        consumed = end + 1
+    return records, consumed
+
+
+def _read_records() -> list[dict]:
+    if not MANIFEST_PATH.exists():
+        return []
+    with open(MANIFEST_PATH, "rb") as f:
+        return _parse_lines(f.read())[0]
+
+
+def _repair_manifest():
+    """
+    A crash mid-append leaves a partial last line. Appending after
+    it would glue the next record onto it and readers would drop
+    both, so before the first append of this process the tail is
+    cut back to the last newline (or terminated, if it is complete).
+    """
+    global _manifest_repaired
+    if _manifest_repaired or not MANIFEST_PATH.exists():
+        _manifest_repaired = True
+        return
+
+    with open(MANIFEST_PATH, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        end, pos = 0, size
+        while pos > 0:
+            step = min(1 << 16, pos)
+            pos -= step
+            f.seek(pos)
+            i = f.read(step).rfind(b"\n")
+            if i >= 0:
+                end = pos + i + 1
+                break
+
+        if end != size:
+            f.seek(end)
+            tail = f.read()
+            try:
+                json.loads(tail)
+                f.write(b"\n")
+                print("[store] Terminated unfinished last manifest line")
+            except ValueError:
+                f.truncate(end)
+                print(f"[store] Dropped torn manifest tail ({size - end} bytes)")
+            f.flush()
+            os.fsync(f.fileno())
+
+    _manifest_repaired = True
+
+
+def _append_record(record: dict):
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with _write_lock:
+        _repair_manifest()
+        with open(MANIFEST_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        if load_manifest()["log_records"] >= MANIFEST_CHECKPOINT_RECORDS:
+            checkpoint_manifest()
+
+
+def load_manifest() -> dict:
+    """
+    Returns the current live view of the store:
+    {"generation": int, "content_generation": int, "next_id": int,
+     "segments": [{"name", "rows", "index"}],
+     "deleted": frozenset of tombstoned chunk ids,
+     "log_records": records since the last checkpoint}
+    """
+    global _manifest_cache
+    if not MANIFEST_PATH.exists() and INDEX_PATH.exists() and DOCS_PATH.exists():
+        _import_legacy_store()
+
+    with _manifest_lock:
+        try:
+            f = open(MANIFEST_PATH, "rb")
+        except FileNotFoundError:
+            _manifest_cache = None
+            return _view(_new_state())
+
+        with f:
+            state, offset, verify = _new_state(), 0, b""
+            if _manifest_cache is not None and _manifest_cache[0] == MANIFEST_PATH:
+                _, cached_offset, cached_verify, cached_state = _manifest_cache
+                # Still the same file up to where we read it last time?
+                # A checkpoint (or a new store) replaces it
+                f.seek(cached_offset - len(cached_verify))
+                if f.read(len(cached_verify)) == cached_verify:
+                    state, offset, verify = cached_state, cached_offset, cached_verify
+                else:
+                    f.seek(0)
+
+            data = f.read()
+
+        records, consumed = _parse_lines(data)
+        if records:
+            _apply_records(state, records)
+        if consumed:
+            verify = (verify + data[:consumed])[-_VERIFY_BYTES:]
+            offset += consumed
+        _manifest_cache = (MANIFEST_PATH, offset, verify, state)
+        return _view(state)
+
+
+def checkpoint_manifest():
+    """
+    Rewrites the log as a single record holding the live state.
+    Generations are carried over, so snapshot and answer cache
+    keys do not change.
+    """
+    global _manifest_repaired
+    with _write_lock:
+        manifest = load_manifest()
+        record = {
+            "op": "checkpoint",
+            "generation": manifest["generation"],
+            "content_generation": manifest["content_generation"],
+            "next_id": manifest["next_id"],
+            "segments": manifest["segments"],
+            "deleted": sorted(manifest["deleted"]),
+        }
+
+        tmp_path = MANIFEST_PATH.with_name(MANIFEST_PATH.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, MANIFEST_PATH)
+        _fsync_dir(MANIFEST_PATH.parent)
+        _manifest_repaired = True
+
+    print(
+        f"[store] Checkpointed manifest ({manifest['log_records']} records, "
+        f"{len(manifest['segments'])} segments, {len(manifest['deleted'])} tombstones)"
+    )
+
+
+def _fsync_dir(path):
+    # Makes the rename durable; directories cannot be opened on Windows
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# -------------------------------------------------
+# Segment IO
+# -------------------------------------------------
+def _segment_dir(name: str):
+    return SEGMENTS_DIR / name
+
+
+def _write_segment(vectors: np.ndarray, ids: np.ndarray, docs: list[dict], kind: str = "flat") -> str:
+    """
+    Writes a segment to a temp directory and renames it into place,
+    so a segment directory is either complete or absent.
+    """
+    name = f"seg-{uuid.uuid4().hex[:12]}"
+    tmp_dir = SEGMENTS_DIR / f".tmp-{name}"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    index = build_index(vectors, kind)
+
+    faiss.write_index(index, str(tmp_dir / "index.faiss"))
+    np.save(tmp_dir / "vectors.npy", vectors)
+    np.save(tmp_dir / "ids.npy", ids.astype("int64"))
+    write_columns(tmp_dir, docs)
+    Postings.build(d.get("text", "") for d in docs).save(tmp_dir)
+
+    os.rename(tmp_dir, _segment_dir(name))
+    return name
+
+
+def _read_segment_arrays(name: str):
+    seg_dir = _segment_dir(name)
+    vectors = np.load(seg_dir / "vectors.npy")
+    ids = np.load(seg_dir / "ids.npy")
+    docs = list(ColumnarDocs(seg_dir))
+    return vectors, ids, docs
+
+
+def _import_legacy_store():
+    """
+    One-time migration of the old single-file store
+    (index.faiss + docs.pkl) into the first segment.
+    """
+    index = faiss.read_index(str(INDEX_PATH))
+    with open(DOCS_PATH, "rb") as f:
+        docs = pickle.load(f)
+
+    if index.ntotal == 0:
+        return
+
+    vectors = index.reconstruct_n(0, index.ntotal)
+    ids = np.arange(index.ntotal, dtype="int64")
+
+    with _write_lock:
+        if MANIFEST_PATH.exists():
+            return
+        name = _write_segment(vectors, ids, docs)
+        _append_record({
+            "op": "add",
+            "segment": name,
+            "rows": len(docs),
+            "index": "flat",
+            "next_id": int(index.ntotal),
+        })
+    print(f"[store] Imported legacy store into {name} ({len(docs)} chunks)")
+
+
+# -------------------------------------------------
+# Write path
+# -------------------------------------------------
+def commit_segment(
+    embeddings: np.ndarray,
+    chunks: list[dict],
+    replace_sources=(),
+    replace_below: int | None = None,
+) -> dict:
+    """
+    Persists one batch of embedded chunks as a new segment.
+    Cost is proportional to the batch, not the corpus.
+
+    Chunks already stored for `replace_sources` are tombstoned in
+    the same manifest record, so readers see either the old or the
+    new version of those documents, never both or neither.
+    With `replace_below`, only their chunks with smaller ids are
+    tombstoned (a streamed replace commits the new version in
+    several segments, see app/rag/pipeline.py).
+    """
+    if len(chunks) != len(embeddings):
+        raise ValueError("embeddings and chunks must have the same length")
+
+    # Prompt-size accounting at query time uses these (app/rag/context.py)
+    for c in chunks:
+        if "n_tokens" not in c:
+            c["n_tokens"] = estimate_tokens(c.get("text", ""))
+
+    with _write_lock:
+        sync_hash_index()
+        manifest = load_manifest()
+        first_id = manifest["next_id"]
+        ids = np.arange(first_id, first_id + len(chunks), dtype="int64")
+        replaced = hash_index.ids_for_sources(replace_sources) if replace_sources else []
+        if replace_below is not None:
+            replaced = [cid for cid in replaced if cid < replace_below]
+
+        if chunks:
+            kind = index_kind_for(len(chunks), _ntotal(manifest) + len(chunks))
+            name = _write_segment(embeddings, ids, chunks, kind)
+            record = {
+                "op": "add",
+                "segment": name,
+                "rows": len(chunks),
+                "index": kind,
+                "next_id": int(first_id + len(chunks)),
+            }
+        else:
+            record = {"op": "delete"}
+
+        if replaced:
+            record["sources"] = list(replace_sources)
+            record["deleted"] = replaced
+
+        generation = None
+        if chunks or replaced:
+            _append_record(record)
+            generation = load_manifest()["content_generation"]
+        if replaced:
+            hash_index.forget(replaced, generation)
+        hash_index.record_chunks(ids, chunks, first_id + len(chunks), generation)
+
+    schedule_merge()
+    return load_manifest()
+
+
+def delete_source(source: str, min_id: int = 0) -> int:
+    """
+    Tombstones every chunk of one document, or with `min_id` only
+    its chunks with at least that id (rolls back a failed streamed
+    replace, see app/rag/pipeline.py).
+    Returns the number of chunks deleted.
+    """
+    with _write_lock:
+        sync_hash_index()
+        ids = [cid for cid in hash_index.ids_for_sources([source]) if cid >= min_id]
+        if ids:
+            _append_record({"op": "delete", "sources": [source], "deleted": ids})
+            hash_index.forget(ids, load_manifest()["content_generation"])
+
+    if ids:
+        schedule_merge()
+    print(f"[store] Deleted {len(ids)} chunks of {source}")
+    return len(ids)
+
+
+def replace_source(source: str, embeddings: np.ndarray, chunks: list[dict]) -> dict:
+    """
+    Atomically swaps the stored chunks of `source` for new ones.
+    """
+    return commit_segment(embeddings, chunks, replace_sources=[source])
+
+
+def sync_hash_index():
+    """
+    Catches the chunk-hash index up with the manifest, e.g. after a
+    crash between a segment commit or delete and its hash index
+    update, or on the first run against an existing store.
+    """
+    with _write_lock:
+        manifest = load_manifest()
+        if hash_index.synced_generation() < manifest["content_generation"]:
+            _forget_dead_ids(manifest)
+        _record_new_ids(manifest)
+
+
+def _forget_dead_ids(manifest: dict):
+    """
+    Drops hash rows of chunks that are tombstoned or no longer in
+    any live segment (a delete whose forget() never ran). Reads
+    every segment's ids, so it only runs when a delete may be missing.
+    """
+    seg_ids = [np.load(_segment_dir(seg["name"]) / "ids.npy") for seg in manifest["segments"]]
+    live = np.concatenate(seg_ids) if seg_ids else np.zeros(0, dtype="int64")
+    deleted = manifest["deleted"]
+    if deleted:
+        live = live[~np.isin(live, np.fromiter(deleted, dtype="int64", count=len(deleted)))]
+
+    known = np.array(hash_index.all_ids(), dtype="int64")
+    dead = known[~np.isin(known, live)]
+    hash_index.forget(dead.tolist(), manifest["content_generation"])
+    if len(dead):
+        print(f"[store] Hash index: forgot {len(dead)} deleted chunks")
+
+
+def _record_new_ids(manifest: dict):
+    synced = hash_index.synced_next_id()
+    if synced >= manifest["next_id"]:
+        return
+
+    for seg in manifest["segments"]:
+        seg_dir = _segment_dir(seg["name"])
+        ids = np.load(seg_dir / "ids.npy")
+        if len(ids) == 0 or ids.max() < synced:
+            continue
+        docs = ColumnarDocs(seg_dir)
+        deleted = manifest["deleted"]
+        keep = [i for i, cid in enumerate(ids) if cid >= synced and cid not in deleted]
+        hash_index.record_chunks(
+            ids[keep], [docs[i] for i in keep], synced
+        )
+
+    hash_index.record_chunks([], [], manifest["next_id"])
+    print(f"[store] Hash index synced up to id {manifest['next_id']}")
+
+
+# -------------------------------------------------
+# Background merge (size-tiered)
+# -------------------------------------------------
+def _ntotal(manifest: dict) -> int:
+    """
+    Live (not tombstoned) chunks.
+    """
+    return sum(s["rows"] for s in manifest["segments"]) - len(manifest["deleted"])
+
+
+def _size_tier(rows: int) -> int:
+    return len(str(max(rows, 1)))
+
+
+def _pick_merge_inputs(segments: list[dict]) -> list[str]:
+    tiers = defaultdict(list)
+    for seg in segments:
+        tiers[_size_tier(seg["rows"])].append(seg["name"])
+
+    for tier in sorted(tiers):
+        if len(tiers[tier]) >= SEGMENT_MERGE_THRESHOLD:
+            return tiers[tier]
+    return []
+
+
+def _pick_rebuild(manifest: dict) -> list[str]:
+    """
+    A segment whose index type no longer matches its size and the
+    store size, e.g. a flat segment once the store crosses ANN_THRESHOLD.
+    """
+    ntotal = _ntotal(manifest)
+    for seg in manifest["segments"]:
+        if seg["index"] != index_kind_for(seg["rows"], ntotal):
+            return [seg["name"]]
+    return []
+
+
+def _pick_compaction(manifest: dict, min_ratio: float) -> list[str]:
+    """
+    A segment where at least min_ratio of the rows are tombstoned.
+    """
+    deleted = manifest["deleted"]
+    if not deleted:
+        return []
+
+    deleted_ids = np.fromiter(deleted, dtype="int64", count=len(deleted))
+    for seg in manifest["segments"]:
+        ids = np.load(_segment_dir(seg["name"]) / "ids.npy")
+        n_deleted = int(np.isin(ids, deleted_ids).sum())
+        if n_deleted and n_deleted >= min_ratio * len(ids):
+            return [seg["name"]]
+    return []
+
+
+def merge_segments(compact_ratio: float = COMPACT_DELETED_RATIO) -> bool:
+    """
+    Merges one tier of segments into a single segment, rebuilds
+    one segment with a better-suited index type, or compacts one
+    segment with many tombstones. Tombstoned rows are dropped from
+    every rewritten segment.
+    Returns True if anything was rewritten.
+    """
+    with _merge_lock:
+        return _merge_once(compact_ratio)
+
+
+def _merge_once(compact_ratio: float) -> bool:
+    manifest = load_manifest()
+    inputs = (
+        _pick_merge_inputs(manifest["segments"])
+        or _pick_rebuild(manifest)
+        or _pick_compaction(manifest, compact_ratio)
+    )
+    if not inputs:
+        return False
+
+    parts = [_read_segment_arrays(name) for name in inputs]
+    vectors = np.concatenate([p[0] for p in parts])
+    ids = np.concatenate([p[1] for p in parts])
+    docs = [d for p in parts for d in p[2]]
+
+    # Tombstones added after this manifest read stay in the log
+    # and keep applying to the new segment by stable id
+    live = np.array([cid not in manifest["deleted"] for cid in ids], dtype=bool)
+    purged = [int(cid) for cid in ids[~live]]
+    vectors, ids = vectors[live], ids[live]
+    docs = [d for d, keep in zip(docs, live) if keep]
+    kind = index_kind_for(len(docs), _ntotal(manifest))
+
+    # Built outside the write lock: an HNSW build or IVF training
+    # must not stall commits and deletes
+    name = _write_segment(vectors, ids, docs, kind) if docs else None
+
+    with _write_lock:
+        # Only commit if every input is still live; otherwise another
+        # merge already rewrote them and committing would duplicate rows
+        live_names = {seg["name"] for seg in load_manifest()["segments"]}
+        if not set(inputs) <= live_names:
+            if name:
+                shutil.rmtree(_segment_dir(name), ignore_errors=True)
+            print(f"[store] Merge of {len(inputs)} segments dropped: inputs no longer live")
+            return False
+
+        _append_record({
+            "op": "merge",
+            "inputs": inputs,
+            "segment": name,
+            "rows": len(docs),
+            "index": kind,
+            "purged": purged,
+        })
+
+    for old in inputs:
+        shutil.rmtree(_segment_dir(old), ignore_errors=True)
+
+    print(
+        f"[store] Merged {len(inputs)} segments into {name} "
+        f"({len(docs)} chunks, {kind}, {len(purged)} purged)"
+    )
+    return True
+
+
+def compact() -> int:
+    """
+    Rewrites every segment that holds tombstones.
+    Returns the number of segments rewritten. Waits for a running
+    background merge instead of racing it.
+    """
+    rewritten = 0
+    while merge_segments(compact_ratio=0.0):
+        rewritten += 1
+    return rewritten
+
+
+def _merge_loop():
+    global _merge_thread, _merge_requested
+    while True:
+        # A request that arrives while we merge gets one more pass
+        with _schedule_lock:
+            if not _merge_requested:
+                _merge_thread = None
+                return
+            _merge_requested = False
+
+        try:
+            while merge_segments():
+                pass
+        except Exception as e:
+            print(f"[store] Background merge failed: {e}")
+
+
+def schedule_merge():
+    """
+    Starts the merge thread, at most one per process.
+    """
+    global _merge_thread, _merge_requested
+    with _schedule_lock:
+        _merge_requested = True
+        if _merge_thread is not None:
+            return
+        _merge_thread = threading.Thread(target=_merge_loop, daemon=True)
+        _merge_thread.start()
+
+
+# -------------------------------------------------
+# Read path
+# -------------------------------------------------
+def _read_index(path, kind: str):
+    """
+    With INDEX_MMAP, index data stays in the shared page cache
+    instead of being copied into every process: IVF inverted lists
+    via IO_FLAG_MMAP, flat/SQ/HNSW codes via IO_FLAG_MMAP_IFC.
+    """
+    if not INDEX_MMAP:
+        return faiss.read_index(str(path))
+
+    if kind.split("-")[0] == "ivf" or kind == "flat-pq":
+        flags = faiss.IO_FLAG_MMAP
+    else:
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    return faiss.read_index(str(path), flags | faiss.IO_FLAG_READ_ONLY)
+
+
+def _prefetch(paths: list):
+    """
+    Warms the page cache for memory-mapped segment files so
+    the first queries do not fault pages in from disk.
+    """
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+                else:
+                    while f.read(_PREFETCH_BLOCK):
+                        pass
+        except OSError:
+            # Segment merged away in the meantime
+            continue
+
+
+def prefetch_segments(segments: list) -> threading.Thread:
+    paths = [_segment_dir(seg.name) / "index.faiss" for seg in segments]
+    thread = threading.Thread(target=_prefetch, args=(paths,), daemon=True)
+    thread.start()
+    return thread
+
+
+class Segment:
+    def __init__(self, name: str, kind: str = "flat", deleted=()):
+        seg_dir = _segment_dir(name)
+        self.name = name
+        self.kind = kind
+        self.index = _read_index(seg_dir / "index.faiss", kind)
+        self.ids = np.load(seg_dir / "ids.npy", mmap_mode="r")
+        self.docs = ColumnarDocs(seg_dir)
+
+        # Full-precision vectors stay on disk; pages are only
+        # faulted in for the candidates we re-rank
+        self.vectors = np.load(seg_dir / "vectors.npy", mmap_mode="r")
+
+        self._postings = Postings.load(seg_dir)
+        self._set_tombstones(deleted)
+
+    def _set_tombstones(self, deleted):
+        # Tombstoned positions are excluded inside faiss; keep both
+        # selectors referenced, IDSelectorNot does not own its child
+        self.n_deleted = 0
+        self.deleted_positions = np.zeros(0, dtype="int64")
+        self._deleted_sel = self.selector = None
+        self._live_stats = None
+        if deleted:
+            deleted_ids = np.fromiter(deleted, dtype="int64", count=len(deleted))
+            positions = np.nonzero(np.isin(self.ids, deleted_ids))[0].astype("int64")
+            if len(positions):
+                self.n_deleted = len(positions)
+                self.deleted_positions = positions
+                self._deleted_sel = faiss.IDSelectorBatch(positions)
+                self.selector = faiss.IDSelectorNot(self._deleted_sel)
+
+    def with_tombstones(self, deleted) -> "Segment":
+        """
+        Same open index and files under a newer tombstone set.
+        Returns a copy so snapshots still in use are not mutated.
+        """
+        seg = copy.copy(self)
+        seg._set_tombstones(deleted)
+        return seg
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal - self.n_deleted
+
+    def postings(self) -> Postings:
+        return self._postings
+
+    def live_stats(self) -> tuple[int, int]:
+        """
+        (chunks, tokens) of the rows that are not tombstoned,
+        for BM25 document counts and average length.
+        """
+        if self._live_stats is None:
+            post = self.postings()
+            tokens = post.total_tokens
+            if self.n_deleted:
+                tokens -= int(np.asarray(post.doclen[self.deleted_positions]).sum())
+            self._live_stats = (len(post.doclen) - self.n_deleted, tokens)
+        return self._live_stats
+
+    def filter_mask(self, filters: dict | None):
+        """
+        Rows matching the metadata filters and not tombstoned,
+        or None when no filter applies.
+        """
+        mask = match_filters(self.docs, filters)
+        if mask is not None and len(self.deleted_positions):
+            mask[self.deleted_positions] = False
+        return mask
+
+    def exact_search(self, q_emb: np.ndarray, k: int, positions: np.ndarray):
+        """
+        Brute force over a few candidate rows of the stored vectors.
+        """
+        vectors = np.asarray(self.vectors[positions], dtype="float32")
+        dists = ((vectors - q_emb[0]) ** 2).sum(axis=1)
+        order = np.argsort(dists)[:k]
+        return [(float(dists[i]), int(positions[i])) for i in order]
+
+    def filtered_search(self, q_emb: np.ndarray, k: int, mask: np.ndarray, nprobe=None, ef_search=None, rerank: int = 0):
+        """
+        Small selections are scanned exactly (graph / inverted-list
+        search degrades when most rows are excluded); larger ones go
+        through faiss with a bitmap IDSelector.
+        """
+        allowed = np.flatnonzero(mask)
+        if len(allowed) == 0:
+            return []
+        if len(allowed) <= FILTER_EXACT_MAX:
+            return self.exact_search(q_emb, k, allowed)
+
+        bitmap = np.packbits(mask, bitorder="little")
+        sel = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+        params = search_params(self.index, nprobe=nprobe, ef_search=ef_search, sel=sel)
+        return self.search(q_emb, min(k, len(allowed)), params=params, rerank=rerank)
+
+    def search(self, q_emb: np.ndarray, k: int, params=None, rerank: int = 0):
+        """
+        Returns [(distance, position)]. For compressed segments,
+        fetches rerank * k candidates and re-scores them exactly.
+        """
+        fetch = k * rerank if rerank > 1 and is_compressed(self.kind) else k
+        distances, positions = self.index.search(q_emb, min(fetch, self.ntotal), params=params)
+
+        hits = [(float(d), int(p)) for d, p in zip(distances[0], positions[0]) if p >= 0]
+        if fetch == k or not hits:
+            return hits
+
+        pos = np.array(sorted(p for _, p in hits))
+        exact = np.asarray(self.vectors[pos], dtype="float32")
+        dists = ((exact - q_emb[0]) ** 2).sum(axis=1)
+        order = np.argsort(dists)[:k]
+        return [(float(dists[i]), int(pos[i])) for i in order]
+
+
+class StoreSnapshot:
+    """
+    Read-only union of the segments live at one manifest generation.
+    """
+
+    def __init__(self, manifest: dict, segments: list[Segment], version: tuple = (0, 0)):
+        self.generation = manifest["generation"]
+        self.content_generation = manifest["content_generation"]
+        self.deleted = manifest["deleted"]
+        self.version = version
+        self.segments = segments
+
+    def is_current(self) -> bool:
+        return self.version == manifest_version()
+
+    @property
+    def ntotal(self) -> int:
+        return sum(s.ntotal for s in self.segments)
+
+    def _dense_hits(self, q_emb, k, nprobe=None, ef_search=None, rerank=RERANK_FACTOR, filters=None):
+        """
+        [(distance, segment, position)], nearest first.
+        """
+        hits = []
+        for seg in self.segments:
+            if seg.ntotal == 0:
+                continue
+
+            mask = seg.filter_mask(filters)
+            if mask is not None:
+                seg_hits = seg.filtered_search(
+                    q_emb, k, mask, nprobe=nprobe, ef_search=ef_search, rerank=rerank
+                )
+            else:
+                params = search_params(
+                    seg.index, nprobe=nprobe, ef_search=ef_search, sel=seg.selector
+                )
+                seg_hits = seg.search(q_emb, k, params=params, rerank=rerank)
+
+            hits.extend((dist, seg, pos) for dist, pos in seg_hits)
+
+        hits.sort(key=lambda h: h[0])
+        return hits[:k]
+
+    def keyword_hits(self, query: str, k: int, filters: dict | None = None):
+        """
+        [(bm25 score, segment, position)], best first.
+        """
+        terms = tokenize(query)
+        live = [seg for seg in self.segments if seg.ntotal > 0]
+        if not terms or not live:
+            return []
+
+        # Statistics over live rows only: tombstones must not skew
+        # idf or length normalisation until compaction drops them
+        postings = [seg.postings() for seg in live]
+        stats = [seg.live_stats() for seg in live]
+        n_docs = sum(n for n, _ in stats)
+        avgdl = max(sum(t for _, t in stats) / max(n_docs, 1), 1.0)
+        idf = idf_weights(terms, postings, n_docs, [seg.deleted_positions for seg in live])
+
+        hits = []
+        for seg, post in zip(live, postings):
+            positions, scores = post.score(terms, idf, avgdl)
+            mask = seg.filter_mask(filters)
+            if mask is not None:
+                keep = mask[positions]
+                positions, scores = positions[keep], scores[keep]
+            elif len(seg.deleted_positions):
+                keep = ~np.isin(positions, seg.deleted_positions)
+                positions, scores = positions[keep], scores[keep]
+            top = np.argsort(-scores)[:k]
+            hits.extend((float(scores[i]), seg, int(positions[i])) for i in top)
+
+        hits.sort(key=lambda h: -h[0])
+        return hits[:k]
+
+    def _materialize(self, hits, q_emb, **extra) -> list[dict]:
+        results = []
+        for i, (seg, pos, dist) in enumerate(hits):
+            if dist is None:
+                # Keyword-only hit: exact distance from the stored vector
+                dist = float(((np.asarray(seg.vectors[pos], dtype="float32") - q_emb[0]) ** 2).sum())
+            chunk = dict(seg.docs[pos])
+            chunk["distance"] = dist
+            for key, values in extra.items():
+                chunk[key] = values[i]
+            results.append(chunk)
+        return results
+
+    def _mmr(self, candidates, q_emb, k: int, lam: float, relevance=None):
+        """
+        Maximal marginal relevance over [(seg, pos, dist)] candidates,
+        using the stored vectors: each pick maximizes
+        lam * relevance - (1 - lam) * max similarity to earlier picks.
+        Relevance defaults to cosine similarity to the query.
+        """
+        if len(candidates) <= 1:
+            return candidates[:k]
+
+        vectors = np.stack([
+            np.asarray(seg.vectors[pos], dtype="float32") for seg, pos, _ in candidates
+        ])
+        vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+        if relevance is None:
+            q = q_emb[0] / max(float(np.linalg.norm(q_emb[0])), 1e-12)
+            relevance = vectors @ q
+        relevance = np.asarray(relevance, dtype="float32")
+        similarity = vectors @ vectors.T
+
+        selected = [int(np.argmax(relevance))]
+        max_sim = similarity[selected[0]].copy()
+        available = np.ones(len(candidates), dtype=bool)
+        available[selected[0]] = False
+
+        while len(selected) < min(k, len(candidates)):
+            scores = lam * relevance - (1 - lam) * max_sim
+            scores[~available] = -np.inf
+            best = int(np.argmax(scores))
+            selected.append(best)
+            available[best] = False
+            np.maximum(max_sim, similarity[best], out=max_sim)
+
+        return [candidates[i] for i in selected]
+
+    def search(
+        self,
+        q_emb: np.ndarray,
+        k: int,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        rerank: int = RERANK_FACTOR,
+        filters: dict | None = None,
+        mmr_lambda: float | None = None,
+    ) -> list[dict]:
+        """
+        filters: see app/rag/docstore.py (sources, section_prefix,
+        page_range, location_prefix); applied inside the search.
+        mmr_lambda < 1 over-fetches MMR_FETCH_FACTOR x k candidates and
+        keeps a diverse top-k (drops near-duplicate overlapping chunks).
+        """
+        q_emb = np.ascontiguousarray(q_emb, dtype="float32")
+        diversify = mmr_lambda is not None and mmr_lambda < 1
+        fetch = k * MMR_FETCH_FACTOR if diversify else k
+
+        hits = self._dense_hits(
+            q_emb, fetch, nprobe=nprobe, ef_search=ef_search, rerank=rerank, filters=filters
+        )
+        candidates = [(seg, pos, dist) for dist, seg, pos in hits]
+        if diversify:
+            candidates = self._mmr(candidates, q_emb, k, mmr_lambda)
+        return self._materialize(candidates, q_emb)
+
+    def hybrid_search(
+        self,
+        q_emb: np.ndarray,
+        query: str,
+        k: int,
+        fetch: int | None = None,
+        nprobe: int | None = None,
+        ef_search: int | None = None,
+        rerank: int = RERANK_FACTOR,
+        filters: dict | None = None,
+        mmr_lambda: float | None = None,
+    ) -> list[dict]:
+        """
+        Reciprocal rank fusion of the dense and BM25 rankings:
+        score = sum over rankings of 1 / (RRF_K + rank).
+        With mmr_lambda < 1 the fused candidates are diversified,
+        using the (max-scaled) fused score as relevance.
+        """
+        q_emb = np.ascontiguousarray(q_emb, dtype="float32")
+        diversify = mmr_lambda is not None and mmr_lambda < 1
+        fetch = fetch or k * max(HYBRID_FETCH_FACTOR, MMR_FETCH_FACTOR if diversify else 1)
+        dense = self._dense_hits(
+            q_emb, fetch, nprobe=nprobe, ef_search=ef_search, rerank=rerank, filters=filters
+        )
+        keyword = self.keyword_hits(query, fetch, filters=filters)
+
+        fused = {}
+        for rank, (dist, seg, pos) in enumerate(dense):
+            entry = fused.setdefault((seg.name, pos), [seg, pos, dist, 0.0])
+            entry[3] += 1.0 / (RRF_K + rank + 1)
+        for rank, (_, seg, pos) in enumerate(keyword):
+            entry = fused.setdefault((seg.name, pos), [seg, pos, None, 0.0])
+            entry[3] += 1.0 / (RRF_K + rank + 1)
+
+        ranked = sorted(fused.values(), key=lambda e: -e[3])
+        if diversify and ranked:
+            scores = np.array([e[3] for e in ranked], dtype="float32")
+            picked = self._mmr(
+                [(seg, pos, dist) for seg, pos, dist, _ in ranked],
+                q_emb, k, mmr_lambda,
+                relevance=scores / scores.max(),
+            )
+            by_key = {(e[0].name, e[1]): e for e in ranked}
+            ranked = [by_key[(seg.name, pos)] for seg, pos, _ in picked]
+        ranked = ranked[:k]
+
+        return self._materialize(
+            [(seg, pos, dist) for seg, pos, dist, _ in ranked],
+            q_emb,
+            rrf_score=[score for *_, score in ranked],
+        )
+
+
+def manifest_version() -> tuple:
+    """
+    Cheap change check for readers: between checkpoints the log
+    only grows, so its size changes with every commit, delete or
+    merge; a checkpoint replaces the file (new inode).
+    """
+    try:
+        st = MANIFEST_PATH.stat()
+    except FileNotFoundError:
+        return (0, 0)
+    return (st.st_ino, st.st_size)
+
+
+def open_store(retries: int = 3, previous: StoreSnapshot | None = None) -> StoreSnapshot:
+    """
+    Opens every live segment. If a merge removes a segment
+    while we are opening, re-read the manifest and retry.
+
+    With `previous`, segments that are still live are reused and
+    only new ones (fresh commits, merge outputs) are opened.
+    """
+    reuse = {seg.name: seg for seg in previous.segments} if previous else {}
+
+    for attempt in range(retries):
+        # Read the version first: a commit racing with us only
+        # causes one extra refresh on the next query
+        version = manifest_version()
+        manifest = load_manifest()
+        deleted = manifest["deleted"]
+        try:
+            segments = []
+            new_segments = []
+            for s in manifest["segments"]:
+                seg = reuse.get(s["name"])
+                if seg is None:
+                    seg = Segment(s["name"], s["index"], deleted)
+                    new_segments.append(seg)
+                elif deleted != previous.deleted:
+                    seg = seg.with_tombstones(deleted)
+                segments.append(seg)
+
+            if INDEX_PREFETCH and new_segments:
+                prefetch_segments(new_segments)
+            return StoreSnapshot(manifest, segments, version)
+        except (FileNotFoundError, RuntimeError):
+            # faiss reports a missing index file as RuntimeError; only
+            # retry if the manifest moved on (segment merged away)
+            if attempt == retries - 1 or manifest_version() == version:
+                raise
+    raise RuntimeError("Could not open vector store")
@@ -0,0 +1,70 @@
+import json
+
+# -------------------------------------------------
+# Incremental parser for streamed answer JSON
+#
+# The LLM streams {"answer": [{"sentence": ..., "chunk_ids": [...]}, ...]}
+# a few characters at a time. feed() scans only the new text,
+# tracking string/escape state and nesting depth, and returns each
+# item of the answer list as soon as its closing brace arrives.
+# -------------------------------------------------
+
+
+class AnswerStreamParser:
+    def __init__(self):
+        self.text = ""
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.list_depth = None    # depth inside the answer list
+        self.item_start = None
+
+    def feed(self, piece: str) -> list[dict]:
+        items = []
+        start = len(self.text)
+        self.text += piece
+
+        for i in range(start, len(self.text)):
+            ch = self.text[i]
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+
+            if ch == '"':
+                self.in_string = True
+
+            elif ch in "{[":
+                # The first list inside the top-level object is the answer list
+                if ch == "[" and self.depth == 1 and self.list_depth is None:
+                    self.list_depth = self.depth + 1
+                elif ch == "{" and self.depth == self.list_depth:
+                    self.item_start = i
+                self.depth += 1
+
+            elif ch in "}]":
+                self.depth -= 1
+                if ch == "}" and self.item_start is not None and self.depth == self.list_depth:
+                    try:
+                        items.append(json.loads(self.text[self.item_start:i + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self.item_start = None
+                elif ch == "]" and self.list_depth is not None and self.depth == self.list_depth - 1:
+                    self.list_depth = -1    # answer list closed; ignore later lists
+
+        return items
+
+    def result(self) -> dict | None:
+        """
+        The complete JSON object once the stream has ended, or None.
+        """
+        try:
+            return json.loads(self.text.strip())
+        except json.JSONDecodeError:
+            return None
@@ -1,4 +1,6 @@
 import hashlib
+import math
+import re
 
 
 def chunk_text(text: str, chunk_size=300, overlap=50):
@@ -16,3 +18,15 @@ def chunk_text(text: str, chunk_size=300, overlap=50):
 def hash_text(text: str) -> str:
     normalized = " ".join(text.lower().split())
     return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+# Word and punctuation pieces; llama-style BPE averages ~1.3 tokens per piece
+_TOKEN_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+TOKENS_PER_PIECE = 1.3
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    LLM token count estimate (no local tokenizer for the Ollama model).
+    """
+    return int(math.ceil(len(_TOKEN_PIECE_RE.findall(text)) * TOKENS_PER_PIECE))
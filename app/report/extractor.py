@@ -1,7 +1,7 @@
 from pathlib import Path
 from typing import List
 import re
-from app.rag.llm import call_llm_raw
+from app.rag.llm import acall_llm_raw, call_llm_raw
 from docx import Document
 
 
@@ -116,11 +116,8 @@ def extract_docx_sections(path: str) -> dict[str, str]:
     return sections
 
 
-def summarize_text(text: str) -> str:
-    if not text or not text.strip():
-        return ""
-
-    prompt = f"""
+def build_summary_prompt(text: str) -> str:
+    return f"""
 You are summarizing medical text.
 
 STRICT RULES:
@@ -134,8 +131,29 @@ TEXT:
 {text}
 """
 
+
+def summarize_text(text: str, session_id: str | None = None) -> str:
+    if not text or not text.strip():
+        return ""
+
+    try:
+        summary = call_llm_raw(build_summary_prompt(text), session_id=session_id)
+        return summary.strip()
+    except Exception as e:
+        raise RuntimeError(
+            "LLM summarization failed. Ensure the LLM service is running."
+        ) from e
+
+
+async def asummarize_text(text: str, session_id: str | None = None) -> str:
+    """
+    summarize_text on the async Ollama client.
+    """
+    if not text or not text.strip():
+        return ""
+
     try:
-        summary = call_llm_raw(prompt)
+        summary = await acall_llm_raw(build_summary_prompt(text), session_id=session_id)
         return summary.strip()
     except Exception as e:
         raise RuntimeError(
@@ -5,6 +5,14 @@ class ChatRequest(BaseModel):
     query: str
     session_id: Optional[str] = None
 
+    # Optional retrieval filters
+    sources: Optional[List[str]] = None
+    section_prefix: Optional[str] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+    location_prefix: Optional[str] = None
+    active_document_only: bool = False  # restrict to the session's active upload
+
 class AnswerChunk(BaseModel):
     text: str
     document: Optional[str] = None
@@ -12,6 +20,7 @@ class AnswerChunk(BaseModel):
     link: Optional[str] = None
 class ChatResponse(BaseModel):
     answer: List[AnswerChunk]
+    context_tokens: Optional[int] = None  # prompt context size (estimated tokens)
 
 
 class ReportSection(BaseModel):
@@ -0,0 +1,43 @@
+import sys
+
+from app.rag.embeddings import BACKENDS, check_backend_parity, create_backend
+
+# --------------------------------------------------
+# CONFIG
+# --------------------------------------------------
+SAMPLE_TEXTS = [
+    "What is the primary outcome of the trial?",
+    "Patients received 500 mg metformin twice daily for 12 weeks.",
+    "Adverse events were reported in 14% of the intervention group.",
+    "HbA1c decreased by 0.8 percentage points compared with placebo.",
+    "Exclusion criteria included eGFR below 30 mL/min/1.73 m2.",
+    "The study was registered at ClinicalTrials.gov (NCT01234567).",
+]
+MAX_DRIFT = 0.01
+
+# --------------------------------------------------
+# TEST
+# --------------------------------------------------
+def main():
+    backend_name = sys.argv[1] if len(sys.argv) > 1 else "onnx-int8"
+    if backend_name not in BACKENDS:
+        raise SystemExit(f"Unknown backend {backend_name}, expected one of {BACKENDS}")
+
+    print(f"🔎 Checking {backend_name} against the PyTorch backend...")
+    result = check_backend_parity(
+        SAMPLE_TEXTS,
+        backend=create_backend(backend_name),
+        max_drift=MAX_DRIFT,
+    )
+
+    print(f"Mean cosine drift: {result['mean_drift']:.5f}")
+    print(f"Max cosine drift:  {result['max_drift']:.5f} (allowed {MAX_DRIFT})")
+
+    if not result["passed"]:
+        print("❌ Parity check failed")
+        raise SystemExit(1)
+    print("✅ Parity check passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@ import streamlit as st
 import requests
 import uuid
 import time
+import json
+import itertools
 
 # ----------------------------
 # Page config MUST come first
@@ -16,6 +18,7 @@ st.set_page_config(
 # ----------------------------
 API_BASE = "http://api:8000"
 CHAT_URL = f"{API_BASE}/chat"
+CHAT_STREAM_URL = f"{API_BASE}/chat/stream"
 REPORT_URL = f"{API_BASE}/report"
 REPORT_DOWNLOAD_URL = f"{API_BASE}/report/download"
 
@@ -39,6 +42,63 @@ with st.spinner("Loading..."):
         st.error("Backend is not ready. Please refresh.")
         st.stop()
 
+# ----------------------------
+# Ingestion jobs
+# ----------------------------
+def wait_for_ingest_job(job_id, placeholder=None, timeout=1800):
+    """
+    Polls the backend until the ingestion job finishes.
+    Renders per-file progress into `placeholder` if given.
+    """
+    start = time.time()
+    while time.time() - start < timeout:
+        r = requests.get(f"{API_BASE}/ingest/jobs/{job_id}", timeout=10)
+        r.raise_for_status()
+        job = r.json()
+
+        if placeholder is not None:
+            lines = []
+            for f in job.get("files", []):
+                lines.append(
+                    f"📄 **{f['filename']}** — {f['status']} "
+                    f"({f.get('pages_extracted', 0)} pages, "
+                    f"{f.get('chunks_embedded', 0)}/{f.get('chunks_extracted', 0)} chunks embedded)"
+                )
+            placeholder.markdown("\n\n".join(lines))
+
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(1)
+
+    raise TimeoutError("Ingestion is still running. Check back later.")
+
+
+# ----------------------------
+# Streamed chat answers
+# ----------------------------
+def stream_chat_answers(query, session_id):
+    """
+    Yields answer dicts from the /chat/stream server-sent events
+    as the backend emits them.
+    """
+    with requests.post(
+        CHAT_STREAM_URL,
+        json={"query": query, "session_id": session_id},
+        stream=True,
+        timeout=120
+    ) as resp:
+        resp.raise_for_status()
+
+        event = None
+        for line in resp.iter_lines(decode_unicode=True):
+            if not line:
+                event = None
+            elif line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:") and event == "answer":
+                yield json.loads(line[len("data:"):])
+
+
 # ----------------------------
 # Session state
 # ----------------------------
@@ -100,34 +160,37 @@ def render_upload_page():
         if st.button("Ingest documents"):
             st.session_state.ingesting = True
 
-            with st.spinner("Ingesting documents…"):
-                try:
-                    files = [
-                        ("files", (f.name, f.getvalue(), f.type))
-                        for f in uploaded_files
-                    ]
-
-                    resp = requests.post(
-                        f"{API_BASE}/ingest",
-                        files=files,
-                        data={"session_id": st.session_state.session_id},
-                        timeout=300
-                    )
+            try:
+                files = [
+                    ("files", (f.name, f.getvalue(), f.type))
+                    for f in uploaded_files
+                ]
 
-                    if resp.status_code != 200:
-                        st.error("Document ingestion failed.")
-                    else:
-                        result = resp.json()
-                        st.success("Ingestion completed!")
+                resp = requests.post(
+                    f"{API_BASE}/ingest",
+                    files=files,
+                    data={"session_id": st.session_state.session_id},
+                    timeout=300
+                )
+
+                if resp.status_code != 200:
+                    st.error("Document ingestion failed.")
+                else:
+                    progress = st.empty()
+                    job = wait_for_ingest_job(resp.json()["job_id"], progress)
 
-                        for f in result.get("files", []):
-                            st.write(f"📄 **{f['filename']}** — {f['status']}")
+                    if job["status"] == "completed":
+                        st.success("Ingestion completed!")
+                    elif job["status"] == "partial":
+                        st.warning(f"Some files were not ingested: {job.get('error')}")
+                    else:
+                        st.error(f"Ingestion failed: {job.get('error')}")
 
-                        # Reset chat after ingestion
-                        st.session_state.messages = []
+                    # Reset chat after ingestion
+                    st.session_state.messages = []
 
-                except Exception as e:
-                    st.error(f"Ingestion error: {e}")
+            except Exception as e:
+                st.error(f"Ingestion error: {e}")
 
             st.session_state.ingesting = False
 
@@ -154,44 +217,36 @@ def render_chat_page():
             st.write(user_query)
 
         with st.chat_message("assistant"):
-            with st.spinner("Thinking…"):
-                try:
-                    resp = requests.post(
-                        CHAT_URL,
-                        json={
-                            "query": user_query,
-                            "session_id": st.session_state.session_id
-                        },
-                        timeout=120
-                    )
-                except Exception:
-                    st.error("Backend unavailable.")
-                    return
-
-            if resp.status_code != 200:
+            full_text = []
+            try:
+                answers = stream_chat_answers(user_query, st.session_state.session_id)
+                with st.spinner("Thinking…"):
+                    # Spinner only until the first sentence arrives
+                    first = next(answers, None)
+
+                if first is not None:
+                    for a in itertools.chain([first], answers):
+                        text = a["text"]
+                        doc = a.get("document")
+                        page = a.get("page")
+                        link = a.get("link")
+
+                        st.write(text)
+                        full_text.append(text)
+
+                        if doc and link:
+                            st.markdown(f" [{doc} · page {page}]({link})")
+            except requests.HTTPError:
                 st.error("Backend error.")
                 return
+            except Exception:
+                st.error("Backend unavailable.")
+                return
 
-            data = resp.json()
-            answers = data.get("answer", [])
-
-            if not answers:
+            if not full_text:
                 reply = "I don't know. The information is not available in the uploaded documents."
                 st.write(reply)
             else:
-                full_text = []
-                for a in answers:
-                    text = a["text"]
-                    doc = a.get("document")
-                    page = a.get("page")
-                    link = a.get("link")
-
-                    st.write(text)
-                    full_text.append(text)
-
-                    if doc and link:
-                        st.markdown(f" [{doc} · page {page}]({link})")
-
                 reply = " ".join(full_text)
 
         st.session_state.messages.append({
@@ -243,8 +298,16 @@ def render_report_page():
                     timeout=300
                 )
 
+                job = None
+                if resp.status_code == 200:
+                    job = wait_for_ingest_job(resp.json()["job_id"])
+
     
-            if resp.status_code != 200:
+            if (
+                job is None
+                or job["status"] != "completed"
+                or job["files"][0]["status"] != "ingested"
+            ):
                 st.error("Failed to ingest document")
                 st.stop()
     
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from app.rag import hash_index, ingest, jobs, pipeline, store
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    """
+    Points the segmented store and the hash index at a temp
+    directory. Commits do not start background merges; tests
+    call merge_segments() / compact() themselves.
+    """
+    monkeypatch.setattr(store, "SEGMENTS_DIR", tmp_path / "segments")
+    monkeypatch.setattr(store, "MANIFEST_PATH", tmp_path / "manifest.log")
+    monkeypatch.setattr(store, "INDEX_PATH", tmp_path / "index.faiss")
+    monkeypatch.setattr(store, "DOCS_PATH", tmp_path / "docs.pkl")
+    monkeypatch.setattr(store, "SEGMENT_MERGE_THRESHOLD", 1000)
+    monkeypatch.setattr(store, "schedule_merge", lambda: None)
+    monkeypatch.setattr(store, "_manifest_repaired", False)
+    monkeypatch.setattr(store, "_manifest_cache", None)
+    monkeypatch.setattr(hash_index, "HASH_INDEX_PATH", tmp_path / "hashes.sqlite")
+    yield tmp_path
+    wait_for_merges()
+
+
+def wait_for_merges():
+    thread = store._merge_thread
+    if thread is not None:
+        thread.join(timeout=30)
+
+
+def fake_vectors(chunks: list[dict], dim: int = 8, **kwargs) -> np.ndarray:
+    """
+    Deterministic vectors derived from the chunk text.
+    """
+    return np.stack([
+        np.random.default_rng(abs(hash(c["text"])) % (2 ** 32)).random(dim, dtype="float32")
+        for c in chunks
+    ])
+
+
+def make_chunks(source: str, n: int, start: int = 0) -> list[dict]:
+    return [
+        {
+            "text": f"{source} chunk {i}",
+            "source": source,
+            "page": i // 10 + 1,
+            "chunk_hash": f"{source}-{i}",
+        }
+        for i in range(start, start + n)
+    ]
+
+
+@pytest.fixture
+def fake_embed(monkeypatch):
+    monkeypatch.setattr(pipeline, "embed_chunks", fake_vectors)
+    monkeypatch.setattr(ingest, "embed_chunks", fake_vectors)
+    monkeypatch.setattr(pipeline, "EMBED_BATCH_SIZE", 10)
+    return fake_vectors
+
+
+@pytest.fixture
+def jobs_db(store_dir, monkeypatch):
+    monkeypatch.setattr(jobs, "INGEST_JOBS_PATH", store_dir / "ingest_jobs.sqlite")
+    monkeypatch.setattr(jobs, "_jobs", {})
+    return store_dir / "ingest_jobs.sqlite"
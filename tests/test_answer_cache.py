@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from app.rag import answer_cache, store
+from tests.conftest import fake_vectors, make_chunks
+
+ANSWER = {"answer": [{"sentence": "Take 5 mg.", "chunk_ids": ["c1"]}]}
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(answer_cache, "_generation", None)
+    answer_cache.clear()
+
+
+def test_exact_hit_ignores_case_and_spacing():
+    answer_cache.put_answer("What dose?", ["c1"], 3, ANSWER)
+
+    assert answer_cache.get_answer("  what   DOSE? ", ["c1"], 3) == ANSWER
+    assert answer_cache.get_answer("what dose?", ["c2"], 3) is None
+
+
+def test_stale_generation_does_not_clear_the_cache():
+    answer_cache.put_answer("q", ["c1"], 5, ANSWER)
+
+    # A request still running on an older snapshot
+    assert answer_cache.get_answer("q", ["c1"], 4) is None
+    answer_cache.put_answer("q", ["c1"], 4, {"answer": []})
+
+    assert answer_cache.get_answer("q", ["c1"], 5) == ANSWER
+
+
+def test_newer_generation_drops_older_entries():
+    answer_cache.put_answer("q", ["c1"], 5, ANSWER)
+
+    assert answer_cache.get_answer("q", ["c1"], 6) is None
+    assert answer_cache.get_answer("q", ["c1"], 5) is None
+    assert answer_cache.stats()["size"] == 0
+
+
+def test_no_embedding_needed_for_exact_matching(monkeypatch):
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_SIMILARITY", 0)
+    assert not answer_cache.uses_embeddings()
+
+
+def test_near_duplicate_question_reuses_answer(monkeypatch):
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_SIMILARITY", 0.95)
+    emb = np.array([1.0, 0.0], dtype="float32")
+    close = np.array([0.99, 0.141], dtype="float32")
+    far = np.array([0.0, 1.0], dtype="float32")
+
+    answer_cache.put_answer("what dose", ["c1"], 1, ANSWER, emb)
+
+    assert answer_cache.uses_embeddings()
+    assert answer_cache.get_answer("which dose", ["c1"], 1, close) == ANSWER
+    assert answer_cache.get_answer("side effects", ["c1"], 1, far) is None
+
+
+def test_merges_keep_the_content_generation(store_dir, monkeypatch):
+    for i in range(3):
+        chunks = make_chunks(f"d{i}.txt", 5)
+        store.commit_segment(fake_vectors(chunks), chunks)
+    before = store.load_manifest()
+
+    monkeypatch.setattr(store, "SEGMENT_MERGE_THRESHOLD", 3)
+    assert store.merge_segments()
+
+    after = store.load_manifest()
+    assert after["generation"] > before["generation"]
+    assert after["content_generation"] == before["content_generation"]
+
+    store.delete_source("d0.txt")
+    assert store.load_manifest()["content_generation"] == before["content_generation"] + 1
@@ -0,0 +1,60 @@
+import pytest
+
+from app.rag import store
+from app.rag.bm25 import Postings, tokenize
+from tests.conftest import fake_vectors
+
+
+def _commit(docs: list[tuple[str, str]]):
+    chunks = [
+        {"text": text, "source": source, "chunk_hash": f"{source}-{i}"}
+        for i, (source, text) in enumerate(docs)
+    ]
+    store.commit_segment(fake_vectors(chunks), chunks)
+
+
+def _scores(query: str) -> dict:
+    hits = store.open_store().keyword_hits(query, 10)
+    return {seg.docs[pos]["text"]: score for score, seg, pos in hits}
+
+
+def test_tokenizer_keeps_codes_and_dosages():
+    assert tokenize("Take 5mg of E11.9 per NCT01234567, 10/325 tabs") == [
+        "take", "5mg", "e11.9", "per", "nct01234567", "10/325", "tabs"
+    ]
+
+
+def test_postings_df_skips_deleted_positions():
+    post = Postings.build(["aspirin dose", "aspirin", "ibuprofen"])
+
+    assert post.df("aspirin") == 2
+    assert post.df("aspirin", deleted=[1]) == 1
+    assert post.df("unknown") == 0
+
+
+def test_tombstones_do_not_change_scores(store_dir):
+    # Old and new chunks share segments, so deleting the old
+    # document leaves partly tombstoned segments
+    _commit([
+        ("old.txt", "aspirin aspirin aspirin long filler text about many other things entirely"),
+        ("new.txt", "aspirin dosage in children"),
+        ("old.txt", "aspirin dosage for adults and more filler words here"),
+    ])
+    _commit([
+        ("new.txt", "ibuprofen dosage in children"),
+        ("old.txt", "aspirin interactions"),
+        ("new.txt", "paracetamol overdose symptoms"),
+    ])
+
+    store.delete_source("old.txt")
+    tombstoned = _scores("aspirin dosage")
+    assert set(tombstoned) == {"aspirin dosage in children", "ibuprofen dosage in children"}
+
+    # After compaction the deleted rows are gone physically;
+    # live-only statistics give the same scores as before
+    assert store.compact() == 2
+    compacted = _scores("aspirin dosage")
+
+    assert tombstoned.keys() == compacted.keys()
+    for text, score in compacted.items():
+        assert tombstoned[text] == pytest.approx(score)
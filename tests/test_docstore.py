@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from app.rag.docstore import ColumnarDocs, doc_matches, match_filters, write_columns
+
+DOCS = [
+    {"text": "Dosage: 5mg daily", "source": "a.pdf", "page": 1, "section": "2 Dosage",
+     "section_level": 1, "chunk_hash": "h0"},
+    {"text": "Renal impairment — réduire", "source": "a.pdf", "page": 3, "section": "2.1 Renal",
+     "section_level": 2, "chunk_hash": "h1"},
+    {"text": "", "source": "b.pdf", "page": None, "section": None, "chunk_hash": "h2"},
+    {"text": "no section key", "source": "b.pdf", "page": 7, "location": "Sheet1!A2",
+     "tags": ["x", 1]},
+]
+
+SHEET_DOCS = [
+    {"text": "col: 1", "source": "c.xlsx", "page": "Sheet1"},
+    {"text": "col: 2", "source": "c.xlsx", "page": 2},
+]
+
+
+@pytest.fixture
+def columnar(tmp_path):
+    def write(docs):
+        write_columns(tmp_path, docs)
+        return ColumnarDocs(tmp_path)
+    return write
+
+
+def test_round_trip_keeps_values_none_and_missing_keys(columnar):
+    docs = columnar(DOCS)
+
+    assert len(docs) == 4
+    assert list(docs) == DOCS
+    assert docs[-1] == DOCS[-1]
+    assert "section" not in docs[3]
+    with pytest.raises(IndexError):
+        docs[4]
+
+
+def test_mixed_type_field_is_stored_with_the_row(columnar):
+    docs = columnar(SHEET_DOCS)
+
+    assert "page" not in docs.ints
+    assert list(docs) == SHEET_DOCS
+
+
+@pytest.mark.parametrize("filters, expected", [
+    ({"sources": ["b.pdf"]}, [2, 3]),
+    ({"section_prefix": "2.1"}, [1]),
+    ({"page_range": (2, None)}, [1, 3]),
+    ({"page_range": (None, 3), "sources": ["a.pdf"]}, [0, 1]),
+    ({"location_prefix": "Sheet1"}, [3]),
+    ({"sources": ["missing.pdf"]}, []),
+])
+def test_filters_match_row_by_row_semantics(columnar, filters, expected):
+    docs = columnar(DOCS)
+
+    mask = match_filters(docs, filters)
+
+    assert np.flatnonzero(mask).tolist() == expected
+    assert mask.tolist() == [doc_matches(d, filters) for d in DOCS]
+    assert match_filters(DOCS, filters).tolist() == mask.tolist()
+
+
+def test_filters_on_non_columnar_field(columnar):
+    docs = columnar(SHEET_DOCS)
+
+    mask = match_filters(docs, {"page_range": (1, 5)})
+
+    assert mask.tolist() == [False, True]
+
+
+def test_empty_filters_match_everything(columnar):
+    docs = columnar(DOCS)
+
+    assert match_filters(docs, None) is None
+    assert match_filters(docs, {"sources": [], "section_prefix": ""}) is None
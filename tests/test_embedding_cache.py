@@ -0,0 +1,56 @@
+import numpy as np
+
+from app.rag import ingest
+from app.rag.embedding_cache import EmbeddingCache
+from tests.conftest import fake_vectors
+
+
+class CountingModel:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        return fake_vectors([{"text": t} for t in texts])
+
+
+def _setup(tmp_path, monkeypatch, dtype="float32"):
+    cache = EmbeddingCache(tmp_path, "test-model", dtype)
+    model = CountingModel()
+    monkeypatch.setattr(ingest, "get_embedding_cache", lambda: cache)
+    monkeypatch.setattr(ingest, "get_embedding_service", lambda: model)
+    return cache, model
+
+
+def test_cache_is_keyed_by_text_not_chunk_hash(tmp_path, monkeypatch):
+    cache, model = _setup(tmp_path, monkeypatch)
+    first = [{"text": "same words", "chunk_hash": "a.txt|1|same words"}]
+    renamed = [{"text": "same words", "chunk_hash": "b.txt|3|same words"}]
+
+    v1 = ingest.embed_chunks(first)
+    v2 = ingest.embed_chunks(renamed)
+
+    assert model.encoded == ["same words"]
+    assert cache.hits == 1
+    np.testing.assert_array_equal(v1, v2)
+
+
+def test_hits_and_misses_are_merged_in_order(tmp_path, monkeypatch):
+    cache, model = _setup(tmp_path, monkeypatch)
+    ingest.embed_chunks([{"text": "b"}])
+
+    out = ingest.embed_chunks([{"text": "a"}, {"text": "b"}, {"text": "c"}])
+
+    assert model.encoded == ["b", "a", "c"]
+    np.testing.assert_array_equal(out, fake_vectors([{"text": t} for t in "abc"]))
+
+
+def test_dtypes_use_separate_directories(tmp_path):
+    vec = fake_vectors([{"text": "x"}])
+    EmbeddingCache(tmp_path, "m", "float16").put(["h"], vec)
+
+    full = EmbeddingCache(tmp_path, "m", "float32")
+    assert full.lookup(["h"])[0] is None
+
+    full.put(["h"], vec)
+    np.testing.assert_array_equal(full.lookup(["h"])[0], vec)
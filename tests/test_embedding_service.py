@@ -0,0 +1,99 @@
+import threading
+
+import numpy as np
+import pytest
+
+from app.rag.embedding_service import EmbeddingService
+
+
+class FakeBackend:
+    """
+    One-dimensional "embedding": the number after the text's prefix.
+    The first encode() blocks until `release` is set.
+    """
+
+    name = "fake"
+    model_name = "fake-model"
+
+    def __init__(self, fail_on=None):
+        self.batches = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.fail_on = fail_on
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, normalize_embeddings=True):
+        self.batches.append(list(texts))
+        self.started.set()
+        self.release.wait(5)
+        if self.fail_on in texts:
+            raise RuntimeError("encode failed")
+        return np.array([[float(t[1:])] for t in texts], dtype="float32").reshape(-1, 1)
+
+
+def _encode_in_thread(service, texts, results, key, **kwargs):
+    def run():
+        try:
+            results[key] = service.encode(texts, **kwargs)
+        except Exception as e:
+            results[key] = e
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def _wait_queued(service, n=1):
+    for _ in range(500):
+        if service._queue.qsize() >= n:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError("request was not queued")
+
+
+def test_large_request_is_sliced_and_a_query_is_served_between_slices():
+    backend = FakeBackend()
+    service = EmbeddingService(backend, window_ms=0, max_batch=4)
+    big = [f"b{i}" for i in range(10)]
+    results = {}
+
+    threads = [_encode_in_thread(service, big, results, "big")]
+    assert backend.started.wait(5)
+    threads.append(_encode_in_thread(service, ["q99"], results, "query"))
+    _wait_queued(service)
+    backend.release.set()
+    for t in threads:
+        t.join(5)
+
+    assert backend.batches == [big[:4], ["q99", *big[4:7]], big[7:]]
+    assert results["big"].ravel().tolist() == list(range(10))
+    assert results["query"].ravel().tolist() == [99]
+    assert service.stats()["in_progress"] == 0
+
+
+def test_requests_with_different_normalization_are_not_mixed():
+    backend = FakeBackend()
+    service = EmbeddingService(backend, window_ms=0, max_batch=8)
+    results = {}
+
+    threads = [_encode_in_thread(service, ["a0"], results, "first")]
+    assert backend.started.wait(5)
+    threads.append(_encode_in_thread(service, ["n1"], results, "norm"))
+    threads.append(_encode_in_thread(service, ["r2"], results, "raw", normalize_embeddings=False))
+    _wait_queued(service, 2)
+    backend.release.set()
+    for t in threads:
+        t.join(5)
+
+    assert sorted(backend.batches) == [["a0"], ["n1"], ["r2"]]
+    assert results["raw"].ravel().tolist() == [2]
+
+
+def test_encode_error_reaches_every_caller_in_the_batch():
+    backend = FakeBackend(fail_on="x1")
+    backend.release.set()
+    service = EmbeddingService(backend, window_ms=0, max_batch=4)
+
+    with pytest.raises(RuntimeError):
+        service.encode(["x0", "x1"])
+
+    # The worker keeps serving later requests
+    assert service.encode(["y5"]).ravel().tolist() == [5]
@@ -0,0 +1,74 @@
+import pytest
+
+from app.rag import hash_index, store
+from tests.conftest import fake_vectors, make_chunks
+
+
+def _commit(source: str, n: int = 5, **kwargs):
+    chunks = make_chunks(source, n)
+    store.commit_segment(fake_vectors(chunks), chunks, **kwargs)
+    return chunks
+
+
+class Crash(Exception):
+    pass
+
+
+def _crash(*args, **kwargs):
+    raise Crash()
+
+
+def test_dedup_within_source_by_default(store_dir):
+    chunks = _commit("a.txt", 3)
+    moved = [{**c, "source": "b.txt"} for c in chunks]
+
+    assert hash_index.find_known(chunks) == [True] * 3
+    assert hash_index.find_known(moved) == [False] * 3
+    assert hash_index.find_known(moved, across_sources=True) == [True] * 3
+
+
+def test_sync_records_chunks_committed_before_a_crash(store_dir, monkeypatch):
+    record_chunks = hash_index.record_chunks
+    monkeypatch.setattr(hash_index, "record_chunks", _crash)
+    with pytest.raises(Crash):
+        _commit("a.txt")
+    monkeypatch.setattr(hash_index, "record_chunks", record_chunks)
+
+    store.sync_hash_index()
+
+    assert hash_index.find_known(make_chunks("a.txt", 5)) == [True] * 5
+    assert hash_index.synced_next_id() == 5
+
+
+def test_sync_replays_deletes_missed_by_a_crash(store_dir, monkeypatch):
+    chunks = _commit("a.txt")
+    forget = hash_index.forget
+    monkeypatch.setattr(hash_index, "forget", _crash)
+    with pytest.raises(Crash):
+        store.delete_source("a.txt")
+    monkeypatch.setattr(hash_index, "forget", forget)
+
+    # Tombstoned in the manifest, still known to the stale index
+    assert hash_index.find_known(chunks) == [True] * 5
+    store.sync_hash_index()
+    assert hash_index.find_known(chunks) == [False] * 5
+
+    # Re-ingesting the document without replace brings it back
+    _commit("a.txt")
+    assert store.open_store().ntotal == 5
+
+
+def test_sync_forgets_deletes_purged_by_compaction(store_dir, monkeypatch):
+    chunks = _commit("a.txt")
+    _commit("b.txt")
+    forget = hash_index.forget
+    monkeypatch.setattr(hash_index, "forget", _crash)
+    with pytest.raises(Crash):
+        store.delete_source("a.txt")
+    monkeypatch.setattr(hash_index, "forget", forget)
+    store.compact()
+
+    assert store.load_manifest()["deleted"] == frozenset()
+    store.sync_hash_index()
+    assert hash_index.find_known(chunks) == [False] * 5
+    assert hash_index.ids_for_sources(["b.txt"]) == [5, 6, 7, 8, 9]
@@ -0,0 +1,82 @@
+import json
+from contextlib import closing
+
+import pytest
+
+from app.rag import jobs
+
+
+def _upload(tmp_path, name: str, text: str = "Some clinical notes about dosage.\n") -> dict:
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return {"filename": name, "path": path}
+
+
+@pytest.mark.parametrize("batch", [True, False])
+def test_all_files_ingested_completes(jobs_db, fake_embed, tmp_path, batch):
+    job_id = jobs.create_job("s", [_upload(tmp_path, "a.txt"), _upload(tmp_path, "b.txt", "Other text.\n")], batch=batch)
+
+    job = jobs.run_job(job_id)
+
+    assert job["status"] == "completed"
+    assert job["error"] is None
+    assert [f["status"] for f in job["files"]] == ["ingested", "ingested"]
+
+
+def test_some_files_failing_is_partial(jobs_db, fake_embed, tmp_path):
+    job_id = jobs.create_job("s", [_upload(tmp_path, "a.txt"), _upload(tmp_path, "b.csv")])
+
+    job = jobs.run_job(job_id)
+
+    assert job["status"] == "partial"
+    assert "b.csv" in job["error"]
+
+
+def test_no_file_ingested_fails(jobs_db, fake_embed, tmp_path):
+    job_id = jobs.create_job("s", [_upload(tmp_path, "a.csv"), _upload(tmp_path, "b.csv")], batch=False)
+
+    job = jobs.run_job(job_id)
+
+    assert job["status"] == "failed"
+    assert [f["status"] for f in job["files"]] == ["skipped", "skipped"]
+
+
+def test_finished_jobs_leave_memory(jobs_db, fake_embed, tmp_path):
+    job_id = jobs.create_job("s", [_upload(tmp_path, "a.txt")])
+    assert job_id in jobs._jobs
+
+    jobs.run_job(job_id)
+
+    assert job_id not in jobs._jobs
+    assert jobs.get_job(job_id)["status"] == "completed"
+
+
+def test_job_only_in_sqlite_runs(jobs_db, fake_embed, tmp_path):
+    job_id = jobs.create_job("s", [_upload(tmp_path, "a.txt")])
+    jobs._jobs.clear()
+
+    assert jobs.run_job(job_id)["status"] == "completed"
+
+
+def test_resume_requeues_unfinished_files(jobs_db, fake_embed, tmp_path, monkeypatch):
+    job_id = jobs.create_job("s", [_upload(tmp_path, "a.txt"), _upload(tmp_path, "b.txt", "More.\n")])
+    jobs._update_file(job_id, 0, status="ingested", committed=True)
+    jobs._update_file(job_id, 1, status="embedding", chunks_embedded=3)
+    jobs._update(job_id, status="running")
+    jobs._jobs.clear()  # process restart
+
+    submitted = []
+    monkeypatch.setattr(jobs, "submit_job", submitted.append)
+
+    assert jobs.resume_jobs() == 1
+    assert submitted == [job_id]
+
+    with closing(jobs._connect()) as conn:
+        (data,) = conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    files = json.loads(data)["files"]
+    assert files[0]["status"] == "ingested"
+    assert files[1]["status"] == "queued" and files[1]["chunks_embedded"] == 0
+
+    job = jobs.run_job(job_id)
+    assert job["status"] == "completed"
+    assert job["files"][1]["status"] == "ingested"
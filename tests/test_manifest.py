@@ -0,0 +1,146 @@
+import json
+import pickle
+
+import faiss
+import numpy as np
+
+from app.rag import store
+from tests.conftest import fake_vectors, make_chunks
+
+
+def _commit(source: str, n: int = 5, **kwargs):
+    chunks = make_chunks(source, n)
+    return store.commit_segment(fake_vectors(chunks), chunks, **kwargs)
+
+
+def _full_replay() -> dict:
+    return store._replay(store._read_records())
+
+
+def _lines() -> list[str]:
+    return store.MANIFEST_PATH.read_text(encoding="utf-8").splitlines()
+
+
+def test_incremental_load_matches_full_replay(store_dir):
+    for i in range(4):
+        _commit(f"d{i}.txt")
+        assert store.load_manifest() == _full_replay()
+
+    store.delete_source("d1.txt")
+    _commit("d2.txt", replace_sources=["d2.txt"])
+    assert store.load_manifest() == _full_replay()
+
+
+def test_views_are_not_changed_by_later_records(store_dir):
+    _commit("a.txt")
+    before = store.load_manifest()
+
+    store.delete_source("a.txt")
+
+    assert before["deleted"] == frozenset()
+    assert len(store.load_manifest()["deleted"]) == 5
+
+
+def test_checkpoint_rewrites_log_and_keeps_state(store_dir, monkeypatch):
+    monkeypatch.setattr(store, "MANIFEST_CHECKPOINT_RECORDS", 1000)
+    for i in range(6):
+        _commit(f"d{i}.txt")
+    store.delete_source("d0.txt")
+    before = store.load_manifest()
+
+    store.checkpoint_manifest()
+
+    assert len(_lines()) == 1
+    after = store.load_manifest()
+    assert after["log_records"] == 0
+    for key in ("generation", "content_generation", "next_id", "segments", "deleted"):
+        assert after[key] == before[key]
+    # A fresh process replays the checkpoint the same way
+    monkeypatch.setattr(store, "_manifest_cache", None)
+    assert store.load_manifest() == after
+
+
+def test_checkpoint_drops_purged_tombstones(store_dir, monkeypatch):
+    _commit("a.txt")
+    _commit("b.txt")
+    store.delete_source("a.txt")
+    store.compact()
+
+    store.checkpoint_manifest()
+
+    record = json.loads(_lines()[0])
+    assert record["op"] == "checkpoint"
+    assert record["deleted"] == []
+    assert store.open_store().ntotal == 5
+
+
+def test_log_is_checkpointed_every_n_records(store_dir, monkeypatch):
+    monkeypatch.setattr(store, "MANIFEST_CHECKPOINT_RECORDS", 4)
+    for i in range(10):
+        _commit(f"d{i}.txt")
+
+    assert len(_lines()) < 4
+    manifest = store.load_manifest()
+    assert manifest["generation"] == 10
+    assert len(manifest["segments"]) == 10
+    assert store.open_store().ntotal == 50
+
+
+def test_snapshot_notices_checkpoint_and_later_commits(store_dir):
+    _commit("a.txt")
+    snapshot = store.open_store()
+    assert snapshot.is_current()
+
+    store.checkpoint_manifest()
+    _commit("b.txt")
+
+    assert not snapshot.is_current()
+    assert store.open_store(previous=snapshot).ntotal == 10
+
+
+def test_legacy_single_file_store_is_imported(store_dir):
+    vectors = np.random.default_rng(0).random((4, 8), dtype="float32")
+    index = faiss.IndexFlatL2(8)
+    index.add(vectors)
+    faiss.write_index(index, str(store.INDEX_PATH))
+    with open(store.DOCS_PATH, "wb") as f:
+        pickle.dump([{"text": f"legacy {i}", "source": "old.pdf"} for i in range(4)], f)
+
+    manifest = store.load_manifest()
+
+    assert manifest["next_id"] == 4
+    assert [s["index"] for s in manifest["segments"]] == ["flat"]
+    hits = store.open_store().search(vectors[:1], 1)
+    assert hits[0]["text"] == "legacy 0"
+
+
+def test_torn_tail_is_ignored_and_cut_before_the_next_append(store_dir):
+    _commit("a.txt")
+    with open(store.MANIFEST_PATH, "a", encoding="utf-8") as f:
+        f.write('{"op": "delete", "sources": ["a.txt"], "deleted": [0, 1')
+
+    # Readers skip the partial line
+    assert store.load_manifest()["deleted"] == frozenset()
+
+    # A restarted writer cuts it before appending
+    store._manifest_repaired = False
+    _commit("b.txt")
+
+    assert [json.loads(line)["op"] for line in _lines()] == ["add", "add"]
+    manifest = store.load_manifest()
+    assert manifest == _full_replay()
+    assert manifest["deleted"] == frozenset()
+    assert len(manifest["segments"]) == 2
+
+
+def test_complete_unterminated_tail_is_kept(store_dir):
+    _commit("a.txt")
+    record = {"op": "delete", "sources": ["a.txt"], "deleted": [0, 1]}
+    with open(store.MANIFEST_PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record))
+
+    store._manifest_repaired = False
+    _commit("b.txt")
+
+    assert [json.loads(line)["op"] for line in _lines()] == ["add", "delete", "add"]
+    assert store.load_manifest()["deleted"] == frozenset({0, 1})
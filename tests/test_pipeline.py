@@ -0,0 +1,63 @@
+import pytest
+
+from app.rag import hash_index, pipeline, store
+from tests.conftest import make_chunks
+
+
+def _pages(source: str, n_pages: int, per_page: int, fail_at: int | None = None):
+    for p in range(n_pages):
+        if p == fail_at:
+            raise RuntimeError("extraction failed")
+        yield {"source": source, "chunks": make_chunks(source, per_page, start=p * per_page)}
+
+
+def _chunker(page: dict):
+    return page["chunks"]
+
+
+def _live_ids(source: str) -> list[int]:
+    deleted = store.load_manifest()["deleted"]
+    return [cid for cid in hash_index.ids_for_sources([source]) if cid not in deleted]
+
+
+def test_stream_commits_a_segment_per_batch(store_dir, fake_embed):
+    n = pipeline.ingest_stream(_pages("a.pdf", 5, 10), _chunker, segment_chunks=20)
+
+    assert n == 50
+    assert len(store.load_manifest()["segments"]) == 3
+    assert store.open_store().ntotal == 50
+
+
+def test_replace_swaps_versions_on_last_commit(store_dir, fake_embed):
+    pipeline.ingest_stream(_pages("a.pdf", 3, 10), _chunker)
+    old_ids = _live_ids("a.pdf")
+
+    pipeline.ingest_stream(
+        _pages("a.pdf", 4, 10), _chunker, segment_chunks=10, replace_sources=["a.pdf"]
+    )
+
+    live = _live_ids("a.pdf")
+    assert len(live) == 40
+    assert not set(old_ids) & set(live)
+    assert store.open_store().ntotal == 40
+
+
+def test_failed_replace_rolls_back_committed_segments(store_dir, fake_embed):
+    pipeline.ingest_stream(_pages("a.pdf", 3, 10), _chunker)
+    old_ids = _live_ids("a.pdf")
+    committed = []
+
+    with pytest.raises(RuntimeError, match="extraction failed"):
+        pipeline.ingest_stream(
+            _pages("a.pdf", 6, 10, fail_at=4),
+            _chunker,
+            segment_chunks=10,
+            replace_sources=["a.pdf"],
+            progress=committed.append,
+        )
+
+    # Intermediate segments were committed, then tombstoned again:
+    # only the complete old version is live
+    assert committed and committed[-1] > 0
+    assert _live_ids("a.pdf") == old_ids
+    assert store.open_store().ntotal == 30
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+
+from app.rag.scheduler import LLMScheduler, _Waiter
+
+
+def _submit(scheduler, priority: str, session_id: str = "s") -> _Waiter:
+    waiter = _Waiter(priority, session_id)
+    waiter.event = threading.Event()
+    scheduler._submit(waiter)
+    return waiter
+
+
+def _release_one(scheduler, priority: str, waiters: list[_Waiter]) -> list[_Waiter]:
+    before = [w.granted for w in waiters]
+    scheduler._release(priority)
+    return [w for w, was in zip(waiters, before) if w.granted and not was]
+
+
+def test_background_work_cannot_take_the_reserved_slot():
+    scheduler = LLMScheduler(max_inflight=2, chat_reserved=1)
+
+    first = _submit(scheduler, "summarize")
+    second = _submit(scheduler, "planner")
+    chat = _submit(scheduler, "chat")
+
+    assert first.granted and not second.granted
+    assert chat.granted
+    assert scheduler.inflight == {"chat": 1, "planner": 0, "summarize": 1}
+
+
+def test_waiting_chat_is_granted_before_background():
+    scheduler = LLMScheduler(max_inflight=2, chat_reserved=0)
+    _submit(scheduler, "summarize")
+    _submit(scheduler, "summarize")
+
+    summarize = _submit(scheduler, "summarize")
+    planner = _submit(scheduler, "planner")
+    chat = _submit(scheduler, "chat")
+    waiting = [summarize, planner, chat]
+
+    assert _release_one(scheduler, "summarize", waiting) == [chat]
+    assert _release_one(scheduler, "summarize", waiting) == [planner]
+    assert _release_one(scheduler, "chat", waiting) == [summarize]
+
+
+def test_sessions_take_turns_within_a_class():
+    scheduler = LLMScheduler(max_inflight=1, chat_reserved=0)
+    _submit(scheduler, "summarize", "busy")
+
+    waiting = [_submit(scheduler, "summarize", "busy") for _ in range(3)]
+    waiting.append(_submit(scheduler, "summarize", "other"))
+
+    order = []
+    for _ in waiting:
+        order += [w.session_id for w in _release_one(scheduler, "summarize", waiting)]
+
+    assert order == ["busy", "other", "busy", "busy"]
+    assert scheduler.stats()["served"]["summarize"] == 5
+
+
+def test_thread_and_async_callers_share_the_limit():
+    scheduler = LLMScheduler(max_inflight=2, chat_reserved=1)
+    lock = threading.Lock()
+    running, peak = {"chat": 0, "background": 0}, {"chat": 0, "background": 0}
+
+    def track(kind: str, delta: int):
+        with lock:
+            running[kind] += delta
+            peak[kind] = max(peak[kind], running[kind])
+
+    def summarize(session_id):
+        with scheduler.slot("summarize", session_id):
+            track("background", 1)
+            threading.Event().wait(0.01)
+            track("background", -1)
+
+    async def chat():
+        async with scheduler.aslot("chat"):
+            track("chat", 1)
+            await asyncio.sleep(0.01)
+            track("chat", -1)
+
+    threads = [threading.Thread(target=summarize, args=(f"s{i % 2}",)) for i in range(6)]
+    for t in threads:
+        t.start()
+
+    async def chats():
+        await asyncio.gather(*(chat() for _ in range(4)))
+
+    asyncio.run(chats())
+    for t in threads:
+        t.join()
+
+    assert peak["background"] == 1
+    assert peak["chat"] <= 2
+    assert scheduler.inflight == {"chat": 0, "planner": 0, "summarize": 0}
+    assert scheduler.stats()["queued"] == {"chat": 0, "planner": 0, "summarize": 0}
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    scheduler = LLMScheduler(max_inflight=1, chat_reserved=0)
+    _submit(scheduler, "chat")
+    waiter = _submit(scheduler, "chat")
+
+    scheduler._cancel(waiter)
+    scheduler._release("chat")
+
+    assert not waiter.granted
+    assert scheduler.inflight["chat"] == 0
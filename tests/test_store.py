@@ -0,0 +1,107 @@
+import threading
+
+import numpy as np
+
+from app.rag import hash_index, store
+from tests.conftest import fake_vectors, make_chunks
+
+
+def _commit(source: str, n: int = 10):
+    chunks = make_chunks(source, n)
+    store.commit_segment(fake_vectors(chunks), chunks)
+
+
+def _stored_ids() -> np.ndarray:
+    manifest = store.load_manifest()
+    ids = [np.load(store._segment_dir(s["name"]) / "ids.npy") for s in manifest["segments"]]
+    return np.concatenate(ids) if ids else np.zeros(0, dtype="int64")
+
+
+def _run(*targets):
+    errors = []
+
+    def wrap(fn):
+        try:
+            fn()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=wrap, args=(fn,)) for fn in targets]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors, errors
+
+
+def test_merge_combines_a_tier_and_drops_tombstones(store_dir, monkeypatch):
+    monkeypatch.setattr(store, "SEGMENT_MERGE_THRESHOLD", 4)
+    for i in range(4):
+        _commit(f"d{i}.txt")
+    store.delete_source("d1.txt")
+
+    assert store.merge_segments()
+
+    manifest = store.load_manifest()
+    assert len(manifest["segments"]) == 1
+    assert manifest["deleted"] == frozenset()
+    assert sorted(_stored_ids()) == [*range(0, 10), *range(20, 40)]
+
+
+def test_racing_merges_do_not_duplicate_rows(store_dir, monkeypatch):
+    monkeypatch.setattr(store, "SEGMENT_MERGE_THRESHOLD", 4)
+    for i in range(8):
+        _commit(f"d{i}.txt")
+
+    # Bypass the merge lock: two merges pick the same inputs
+    _run(lambda: store._merge_once(0.2), lambda: store._merge_once(0.2))
+
+    ids = _stored_ids()
+    assert len(ids) == len(set(ids.tolist())) == 80
+    assert store.open_store().ntotal == 80
+
+
+def test_deletes_during_merges_stay_deleted(store_dir, monkeypatch):
+    monkeypatch.setattr(store, "SEGMENT_MERGE_THRESHOLD", 3)
+    for i in range(12):
+        _commit(f"d{i}.txt")
+
+    def merges():
+        while store.merge_segments():
+            pass
+
+    def deletes():
+        for i in range(0, 12, 2):
+            store.delete_source(f"d{i}.txt")
+
+    _run(merges, deletes, store.compact)
+    store.compact()
+
+    snapshot = store.open_store()
+    assert snapshot.ntotal == 60
+    sources = {d["source"] for seg in snapshot.segments for d in seg.docs}
+    live_ids = set(_stored_ids().tolist()) - store.load_manifest()["deleted"]
+    assert {f"d{i}.txt" for i in range(1, 12, 2)} <= sources
+    assert live_ids == set(hash_index.all_ids())
+
+
+def test_open_store_retries_when_a_segment_is_merged_away(store_dir, monkeypatch):
+    monkeypatch.setattr(store, "SEGMENT_MERGE_THRESHOLD", 2)
+    _commit("a.txt")
+    _commit("b.txt")
+    opened = []
+    real_segment = store.Segment
+
+    def merge_during_open(name, kind, deleted):
+        # The first open races a merge that removes its segments
+        if not opened:
+            opened.append(name)
+            store.merge_segments()
+        return real_segment(name, kind, deleted)
+
+    monkeypatch.setattr(store, "Segment", merge_during_open)
+
+    snapshot = store.open_store()
+
+    assert snapshot.ntotal == 20
+    assert len(snapshot.segments) == 1
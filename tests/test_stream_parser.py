@@ -0,0 +1,42 @@
+import json
+
+from app.rag.stream_parser import AnswerStreamParser
+
+ANSWER = {
+    "answer": [
+        {"sentence": 'Take "5mg" daily {with food}.', "chunk_ids": [1, 2]},
+        {"sentence": "Avoid in renal failure \\ see [3].", "chunk_ids": [3]},
+    ],
+    "follow_up": [{"sentence": "not part of the answer"}],
+}
+
+
+def _feed_in_pieces(parser, text: str, size: int) -> list[list[dict]]:
+    return [parser.feed(text[i:i + size]) for i in range(0, len(text), size)]
+
+
+def test_items_are_emitted_as_soon_as_they_close():
+    text = json.dumps(ANSWER)
+    first_end = text.index("[1, 2]}") + len("[1, 2]}")
+    parser = AnswerStreamParser()
+
+    assert parser.feed(text[:first_end - 1]) == []
+    assert parser.feed(text[first_end - 1:first_end]) == [ANSWER["answer"][0]]
+    assert parser.feed(text[first_end:]) == [ANSWER["answer"][1]]
+
+
+def test_piece_size_does_not_change_items():
+    text = json.dumps(ANSWER, indent=2)
+    for size in (1, 3, 7, len(text)):
+        parser = AnswerStreamParser()
+        items = [item for batch in _feed_in_pieces(parser, text, size) for item in batch]
+
+        assert items == ANSWER["answer"]
+        assert parser.result() == ANSWER
+
+
+def test_unfinished_stream_has_no_result():
+    parser = AnswerStreamParser()
+    parser.feed('{"answer": [{"sentence": "a", "chunk_ids": []}, {"sent')
+
+    assert parser.result() is None